@@ -0,0 +1,48 @@
+"""
+Бенчмарк проверки порога ребалансировки по массивам позиций (PositionBook).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_position_book --positions 1000,100000
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from utils.position_book import PositionBook
+from utils.select_chain import CHAIN_PROFILES
+from utils.unimath import get_ticks_for_range
+
+
+def run(count, repeats=200):
+    decimals0, decimals1 = CHAIN_PROFILES["Base"]["DECIMALS0"], CHAIN_PROFILES["Base"]["DECIMALS1"]
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(2000, 3000, count)
+    states = {}
+    for i, center in enumerate(centers):
+        tick_lower, tick_upper = get_ticks_for_range(center - 50, center + 50, 3000, decimals0, decimals1)
+        states[f"0x{i:040x}"] = {"position": {"tick_lower": tick_lower, "tick_upper": tick_upper},
+                                 "liquidity": 10 ** 18 if i % 10 else 0}
+    book = PositionBook(0.1, decimals0, decimals1)
+    started = time.perf_counter()
+    book.update(states)
+    update_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(repeats):
+        mask = book.needs_action(2500.0)
+    check_time = (time.perf_counter() - started) / repeats
+    return {"positions": count, "update_s": update_time, "check_us": check_time * 1e6,
+            "to_rebalance": int(mask.sum())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк проверки порога по массивам позиций.")
+    parser.add_argument("--positions", default="1000,100000", help="Количества позиций через запятую")
+    args = parser.parse_args()
+    print(json.dumps([run(int(x)) for x in args.positions.split(",") if x], indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Бенчмарк цикла ребалансировки на локальном стенде блокчейна.
+
+Запускает настоящие функции бота (approve_token, get_user_position, collect_fees,
+remove_liquidity, add_liquidity, пакетное чтение состояния и параллельный цикл)
+против StandInChain и выводит JSON с временем, числом RPC-вызовов и p50/p99 по этапам.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_rebalance --wallets 1,10,100,1000 --latency-ms 20 --output bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+from eth_account import Account
+from web3 import Web3
+
+from benchmarks.chain_standin import StandInChain, StandInProvider
+
+
+def percentile(samples, q):
+    return float(np.percentile(samples, q)) * 1000 if samples else None
+
+
+def make_wallets(count, offset):
+    """Детерминированно генерирует кошельки для прогона."""
+    wallets = []
+    for i in range(offset, offset + count):
+        private_key = Web3.keccak(text=f"bench-wallet-{i}").to_0x_hex()
+        wallets.append((Account.from_key(private_key).address, private_key))
+    return wallets
+
+
+def measure(chain, stage, wallets, fn):
+    """
+    Выполняет fn для каждого кошелька последовательно и собирает метрики этапа.
+
+    :return: Словарь с временем, числом RPC-вызовов и перцентилями задержки (мс).
+    """
+    calls_before = chain.calls.copy()
+    http_before = chain.http_requests
+    samples = []
+    errors = 0
+    start = time.perf_counter()
+    for wallet_address, private_key in wallets:
+        t0 = time.perf_counter()
+        try:
+            fn(wallet_address, private_key)
+        except Exception:
+            errors += 1
+        samples.append(time.perf_counter() - t0)
+    wall_time = time.perf_counter() - start
+    methods = dict(chain.calls - calls_before)
+    rpc_calls = sum(methods.values())
+    return {
+        "stage": stage,
+        "wall_time_s": wall_time,
+        "rpc_calls": rpc_calls,
+        "rpc_calls_per_wallet": rpc_calls / max(len(wallets), 1),
+        "rpc_methods": methods,
+        "http_requests": chain.http_requests - http_before,
+        "p50_ms": percentile(samples, 50),
+        "p99_ms": percentile(samples, 99),
+        "errors": errors,
+    }
+
+
+def measure_once(chain, stage, wallets, fn):
+    """Выполняет fn один раз для всех кошельков (пакетные операции и параллельный цикл)."""
+    calls_before = chain.calls.copy()
+    http_before = chain.http_requests
+    start = time.perf_counter()
+    errors = 0
+    try:
+        result = fn()
+        if isinstance(result, dict):
+            errors = sum(1 for value in result.values() if isinstance(value, Exception))
+    except Exception:
+        errors = len(wallets)
+    wall_time = time.perf_counter() - start
+    methods = dict(chain.calls - calls_before)
+    rpc_calls = sum(methods.values())
+    return {
+        "stage": stage,
+        "wall_time_s": wall_time,
+        "rpc_calls": rpc_calls,
+        "rpc_calls_per_wallet": rpc_calls / max(len(wallets), 1),
+        "rpc_methods": methods,
+        "http_requests": chain.http_requests - http_before,
+        "p50_ms": wall_time * 1000,
+        "p99_ms": wall_time * 1000,
+        "errors": errors,
+    }
+
+
+def run(sizes, latency):
+    # Стенд подключается через контекст сети по умолчанию до первого обращения бота к RPC
+    chain = StandInChain()
+    from utils.chain_context import ChainContext, set_default_chain
+    from utils.blockchain import get_web3, approve_token, get_user_position
+    from utils.rebalance import collect_fees, remove_liquidity, add_liquidity, calculate_new_range, \
+        build_collect_call, build_decrease_call
+    from utils.preflight import simulate
+    from utils.multicall import get_wallets_state
+    from utils.executor import run_for_wallets
+    from utils.select_chain import load_config
+
+    config = load_config()
+    set_default_chain(ChainContext(config, provider_factory=lambda url: StandInProvider(chain, latency)))
+    web3 = get_web3()
+    position_manager = config["POSITION_MANAGER_ADDRESS"]
+    token1 = config["TOKEN1"]
+    abi_path = os.getenv('POSITION_MANAGER_ABI_PATH', 'utils/position_manager_abi.json')
+    erc20_abi_path = os.getenv("ERC20_ABI_PATH", 'utils/erc20_abi.json')
+    price = chain.price_answer / 10 ** 8
+    range_lower, range_upper = int(price - 50), int(price + 50)
+
+    results = []
+    offset = 0
+    for size in sizes:
+        wallets = make_wallets(size, offset)
+        offset += size
+        addresses = [address for address, _ in wallets]
+        token_ids = {address: chain.add_position(address) for address in addresses}
+        loggers = {address: logging.getLogger(address) for address in addresses}
+
+        stages = [
+            measure(chain, "approve", wallets,
+                    lambda a, k: approve_token(a, k, position_manager, token1, erc20_abi_path)),
+            measure(chain, "get_user_position", wallets,
+                    lambda a, k: get_user_position(position_manager, abi_path, a)),
+            measure_once(chain, "batch_state", wallets,
+                         lambda: get_wallets_state(addresses, position_manager, abi_path, token1, erc20_abi_path)),
+            measure(chain, "collect_fees", wallets, lambda a, k: collect_fees(web3, a, k, token_ids[a])),
+            measure(chain, "remove_liquidity", wallets, lambda a, k: remove_liquidity(web3, a, k, token_ids[a])),
+            measure(chain, "add_liquidity", wallets,
+                    lambda a, k: add_liquidity(web3, a, k, range_lower, range_upper)),
+        ]
+
+        # Полный цикл: пакетное чтение, пакетная симуляция и параллельная ребалансировка всех кошельков
+        cycle_token_ids = {address: chain.add_position(address) for address in addresses}
+
+        def cycle():
+            states = get_wallets_state(addresses, position_manager, abi_path, token1, erc20_abi_path)
+            planned = [(build_collect_call(address, cycle_token_ids[address]),
+                        build_decrease_call(web3, address, cycle_token_ids[address], states[address]["liquidity"]))
+                       for address in addresses]
+            simulated = simulate(web3, [transaction for pair in planned for transaction in pair])
+            prepared = {address: ((planned[i][0], simulated[2 * i]), (planned[i][1], simulated[2 * i + 1]))
+                        for i, address in enumerate(addresses)}
+
+            def task(wallet_address, private_key):
+                collect, remove = prepared[wallet_address]
+                collect_fees(web3, wallet_address, private_key, cycle_token_ids[wallet_address], collect)
+                remove_liquidity(web3, wallet_address, private_key, cycle_token_ids[wallet_address],
+                                 prepared=remove)
+                new_lower, new_upper = calculate_new_range(price, 100, wallet_address)
+                add_liquidity(web3, wallet_address, private_key, new_lower, new_upper)
+
+            return run_for_wallets(task, wallets, loggers)
+
+        stages.append(measure_once(chain, "cycle", wallets, cycle))
+        results.append({"wallets": size, "latency_ms": latency * 1000, "stages": stages})
+        print(f"{size} кошельков: " + ", ".join(f"{s['stage']}={s['wall_time_s']:.3f}s/{s['rpc_calls']} rpc/"
+                                               f"{s['http_requests']} http"
+                                               for s in stages), file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк цикла ребалансировки на локальном стенде.")
+    parser.add_argument("--wallets", default="1,10,100,1000", help="Количества кошельков через запятую")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Имитируемая задержка RPC в миллисекундах")
+    parser.add_argument("--output", default=None, help="Файл для результатов в JSON (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    # Значения по умолчанию для настроек бота
+    for key, value in {"AMOUNT0": "0.0001", "RANGE_LOWER": "2450", "RANGE_HIGHER": "2550"}.items():
+        os.environ.setdefault(key, value)
+    logging.disable(logging.CRITICAL)
+
+    results = {
+        "benchmark": "rebalance_cycle",
+        "timestamp": int(time.time()),
+        "python": sys.version.split()[0],
+        "runs": run([int(x) for x in args.wallets.split(",") if x], args.latency_ms / 1000),
+    }
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Бенчмарк холодного старта: время импорта модулей бота в новом интерпретаторе.
+
+Каждый замер выполняется в отдельном процессе, в котором сетевые подключения
+запрещены: если импорт модуля обращается к RPC, замер завершается ошибкой.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_startup --runs 10 --output startup.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+MODULES = [
+    "main",
+    "utils.blockchain",
+    "utils.pricing",
+    "utils.rebalance",
+    "utils.multicall",
+    "utils.price_watcher",
+    "utils.rpc_pool",
+]
+
+# Код, выполняемый в дочернем процессе: запрет сети и замер импорта
+PROBE = """
+import socket, sys, time
+
+def _blocked(*args, **kwargs):
+    raise RuntimeError("сетевое подключение при импорте")
+
+socket.socket.connect = _blocked
+socket.socket.connect_ex = _blocked
+socket.create_connection = _blocked
+socket.getaddrinfo = _blocked
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def measure_import(module, env):
+    """
+    Импортирует модуль в новом интерпретаторе.
+
+    :param module: Имя модуля.
+    :param env: Переменные окружения дочернего процесса.
+    :return: Кортеж (время импорта в секундах, полное время запуска процесса в секундах).
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", PROBE.format(module=module)], env=env,
+                            capture_output=True, text=True)
+    wall_time = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Импорт {module} завершился ошибкой:\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1]), wall_time
+
+
+def run(modules, runs):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+
+    results = []
+    for module in modules:
+        imports, processes = [], []
+        for _ in range(runs):
+            import_time, process_time = measure_import(module, env)
+            imports.append(import_time)
+            processes.append(process_time)
+        results.append({
+            "module": module,
+            "import_p50_ms": float(np.percentile(imports, 50)) * 1000,
+            "import_max_ms": max(imports) * 1000,
+            "process_p50_ms": float(np.percentile(processes, 50)) * 1000,
+        })
+        print(f"{module}: импорт {results[-1]['import_p50_ms']:.0f} мс, "
+              f"процесс {results[-1]['process_p50_ms']:.0f} мс", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк холодного старта модулей бота.")
+    parser.add_argument("--runs", type=int, default=5, help="Количество запусков на модуль")
+    parser.add_argument("--modules", default=",".join(MODULES), help="Модули через запятую")
+    parser.add_argument("--output", default=None, help="Файл для результатов в JSON (по умолчанию stdout)")
+    args = parser.parse_args()
+
+    results = {
+        "benchmark": "startup",
+        "timestamp": int(time.time()),
+        "python": sys.version.split()[0],
+        "runs": run([m for m in args.modules.split(",") if m], args.runs),
+    }
+    output = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
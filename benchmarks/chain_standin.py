@@ -0,0 +1,399 @@
+import threading
+import time
+from collections import Counter
+import rlp
+from eth_abi import decode, encode
+from eth_account import Account
+from web3 import Web3
+from utils import contracts as registry
+from utils.position_index import TRANSFER_TOPIC, address_topic, uint_topic
+from utils.price_watcher import ANSWER_UPDATED_TOPIC
+from utils.state_store import POOL_MINT_TOPIC, ZERO_TOPIC
+
+POSITION_MANAGER_ABI_PATH = 'utils/position_manager_abi.json'
+ERC20_ABI_PATH = 'utils/erc20_abi.json'
+
+AGGREGATE3_SELECTOR = Web3.keccak(text="aggregate3((address,bool,bytes)[])")[:4]
+LATEST_ANSWER_SELECTOR = Web3.keccak(text="latestAnswer()")[:4]
+AGGREGATOR_SELECTOR = Web3.keccak(text="aggregator()")[:4]
+
+POSITION_TYPES = ['uint96', 'address', 'address', 'address', 'uint24', 'int24', 'int24', 'uint128',
+                  'uint256', 'uint256', 'uint128', 'uint128']
+ZERO_ADDRESS = "0x" + "00" * 20
+ZERO_HASH = "0x" + "00" * 32
+AGGREGATOR_ADDRESS = Web3.to_checksum_address("0x" + "ab" * 20)
+POOL_ADDRESS = Web3.to_checksum_address("0x" + "cd" * 20)
+
+
+def _hex(value):
+    return hex(value)
+
+
+def _selector(abi_path, fn_name):
+    return registry.get_selector(abi_path, fn_name)
+
+
+class StandInChain:
+    """
+    Локальный стенд блокчейна в памяти: эмулирует JSON-RPC ноды и контракты
+    NonfungiblePositionManager, ERC20 (allowance/approve), Chainlink и Multicall3.
+
+    Состояние меняется только теми транзакциями, которые отправляет бот: approve,
+    decreaseLiquidity, mint и multicall из них. Каждая транзакция включается в новый блок;
+    квитанция mint содержит события Transfer и Mint пула, как в сети.
+    Обновление цены Chainlink (update_price) тоже занимает блок и испускает AnswerUpdated,
+    который можно получить через eth_newFilter/eth_getFilterChanges и eth_getLogs.
+    """
+
+    def __init__(self, chain_id=1, price=2500.0, base_fee_gwei=10, filters=True):
+        self.chain_id = chain_id
+        self.price_answer = int(price * 10 ** 8)
+        self.base_fee = base_fee_gwei * 10 ** 9
+        self.block_number = 1
+        self.block_timestamp = int(time.time())
+        self.nonces = Counter()
+        self.allowances = {}
+        self.positions = {}
+        self.owner_tokens = {}
+        self.receipts = {}
+        self.next_token_id = 1
+        self.logs = []
+        self.filters = {} if filters else None
+        self.next_filter_id = 1
+        self.calls = Counter()
+        self.http_requests = 0
+        self._lock = threading.RLock()
+        self._handlers = {
+            _selector(POSITION_MANAGER_ABI_PATH, "balanceOf"): self._balance_of,
+            _selector(POSITION_MANAGER_ABI_PATH, "tokenOfOwnerByIndex"): self._token_of_owner_by_index,
+            _selector(POSITION_MANAGER_ABI_PATH, "positions"): self._positions,
+            _selector(ERC20_ABI_PATH, "allowance"): self._allowance,
+            AGGREGATE3_SELECTOR: self._aggregate3,
+            LATEST_ANSWER_SELECTOR: lambda data: encode(['int256'], [self.price_answer]),
+            AGGREGATOR_SELECTOR: lambda data: encode(['address'], [AGGREGATOR_ADDRESS]),
+        }
+
+    # -- состояние --
+
+    def add_position(self, owner, liquidity=10 ** 15, tick_lower=-198540, tick_upper=-197640):
+        """
+        Создаёт позицию для кошелька напрямую в состоянии стенда.
+
+        :param owner: Адрес владельца.
+        :param liquidity: Ликвидность позиции.
+        :param tick_lower: Нижний тик.
+        :param tick_upper: Верхний тик.
+        :return: ID позиции.
+        """
+        with self._lock:
+            token_id = self.next_token_id
+            self.next_token_id += 1
+            self.positions[token_id] = {"owner": owner.lower(), "tick_lower": tick_lower,
+                                        "tick_upper": tick_upper, "liquidity": liquidity}
+            self.owner_tokens.setdefault(owner.lower(), []).append(token_id)
+            return token_id
+
+    def update_price(self, price):
+        """
+        Публикует новую цену Chainlink в новом блоке с событием AnswerUpdated.
+
+        :param price: Новая цена.
+        """
+        with self._lock:
+            self.price_answer = int(price * 10 ** 8)
+            self.block_number += 1
+            self.block_timestamp += 2
+            self.logs.append({
+                "address": AGGREGATOR_ADDRESS, "blockNumber": _hex(self.block_number),
+                "blockHash": "0x" + self.block_number.to_bytes(32, "big").hex(),
+                "transactionHash": "0x" + len(self.logs).to_bytes(32, "big").hex(), "transactionIndex": "0x0",
+                "logIndex": "0x0", "removed": False, "data": "0x" + encode(['uint256'], [self.block_timestamp]).hex(),
+                "topics": [ANSWER_UPDATED_TOPIC, "0x" + encode(['int256'], [self.price_answer]).hex(),
+                           "0x" + encode(['uint256'], [len(self.logs) + 1]).hex()],
+            })
+
+    def _new_filter(self, params, filters):
+        if filters is None:
+            raise ValueError("the method eth_newFilter does not exist/is not available")
+        with self._lock:
+            filter_id = _hex(self.next_filter_id)
+            self.next_filter_id += 1
+            filters[filter_id] = {"params": params[0], "cursor": len(self.logs)}
+        return filter_id
+
+    def _filter_changes(self, params, filters):
+        with self._lock:
+            entry = (filters or {}).get(params[0])
+            if entry is None:
+                raise ValueError("filter not found")
+            logs, entry["cursor"] = self.logs[entry["cursor"]:], len(self.logs)
+        return self._match_logs(logs, entry["params"])
+
+    @staticmethod
+    def _match_logs(logs, params):
+        address = params.get("address")
+        # Адрес в фильтре может быть строкой или списком адресов
+        addresses = None if address is None else {a.lower() for a in ([address] if isinstance(address, str) else address)}
+        topics = params.get("topics") or []
+        return [log for log in logs
+                if (addresses is None or log["address"].lower() in addresses)
+                and all(topic is None or topic == log["topics"][i] for i, topic in enumerate(topics))]
+
+    def _get_logs(self, params):
+        def block(value, default):
+            return default if value in (None, "latest") else (int(value, 16) if isinstance(value, str) else value)
+
+        with self._lock:
+            from_block = block(params[0].get("fromBlock"), self.block_number)
+            to_block = block(params[0].get("toBlock"), self.block_number)
+            logs = [log for log in self.logs if from_block <= int(log["blockNumber"], 16) <= to_block]
+        return self._match_logs(logs, params[0])
+
+    # -- eth_call --
+
+    def _balance_of(self, data):
+        owner, = decode(['address'], data)
+        return encode(['uint256'], [len(self.owner_tokens.get(owner.lower(), []))])
+
+    def _token_of_owner_by_index(self, data):
+        owner, index = decode(['address', 'uint256'], data)
+        return encode(['uint256'], [self.owner_tokens[owner.lower()][index]])
+
+    def _positions(self, data):
+        token_id, = decode(['uint256'], data)
+        p = self.positions[token_id]
+        return encode(POSITION_TYPES, [0, ZERO_ADDRESS, ZERO_ADDRESS, ZERO_ADDRESS, 3000, p["tick_lower"],
+                                       p["tick_upper"], p["liquidity"], 0, 0, 0, 0])
+
+    def _allowance(self, data):
+        owner, _ = decode(['address', 'address'], data)
+        return encode(['uint256'], [self.allowances.get(owner.lower(), 0)])
+
+    def _aggregate3(self, data):
+        calls, = decode(['(address,bool,bytes)[]'], data)
+        results = []
+        for _, allow_failure, call_data in calls:
+            try:
+                results.append((True, self.call(call_data)))
+            except Exception:
+                if not allow_failure:
+                    raise
+                results.append((False, b""))
+        return encode(['(bool,bytes)[]'], [results])
+
+    def call(self, call_data):
+        """
+        Выполняет вызов view-функции по селектору.
+
+        :param call_data: Calldata в виде bytes.
+        :return: Закодированный результат.
+        """
+        handler = self._handlers.get(bytes(call_data[:4]))
+        if handler is None:
+            raise ValueError(f"Неизвестный селектор {bytes(call_data[:4]).hex()}")
+        return handler(bytes(call_data[4:]))
+
+    # -- транзакции --
+
+    @staticmethod
+    def _decode_raw(raw):
+        """:return: Кортеж (nonce, to, data) подписанной транзакции."""
+        if raw[0] == 2:
+            fields = rlp.decode(raw[1:])
+            return int.from_bytes(fields[1], "big"), fields[5], fields[7]
+        if raw[0] == 1:
+            fields = rlp.decode(raw[1:])
+            return int.from_bytes(fields[1], "big"), fields[4], fields[6]
+        fields = rlp.decode(raw)
+        return int.from_bytes(fields[0], "big"), fields[3], fields[5]
+
+    def _mint_logs(self, position_manager, owner, token_id, tick_lower, tick_upper, liquidity):
+        """:return: События Transfer новой позиции и Mint пула (без полей блока и транзакции)."""
+        position_manager = Web3.to_checksum_address(position_manager)
+        return [
+            {"address": position_manager, "data": "0x",
+             "topics": [TRANSFER_TOPIC, ZERO_TOPIC, address_topic(owner), uint_topic(token_id)]},
+            {"address": POOL_ADDRESS,
+             "data": "0x" + encode(['address', 'uint128', 'uint256', 'uint256'],
+                                   [position_manager, liquidity, 0, 0]).hex(),
+             "topics": [POOL_MINT_TOPIC, address_topic(position_manager), "0x" + encode(['int24'], [tick_lower]).hex(),
+                        "0x" + encode(['int24'], [tick_upper]).hex()]},
+        ]
+
+    def _apply(self, sender, to, data, logs):
+        selector, args = bytes(data[:4]), bytes(data[4:])
+        if selector == _selector(ERC20_ABI_PATH, "approve"):
+            self.allowances[sender.lower()] = decode(['address', 'uint256'], args)[1]
+        elif selector == _selector(POSITION_MANAGER_ABI_PATH, "decreaseLiquidity"):
+            (token_id, liquidity, _, _, _), = decode(['(uint256,uint128,uint256,uint256,uint256)'], args)
+            self.positions[token_id]["liquidity"] -= liquidity
+        elif selector == _selector(POSITION_MANAGER_ABI_PATH, "mint"):
+            params, = decode(['(address,address,uint24,int24,int24,uint256,uint256,uint256,uint256,address,uint256)'],
+                             args)
+            token_id = self.add_position(params[9], tick_lower=params[3], tick_upper=params[4])
+            position = self.positions[token_id]
+            logs += self._mint_logs(to, params[9], token_id, params[3], params[4], position["liquidity"])
+        elif selector == _selector(POSITION_MANAGER_ABI_PATH, "multicall"):
+            for inner in decode(['bytes[]'], args)[0]:
+                self._apply(sender, to, inner, logs)
+
+    def send_raw_transaction(self, raw_hex):
+        """
+        Принимает подписанную транзакцию, проверяет nonce и сразу включает её в новый блок.
+        Повторная отправка уже включённой транзакции отклоняется, как это делает нода.
+
+        :param raw_hex: Подписанная транзакция в hex.
+        :return: Хэш транзакции.
+        """
+        raw = bytes.fromhex(raw_hex[2:])
+        sender = Account.recover_transaction(raw)
+        nonce, to, data = self._decode_raw(raw)
+        tx_hash = Web3.keccak(raw).to_0x_hex()
+        with self._lock:
+            if tx_hash in self.receipts:
+                raise ValueError("already known")
+            if nonce < self.nonces[sender.lower()]:
+                raise ValueError(f"nonce too low: next nonce {self.nonces[sender.lower()]}, tx nonce {nonce}")
+            logs = []
+            self._apply(sender, to, data, logs)
+            self.nonces[sender.lower()] += 1
+            self.block_number += 1
+            self.block_timestamp += 2
+            for index, log in enumerate(logs):
+                log.update({"blockNumber": _hex(self.block_number),
+                            "blockHash": "0x" + self.block_number.to_bytes(32, "big").hex(),
+                            "transactionHash": tx_hash, "transactionIndex": "0x0", "logIndex": _hex(index),
+                            "removed": False})
+            self.receipts[tx_hash] = {
+                "transactionHash": tx_hash, "transactionIndex": "0x0", "blockNumber": _hex(self.block_number),
+                "blockHash": ZERO_HASH, "from": sender, "to": Web3.to_checksum_address(to) if to else None,
+                "cumulativeGasUsed": _hex(150_000), "gasUsed": _hex(150_000), "effectiveGasPrice": _hex(self.base_fee),
+                "contractAddress": None, "logs": logs, "logsBloom": "0x" + "00" * 256, "status": "0x1", "type": "0x2",
+            }
+        return tx_hash
+
+    # -- JSON-RPC --
+
+    def block(self):
+        return {
+            "number": _hex(self.block_number), "hash": "0x" + self.block_number.to_bytes(32, "big").hex(),
+            "parentHash": ZERO_HASH, "timestamp": _hex(self.block_timestamp), "baseFeePerGas": _hex(self.base_fee),
+            "gasLimit": _hex(30_000_000), "gasUsed": _hex(15_000_000), "miner": ZERO_ADDRESS, "extraData": "0x",
+            "transactions": [], "uncles": [],
+        }
+
+    def handle(self, method, params, filters=None):
+        """
+        Обрабатывает один JSON-RPC запрос.
+
+        :param method: Имя метода.
+        :param params: Параметры.
+        :param filters: Фильтры узла, принявшего запрос (по умолчанию — общие фильтры стенда).
+        :return: Значение поля result.
+        """
+        filters = self.filters if filters is None else filters
+        with self._lock:
+            self.calls[method] += 1
+        if method == "eth_chainId":
+            return _hex(self.chain_id)
+        if method == "eth_blockNumber":
+            return _hex(self.block_number)
+        if method == "eth_getBlockByNumber":
+            return self.block()
+        if method == "eth_call":
+            data = params[0].get("data") or params[0].get("input")
+            return "0x" + self.call(bytes.fromhex(data[2:])).hex()
+        if method == "eth_estimateGas":
+            return _hex(150_000)
+        if method == "eth_gasPrice":
+            return _hex(self.base_fee + 10 ** 9)
+        if method == "eth_maxPriorityFeePerGas":
+            return _hex(10 ** 9)
+        if method == "eth_feeHistory":
+            block_count = int(params[0], 16) if isinstance(params[0], str) else params[0]
+            percentiles = params[2] if len(params) > 2 else []
+            return {"oldestBlock": _hex(max(self.block_number - block_count + 1, 0)),
+                    "baseFeePerGas": [_hex(self.base_fee)] * (block_count + 1),
+                    "gasUsedRatio": [0.5] * block_count,
+                    "reward": [[_hex(10 ** 9)] * len(percentiles)] * block_count}
+        if method == "eth_getTransactionCount":
+            return _hex(self.nonces[params[0].lower()])
+        if method == "eth_sendRawTransaction":
+            return self.send_raw_transaction(params[0])
+        if method == "eth_getTransactionReceipt":
+            return self.receipts.get(params[0])
+        if method == "eth_createAccessList":
+            return {"accessList": [], "gasUsed": _hex(150_000)}
+        if method == "eth_newFilter":
+            return self._new_filter(params, filters)
+        if method == "eth_getFilterChanges":
+            return self._filter_changes(params, filters)
+        if method == "eth_getLogs":
+            return self._get_logs(params)
+        if method == "eth_uninstallFilter":
+            return filters is not None and filters.pop(params[0], None) is not None
+        if method == "web3_clientVersion":
+            return "chain-standin/1.0"
+        raise ValueError(f"Метод {method} не поддерживается стендом")
+
+
+class StandInProvider:
+    """
+    Провайдер с интерфейсом HTTPProvider, обращающийся к StandInChain в памяти.
+
+    Задержка latency добавляется к каждому HTTP-запросу (один раз на пакетный запрос),
+    чтобы имитировать сетевые задержки реального RPC. С own_filters провайдер ведёт себя
+    как отдельный узел той же сети: фильтры хранятся в его памяти и не видны другим узлам.
+    Узел с lag отстаёт от сети на lag блоков: не знает более новых блоков и сообщает свой номер блока.
+    """
+
+    def __init__(self, chain, latency=0.0, own_filters=False, lag=0):
+        self.chain = chain
+        self.latency = latency
+        self.lag = lag
+        self.http_requests = 0
+        self.unknown_blocks = 0
+        self.filters = {} if own_filters and chain.filters is not None else None
+
+    def _head(self):
+        return max(self.chain.block_number - self.lag, 1)
+
+    def _lagging_result(self, method, params):
+        """:return: Кортеж (обработан ли запрос, результат) для запросов, которые зависят от головы узла."""
+        if method == "eth_blockNumber":
+            return True, _hex(self._head())
+        block = params[0] if method == "eth_getBlockByNumber" else (params[1] if len(params) > 1 else None)
+        if method in ("eth_call", "eth_getBlockByNumber") and isinstance(block, str) and block.startswith("0x") \
+                and int(block, 16) > self._head():
+            self.unknown_blocks += 1
+            if method == "eth_getBlockByNumber":
+                # Неизвестный блок нода возвращает как null
+                return True, None
+            raise ValueError("header not found")
+        return False, None
+
+    def _response(self, request_id, method, params):
+        try:
+            if self.lag:
+                handled, result = self._lagging_result(method, params)
+                if handled:
+                    return {"jsonrpc": "2.0", "id": request_id, "result": result}
+            return {"jsonrpc": "2.0", "id": request_id, "result": self.chain.handle(method, params, self.filters)}
+        except Exception as e:
+            return {"jsonrpc": "2.0", "id": request_id, "error": {"code": -32000, "message": str(e)}}
+
+    def make_request(self, method, params):
+        self.http_requests += 1
+        with self.chain._lock:
+            self.chain.http_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self._response(0, method, params)
+
+    def make_batch_request(self, batch_requests):
+        self.http_requests += 1
+        with self.chain._lock:
+            self.chain.http_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._response(i, method, params) for i, (method, params) in enumerate(batch_requests)]
@@ -1,90 +1,87 @@
+import argparse
 import time
-from web3 import Web3
 import os
 from dotenv import load_dotenv
 from utils.select_chain import select_chain
-
-# Загрузка данных сети
-chain = select_chain()
-
-from utils.blockchain import get_web3, get_user_position, get_position_liquidity, check_allowance, approve_token
+from utils.chain_context import current_chain
+from utils.blockchain import get_web3, approve_token, check_allowance
 from utils.pricing import get_eth_price
-from utils.rebalance import should_rebalance, calculate_new_range, remove_liquidity, add_liquidity, collect_fees
+from utils.rebalance import calculate_new_range, remove_liquidity, add_liquidity, collect_fees, \
+    rebalance_in_one_tx, get_pool_fee, build_collect_call, build_decrease_call, build_mint_call, build_rebalance_call
+from utils.preflight import simulate, PreflightError
 from utils.logger import setup_logger
-from utils.decryption import is_base64, decrypt_private_key, get_password
+from utils.decryption import is_base64, derive_key, decrypt_with_key, get_password
+from utils.wallet_loader import read_key_lines, load_wallets, WALLET_CACHE_PATH
+from utils.multicall import get_wallets_state, unread_wallets
+from utils.position_index import PositionIndex, POSITION_INDEX_PATH
+from utils.executor import run_for_wallets
+from utils.price_watcher import PriceWatcher
+from utils.metrics import metrics, start_http_server
+from utils.receipt_tracker import get_receipt_tracker, normalize_hash, RECEIPT_TIMEOUT
+from utils.state_store import StateStore, STATE_DB_PATH
+from utils.position_book import PositionBook
+from utils.sharding import shard_wallets, PriceSignal
+from utils.unimath import get_ticks_for_range
+from utils.retry_decorator import deadline, remaining
 # Загрузка настроек из .env
 load_dotenv()
 
-# Получаем настройки из переменных окружения
+# Получаем настройки из переменных окружения. Настройки ребалансировки и файлов — значения по умолчанию:
+# профиль оркестратора может задать свои (ChainContext.setting)
 RANGE_WIDTH = float(os.getenv("RANGE_WIDTH", 100))  # Ширина диапазона
-THRESHOLD_PERCENT = float(os.getenv("THRESHOLD_PERCENT", 10)) / 100  # Порог для ребалансировки (в процентах)
-PRICE_CHECK_INTERVAL = int(chain["PRICE_CHECK_INTERVAL"])  # Интервал проверки в секундах
-GAS_PRICE_MULTIPLIER = float(os.getenv("GAS_PRICE_MULTIPLIER", 1.2))  # Коэффициент для газа
+THRESHOLD_PERCENT = float(os.getenv("THRESHOLD_PERCENT", 10))  # Порог для ребалансировки (в процентах)
 LOG_FOLDER = os.getenv("LOG_FOLDER", "logs")  # Папка для логов
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # Уровень логов
-RANGE_LOWER = float(os.getenv("RANGE_LOWER"))  # Нижняя граница диапазона
-RANGE_HIGHER = float(os.getenv("RANGE_HIGHER"))  # Верхняя граница диапазона
 POSITION_MANAGER_ABI_PATH = os.getenv('POSITION_MANAGER_ABI_PATH', 'utils/position_manager_abi.json')
-POSITION_MANAGER_ADDRESS = chain['POSITION_MANAGER_ADDRESS']
 ERC20_ABI = os.getenv("ERC20_ABI_PATH", 'utils/erc20_abi.json')
-TOKEN1 = chain["TOKEN1"]
-AMOUNT0 = float(os.getenv('AMOUNT0'))
+AMOUNT0 = float(os.getenv('AMOUNT0', 0))
+REBALANCE_MODE = os.getenv("REBALANCE_MODE", "sequential").lower()  # sequential или multicall (одна транзакция)
+PRICE_TRIGGER = os.getenv("PRICE_TRIGGER", "interval").lower()  # interval (опрос) или events (по обновлению цены)
+POSITION_SOURCE = os.getenv("POSITION_SOURCE", "multicall").lower()  # multicall (чтение контракта) или index (SQLite)
+WALLETS_PATH = os.getenv("WALLETS_PATH", "wallets.txt")  # Файл с ключами кошельков
+ADD_IF_EMPTY = os.getenv("ADD_IF_EMPTY")  # Добавлять ли ликвидность на пустые кошельки без вопроса (1/0)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 1))  # Количество шардов кошельков (задаётся utils.sharding)
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", 0))  # Номер шарда этого процесса
+PRICE_SIGNAL_PATH = os.getenv("PRICE_SIGNAL_PATH")  # Файл общего сигнала цены от координатора шардов
+CYCLE_BUDGET = float(os.getenv("CYCLE_BUDGET", 180))  # Лимит времени на цикл проверки и ребалансировки (секунды)
 
 
-def get_wallet_info_from_file(file_path="wallets.txt"):
+def get_wallet_info_from_file(file_path=None, password=None):
     """
     Считывает информацию о кошельках из файла. Поддерживает как зашифрованные, так и незашифрованные ключи.
-    Проверяет, зашифрован ли файл, по первой строке. Если да, запрашивает пароль один раз для всех строк.
+    Проверяет, зашифрован ли файл, по первой строке. Если да, запрашивает пароль один раз для всех строк;
+    ключ шифрования вычисляется из пароля тоже один раз.
 
-    :param file_path: Путь к файлу с ключами.
+    :param file_path: Путь к файлу с ключами (по умолчанию WALLETS_PATH).
+    :param password: Пароль, если он уже получен (без запроса; неверный пароль — ошибка).
     :return: Список пар (адрес, приватный ключ).
     """
-    wallets = []
-
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Файл '{file_path}' не найден.")
-    if os.path.getsize(file_path) == 0:
-        raise ValueError(f"Файл '{file_path}' пуст. Добавьте кошельки в файл.")
-
-    with open(file_path, "r") as file:
-        lines = [line.strip() for line in file if line.strip()]
-        if not lines:
-            raise ValueError(f"Файл '{file_path}' пуст. Добавьте кошельки в файл.")
-
-        # Определяем, зашифрованы ли ключи, по первой строке
-        first_line = lines[0]
-        encrypted = is_base64(first_line)
+    chain = current_chain()
+    lines = read_key_lines(file_path or chain.setting("WALLETS_PATH", WALLETS_PATH))
 
-        if encrypted:
-            # Запрашиваем пароль один раз
-            password = None
-            while True:
-                try:
-                    password = get_password("Введите пароль для расшифровки ключей: ").strip()
-                    # Проверяем пароль на первой строке
-                    decrypt_private_key(first_line, password)
-                    break  # Если расшифровка успешна, выходим из цикла
-                except (ValueError, UnicodeDecodeError):
-                    print("Неверный пароль, попробуйте снова.")
-                except Exception as e:
-                    raise ValueError(f"Ошибка проверки пароля: {e}")
-
-        for line_num, line in enumerate(lines, start=1):
+    # Определяем, зашифрованы ли ключи, по первой строке
+    first_line = lines[0]
+    key = None
+    if is_base64(first_line) and password is not None:
+        key = derive_key(password)
+        try:
+            decrypt_with_key(first_line, key)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("Неверный пароль для расшифровки ключей")
+    elif is_base64(first_line):
+        # Запрашиваем пароль один раз
+        while True:
             try:
-                if encrypted:
-                    # Расшифровываем приватный ключ
-                    private_key = decrypt_private_key(line, password)
-                else:
-                    # Незашифрованный ключ
-                    private_key = line
-
-                # Получаем адрес кошелька из приватного ключа
-                wallet_address = Web3().eth.account.from_key(private_key).address
-                wallets.append((wallet_address, private_key))
+                key = derive_key(get_password("Введите пароль для расшифровки ключей: ").strip())
+                # Проверяем пароль на первой строке
+                decrypt_with_key(first_line, key)
+                break  # Если расшифровка успешна, выходим из цикла
+            except (ValueError, UnicodeDecodeError):
+                print("Неверный пароль, попробуйте снова.")
             except Exception as e:
-                print(f"Ошибка обработки строки {line_num} ('{line}'): {e}")
+                raise ValueError(f"Ошибка проверки пароля: {e}")
 
-    return wallets
+    return load_wallets(lines, key, chain.setting("WALLET_CACHE_PATH", WALLET_CACHE_PATH))
 
 
 # Создаем логгер для работы с кошельками
@@ -92,98 +89,406 @@ def create_logger(wallet_address):
     return setup_logger(wallet_address, LOG_FOLDER, LOG_LEVEL)
 
 
-def main():
+def record_tx(store, wallet_address, tx_hash, kind):
+    """
+    Записывает отправленную транзакцию в хранилище состояния до её подтверждения.
+
+    :param store: Хранилище состояния или None.
+    :param wallet_address: Адрес кошелька.
+    :param tx_hash: Хэш транзакции.
+    :param kind: Тип транзакции.
+    """
+    if store is None or not tx_hash:
+        return
+    tx_hash = normalize_hash(tx_hash)
+    store.add_pending(wallet_address, tx_hash, kind)
+    future = get_receipt_tracker().future(tx_hash)
+    if future is None:
+        future = get_receipt_tracker().track(tx_hash, wallet_address)
+    # Квитанция обновит блок ребалансировки и ID новой позиции
+    future.add_done_callback(lambda f: store.confirm_tx(tx_hash, None if f.exception() else f.result()))
+
+
+def resume_pending(store, loggers):
+    """
+    Возобновляет отслеживание транзакций, не подтверждённых до перезапуска.
+
+    :param store: Хранилище состояния.
+    :param loggers: Словарь {адрес: логгер}.
+    """
+    addresses = {address.lower(): address for address in loggers}
+    for tx_hash, address, kind in store.get_pending():
+        address = addresses.get(address, address)
+        if address in loggers:
+            loggers[address].info(f"Ожидание подтверждения транзакции {tx_hash} ({kind}), отправленной до перезапуска.")
+        record_tx(store, address, tx_hash, kind)
+
+
+def preflight_wallets(web3, wallet_addresses, states, current_price, add_if_empty):
+    """
+    Готовит транзакции ребалансировки всех кошельков и симулирует их пакетно до подписи.
+    В последовательном режиме mint после удаления ликвидности симулируется позже,
+    когда удаление подтверждено: до этого его результат зависит от ещё не выполненных транзакций.
+
+    :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+    :param wallet_addresses: Адреса кошельков для ребалансировки.
+    :param states: Состояние кошельков из get_wallets_state.
+    :param current_price: Текущая цена ETH.
+    :param add_if_empty: Добавлять ли ликвидность на кошельки без текущей позиции.
+    :return: Кортеж (словарь {адрес: {тип: (транзакция, результат simulate)}},
+             словарь {адрес: PreflightError} для кошельков, транзакции которых откатятся).
+    """
+    if not wallet_addresses:
+        return {}, {}
+    chain = current_chain()
+    amount0 = chain.setting("AMOUNT0", AMOUNT0)
+    new_range_lower, new_range_upper = calculate_new_range(current_price, chain.setting("RANGE_WIDTH", RANGE_WIDTH),
+                                                           wallet_addresses[0])
+    planned = []
+    for address in wallet_addresses:
+        state = states[address]
+        if not state["liquidity"]:
+            if add_if_empty:
+                planned.append((address, "add", build_mint_call(address, new_range_lower, new_range_upper, amount0,
+                                                                current_price)))
+        elif chain.setting("REBALANCE_MODE", REBALANCE_MODE).lower() == "multicall":
+            planned.append((address, "rebalance", build_rebalance_call(
+                address, state["token_id"], state["liquidity"], new_range_lower, new_range_upper, amount0,
+                current_price)))
+        else:
+            planned.append((address, "collect", build_collect_call(address, state["token_id"])))
+            planned.append((address, "remove", build_decrease_call(web3, address, state["token_id"],
+                                                                   state["liquidity"])))
+
+    results = simulate(web3, [transaction for _, _, transaction in planned])
+    prepared, failed = {}, {}
+    for (address, kind, transaction), result in zip(planned, results):
+        if isinstance(result, PreflightError):
+            failed[address] = result
+        else:
+            prepared.setdefault(address, {})[kind] = (transaction, result)
+    for address in failed:
+        prepared.pop(address, None)
+    return prepared, failed
+
+
+def rebalance_wallet(web3, wallet_address, private_key, state, current_price, add_if_empty, store=None,
+                     prepared=None):
+    """
+    Ребалансирует позицию одного кошелька: сбор комиссий, удаление ликвидности и добавление в новый диапазон.
+
+    :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+    :param wallet_address: Адрес кошелька.
+    :param private_key: Приватный ключ кошелька.
+    :param state: Состояние кошелька из get_wallets_state.
+    :param current_price: Текущая цена ETH.
+    :param add_if_empty: Добавлять ли ликвидность на кошельки без текущей позиции.
+    :param store: Хранилище состояния для записи отправленных транзакций.
+    :param prepared: Транзакции кошелька, прошедшие симуляцию в preflight_wallets.
+    :return: Кортеж (новая нижняя граница, новая верхняя граница) или None, если кошелёк пропущен.
+    """
+    logger = create_logger(wallet_address)
+    logger.info("Ребалансировка начата...")
+    chain = current_chain()
+    amount0 = chain.setting("AMOUNT0", AMOUNT0)
+    token_id = state["token_id"]
+    prepared = prepared or {}
+    # Расчёт нового диапазона
+    new_range_lower, new_range_upper = calculate_new_range(current_price, chain.setting("RANGE_WIDTH", RANGE_WIDTH),
+                                                           wallet_address)
+    if not state["liquidity"]:
+        if not add_if_empty:
+            logger.error(f"Ошибка для кошелька {wallet_address}: Нет текущей ликвидности")
+            return None
+    elif chain.setting("REBALANCE_MODE", REBALANCE_MODE).lower() == "multicall":
+        # Удаление, сбор комиссий и добавление ликвидности одной транзакцией
+        tx_hash = rebalance_in_one_tx(web3, wallet_address, private_key, token_id, state["liquidity"],
+                                      new_range_lower, new_range_upper, amount0, current_price,
+                                      prepared.get("rebalance"))
+        record_tx(store, wallet_address, tx_hash, "rebalance")
+        logger.info(
+            f"Ребалансировка для кошелька {wallet_address} завершена. Новый диапазон: ${new_range_lower} - ${new_range_upper}")
+        return new_range_lower, new_range_upper
+    else:
+        # Сбор комиссий
+        collect_hash = collect_fees(web3, wallet_address, private_key, token_id, prepared.get("collect"))
+        record_tx(store, wallet_address, collect_hash, "collect")
+        if collect_hash:
+            # Удаление ликвидности
+            remove_hash = remove_liquidity(web3, wallet_address, private_key, token_id, state["liquidity"],
+                                           prepared.get("remove"))
+            record_tx(store, wallet_address, remove_hash, "remove")
+            # Новая позиция добавляется только после подтверждения обеих транзакций
+            get_receipt_tracker().wait([collect_hash, remove_hash], remaining(RECEIPT_TIMEOUT))
+    # Добавление ликвидности с новым диапазоном
+    tx_hash = add_liquidity(web3, wallet_address, private_key, new_range_lower, new_range_upper, amount0,
+                            current_price, prepared.get("add"))
+    record_tx(store, wallet_address, tx_hash, "add")
+
+    logger.info(
+        f"Ребалансировка для кошелька {wallet_address} завершена. Новый диапазон: ${new_range_lower} - ${new_range_upper}")
+    return new_range_lower, new_range_upper
+
+
+def parse_args(argv=None):
+    """
+    Разбирает аргументы командной строки.
+
+    :param argv: Список аргументов (по умолчанию sys.argv).
+    :return: Объект argparse.Namespace.
+    """
+    parser = argparse.ArgumentParser(description="Ребалансировщик позиций Uniswap V3.")
+    parser.add_argument("--chain", default=os.getenv("CHAIN"),
+                        help="Сеть без интерактивного выбора: base или ethereum (или переменная CHAIN)")
+    parser.add_argument("--config", default=os.getenv("CONFIG_PATH", "config.json"),
+                        help="Путь к файлу настроек сети")
+    return parser.parse_args(argv)
+
+
+def main(argv=None, overrides=None, password=None):
+    """
+    Запуск ребалансировщика для одной сети.
+
+    :param argv: Аргументы командной строки (по умолчанию sys.argv).
+    :param overrides: Параметры, заменяющие настройки сети (пул, RPC и т.д.).
+    :param password: Пароль от ключей, если он уже получен (запуск координатором шардов).
+    """
+    args = parse_args(argv)
+    # Загрузка данных сети: из аргумента/переменной CHAIN или интерактивный выбор
+    select_chain(args.config, chain_name=args.chain, overrides=overrides)
+    # HTTP-эндпоинт метрик RPC (если задан METRICS_PORT)
+    start_http_server()
+    run(password)
+
+
+def run(password=None):
     """
-    Основной цикл работы ребалансировщика.
+    Основной цикл работы ребалансировщика в текущей сети (см. utils.chain_context.current_chain).
+    Оркестратор профилей запускает его в отдельном потоке для каждого профиля.
+
+    :param password: Пароль от ключей, если он уже получен.
     """
-    global RANGE_LOWER, RANGE_HIGHER
+    chain = current_chain()
+    price_check_interval = int(chain.config["PRICE_CHECK_INTERVAL"])  # Интервал проверки в секундах
+    position_manager_address = chain.config['POSITION_MANAGER_ADDRESS']
+    token1 = chain.config["TOKEN1"]
+    threshold_percent = chain.setting("THRESHOLD_PERCENT", THRESHOLD_PERCENT) / 100
+    add_if_empty = chain.setting("ADD_IF_EMPTY", ADD_IF_EMPTY)
+    cycle_budget = chain.setting("CYCLE_BUDGET", CYCLE_BUDGET)
     print("Запуск ребалансировщика...")
     web3 = get_web3()
     current_chain_id = web3.eth.chain_id
     if current_chain_id not in [8453, 1]:
         raise ValueError("Вы подключены не к поддерживаемой сети. Проверьте RPC!")
 
-    choice = 0
+    # Ответы пользователя и неподтверждённые транзакции из прошлого запуска
+    store = StateStore(chain.setting("STATE_DB_PATH", STATE_DB_PATH))
+    choice = store.get("add_if_empty", 0) if add_if_empty is None else int(add_if_empty == "1")
     # Считываем кошельки
-    wallets = get_wallet_info_from_file()
+    wallets = get_wallet_info_from_file(password=password)
+    if SHARD_COUNT > 1:
+        # Процесс обслуживает только кошельки своего шарда
+        wallets = shard_wallets(wallets, SHARD_INDEX, SHARD_COUNT)
+        print(f"Шард {SHARD_INDEX} из {SHARD_COUNT}: кошельков {len(wallets)}.")
+        if not wallets:
+            return
     # Создаём логгеры для каждого кошелька
     loggers = {address: create_logger(address) for address, _ in wallets}
 
+    # Кошельки без неподтверждённых транзакций берутся из сохранённых снимков, из сети пакетно
+    # через Multicall3 читаются только остальные
+    states = store.known_states([address for address, _ in wallets])
+    stale = [address for address, _ in wallets if address not in states]
+    unread, changed = set(), []
+    if stale:
+        block = web3.eth.block_number
+        read = get_wallets_state(stale, position_manager_address, POSITION_MANAGER_ABI_PATH, token1, ERC20_ABI)
+        unread = set(unread_wallets(read))
+        if unread:
+            # Кошельки с упавшими подвызовами перечитываются отдельным запросом
+            read.update(get_wallets_state(list(unread), position_manager_address, POSITION_MANAGER_ABI_PATH,
+                                          token1, ERC20_ABI))
+            unread = set(unread_wallets(read))
+        for address in unread:
+            loggers[address].warning(f"Позиция кошелька {address} не прочитана, он будет проверен в следующем цикле.")
+        changed = store.reconcile({address: state for address, state in read.items() if address not in unread},
+                                  block)
+        states.update(read)
+    loggers[wallets[0][0]].info(
+        f"Состояние восстановлено: из хранилища {len(wallets) - len(stale)} кошельков, из сети {len(stale)}, "
+        f"позиции изменились на {len(changed)} кошельках.")
+    resume_pending(store, loggers)
+    approve_hashes = []
     for wallet_address, private_key in wallets:
         try:
-            if not check_allowance(wallet_address, POSITION_MANAGER_ADDRESS, TOKEN1, ERC20_ABI):
-                txn = approve_token(wallet_address, private_key, POSITION_MANAGER_ADDRESS, TOKEN1, ERC20_ABI)
+            allowance = states[wallet_address]["allowance"]
+            if allowance is None:
+                # Ошибка чтения — не повод платить за approve: allowance перечитывается отдельно
+                allowance = check_allowance(wallet_address, position_manager_address, token1, ERC20_ABI)
+            if not allowance:
+                txn = approve_token(wallet_address, private_key, position_manager_address, token1, ERC20_ABI)
+                approve_hashes.append(txn)
+                record_tx(store, wallet_address, txn, "approve")
                 loggers[wallet_address].info(f"Approve отправлена для кошелька {wallet_address} хэш транзакции {txn}")
 
         except Exception as e:
             loggers[wallet_address].error("Скрипт не будет работать без approve для всех кошельков!")
             exit(1)
+    if approve_hashes:
+        # Все approve подтверждаются одним пакетным опросом квитанций
+        try:
+            get_receipt_tracker().wait(approve_hashes, RECEIPT_TIMEOUT)
+        except Exception as e:
+            loggers[wallets[0][0]].error(f"Approve не подтверждены: {e}. Скрипт не будет работать без approve!")
+            exit(1)
     first_wallet = wallets[0][0]
+    private_keys = dict(wallets)
 
-    while True:
-        current_price = None
+    # Диапазоны позиций всех кошельков: проверка порога одним проходом по массивам
+    book = PositionBook(threshold_percent, chain.decimals0, chain.decimals1)
+    book.update({address: state for address, state in states.items() if address not in unread})
+
+    # Вопрос о добавлении ликвидности задаётся до основного цикла: ожидание ответа не должно
+    # расходовать лимит времени цикла
+    if choice != 1 and add_if_empty is None and book.empty_wallets():
+        user_answer = input(
+            f"На некоторых кошельках нет текущей ликвидности, желаете чтобы ее добавил бот? (да/нет) : ").strip().lower()
+        if user_answer in ["да", "yes", "y", "1"]:
+            choice = 1
+            store.set("add_if_empty", choice)
+
+    position_index = None
+    if chain.setting("POSITION_SOURCE", POSITION_SOURCE).lower() == "index":
+        position_index = PositionIndex(position_manager_address,
+                                       chain.setting("POSITION_INDEX_PATH", POSITION_INDEX_PATH))
+        loggers[first_wallet].info("Синхронизация индекса позиций...")
+        block = position_index.sync(web3, [address for address, _ in wallets])
+        loggers[first_wallet].info(f"Индекс позиций актуален до блока {block}.")
+
+    watcher = None
+    next_price = None
+    if PRICE_SIGNAL_PATH:
+        # Цена приходит от координатора шардов, все шарды реагируют на один и тот же сигнал
+        watcher = PriceSignal(PRICE_SIGNAL_PATH)
+        next_price = watcher.read()
+        loggers[first_wallet].info(f"Цена берётся из общего сигнала {PRICE_SIGNAL_PATH}.")
+    elif chain.setting("PRICE_TRIGGER", PRICE_TRIGGER).lower() == "events":
         try:
-            # Получаем текущую цену ETH
-            current_price = get_eth_price()
-            if current_price is None:
-                loggers[first_wallet].warning(
-                    f"Не удалось получить текущую цену. Повтор через {PRICE_CHECK_INTERVAL} секунд.")
-                time.sleep(PRICE_CHECK_INTERVAL)
-                continue
+            watcher = PriceWatcher(web3, chain.config["CHAINLINK_PRICE_FEED"])
+            mode = watcher.start()
+            loggers[first_wallet].info(f"Отслеживание обновлений цены запущено (режим: {mode}).")
         except Exception as e:
-            loggers[first_wallet].error(f"Ошибка при получении цены ETH: {e}")
+            watcher = None
+            loggers[first_wallet].error(f"Не удалось запустить отслеживание цены, используется опрос: {e}")
 
-        amount0, amount1 = None, None
+    while True:
+        # Все RPC-запросы и повторы цикла укладываются в CYCLE_BUDGET: зависший RPC или кошелёк
+        # не задерживают следующую проверку
+        with deadline(cycle_budget):
+            current_price = None
+            try:
+                # Получаем текущую цену ETH (если она уже пришла из события, RPC не нужен)
+                current_price = next_price if next_price is not None else get_eth_price()
+                next_price = None
+                if current_price is None:
+                    loggers[first_wallet].warning(
+                        f"Не удалось получить текущую цену. Повтор через {price_check_interval} секунд.")
+                    time.sleep(price_check_interval)
+                    continue
+            except Exception as e:
+                loggers[first_wallet].error(f"Ошибка при получении цены ETH: {e}")
+                time.sleep(price_check_interval)
+                continue
 
-        loggers[first_wallet].info(f"Текущая цена ETH: ${current_price}")
+            loggers[first_wallet].info(f"Текущая цена ETH: ${current_price}")
 
-        # Проверка необходимости ребалансировки
-        if should_rebalance(current_price, RANGE_LOWER, RANGE_HIGHER, THRESHOLD_PERCENT, first_wallet):
-            for wallet_address, private_key in wallets:
+            # Проверка необходимости ребалансировки: по реальным диапазонам каждой позиции
+            candidates = book.wallets_to_rebalance(current_price, choice == 1)
+            # Кошельки, позицию которых не удалось прочитать, перечитываются каждый цикл
+            candidates += sorted(unread.difference(candidates))
+            if candidates:
                 try:
-                    loggers[wallet_address].info("Ребалансировка начата...")
-                    token_id = get_user_position(POSITION_MANAGER_ADDRESS, POSITION_MANAGER_ABI_PATH, wallet_address)
-                    # Удаление текущей ликвидности
-                    if not (get_position_liquidity(POSITION_MANAGER_ADDRESS, POSITION_MANAGER_ABI_PATH, token_id, wallet_address)):
-                        if choice != 1:
-                            user_answer = input(
-                                f"На некоторых кошельках нет текущей ликвидности, желаете чтобы ее добавил бот? (да/нет) : ").strip().lower()
-                            if user_answer in ["да", "yes", "y", "1"]:
-                                amount0 = AMOUNT0
-                                choice = 1
-                            else:
-                                loggers[wallet_address].error(
-                                    f"Ошибка для кошелька {wallet_address}: Нет текущей ликвидности")
-                                continue
-                        else:
-                            amount0 = AMOUNT0
-                    else:
-                        # Сбор комиссий
-                        if collect_fees(web3, wallet_address, private_key, token_id):
-                            # Удаление ликвидности
-                            remove_liquidity(web3, wallet_address, private_key, token_id)
-                    # Расчёт нового диапазона
-                    new_range_lower, new_range_upper = calculate_new_range(current_price, RANGE_WIDTH, wallet_address)
-                    if amount0 == None:
-                        # Добавление ликвидности с новым диапазоном с автоматическим amount
-                        add_liquidity(web3, wallet_address, private_key, new_range_lower, new_range_upper)
+                    # Перед отправкой транзакций позиции кандидатов перечитываются из сети
+                    if position_index is not None:
+                        # Индекс догоняется по новым блокам, позиции берутся из локальной базы
+                        block = position_index.sync(web3, candidates)
+                        states = position_index.get_wallets_state(candidates)
                     else:
-                        # Добавление ликвидности с новым диапазоном с ручным вводом amount
-                        add_liquidity(web3, wallet_address, private_key, new_range_lower, new_range_upper,
-                                      amount0)
-                    # Обновление глобальных переменных диапазона
-                    RANGE_LOWER, RANGE_HIGHER = new_range_lower, new_range_upper
-
-                    loggers[wallet_address].info(
-                        f"Ребалансировка для кошелька {wallet_address} завершена. Новый диапазон: ${new_range_lower} - ${new_range_upper}")
+                        block = web3.eth.block_number
+                        states = get_wallets_state(candidates, position_manager_address,
+                                                   POSITION_MANAGER_ABI_PATH, token1, ERC20_ABI)
                 except Exception as e:
-                    loggers[wallet_address].error(f"Ошибка для кошелька {wallet_address}: {e}")
-        else:
-            loggers[first_wallet].info("Ребалансировка не требуется. Ожидание следующей проверки.")
+                    loggers[first_wallet].error(f"Ошибка при пакетном чтении состояния кошельков: {e}")
+                    time.sleep(price_check_interval)
+                    continue
+                # Кошелёк с непрочитанной позицией пропускает цикл, а не считается пустым
+                unread = set(unread_wallets(states))
+                for address in unread:
+                    loggers[address].warning(f"Позиция кошелька {address} не прочитана, кошелёк пропускает цикл.")
+                states = {address: state for address, state in states.items() if address not in unread}
+                book.update(states)
+                store.reconcile(states, block)
+
+                # Остальные кошельки без ликвидности будут кандидатами в следующем цикле
+                targets = [address for address in book.wallets_to_rebalance(current_price, choice == 1)
+                           if address in states]
+                loggers[first_wallet].warning(
+                    f"Ребалансировка требуется для {len(targets)} из {len(wallets)} кошельков.")
+
+                # Транзакции всех кошельков симулируются пакетно; откатывающиеся не подписываются
+                # и не отправляются
+                try:
+                    prepared, failed = preflight_wallets(web3, targets, states, current_price, choice == 1)
+                except Exception as e:
+                    loggers[first_wallet].warning(
+                        f"Пакетная симуляция не удалась, транзакции будут проверены по одной: {e}")
+                    prepared, failed = {}, {}
+                for address, error in failed.items():
+                    loggers[address].error(f"Ребалансировка кошелька {address} пропущена: {error}")
+                targets = [address for address in targets if address not in failed]
+
+                # Nonce кошельков запрашиваются пакетно до запуска параллельной обработки
+                try:
+                    chain.nonce_manager.prefetch(web3, targets)
+                except Exception as e:
+                    loggers[first_wallet].warning(
+                        f"Не удалось пакетно получить nonce, они будут запрошены по одному: {e}")
+
+                def task(wallet_address, private_key):
+                    return rebalance_wallet(web3, wallet_address, private_key, states[wallet_address],
+                                            current_price, choice == 1, store, prepared.get(wallet_address))
 
+                results = run_for_wallets(task, [(address, private_keys[address]) for address in targets], loggers)
+                rebalanced = 0
+                for address, result in results.items():
+                    if isinstance(result, tuple):
+                        # Новый диапазон учитывается сразу, не дожидаясь подтверждения mint
+                        book.set_range(address, *get_ticks_for_range(*result, get_pool_fee(), chain.decimals0,
+                                                                     chain.decimals1))
+                        rebalanced += 1
+                store.set("last_cycle", {"time": time.time(), "price": current_price, "rebalanced": rebalanced,
+                                         "failed": sum(isinstance(r, Exception) for r in results.values())})
+            else:
+                loggers[first_wallet].info("Ребалансировка не требуется. Ожидание следующей проверки.")
 
-        # Задержка между проверками
-        time.sleep(PRICE_CHECK_INTERVAL)
+
+        # Сводка RPC за цикл и выгрузка метрик (если задан METRICS_FILE)
+        loggers[first_wallet].info(metrics.cycle_summary([endpoint.label for endpoint in chain.rpc_pool.endpoints]))
+        try:
+            metrics.write_prometheus()
+        except OSError as e:
+            loggers[first_wallet].error(f"Ошибка при записи метрик: {e}")
+
+        if watcher is not None:
+            # Ожидание обновления цены; по истечении интервала цена перепроверяется опросом
+            try:
+                next_price = watcher.wait_for_update(price_check_interval)
+            except Exception as e:
+                loggers[first_wallet].error(f"Ошибка при ожидании обновления цены: {e}")
+                time.sleep(price_check_interval)
+        else:
+            # Задержка между проверками
+            time.sleep(price_check_interval)
 
 
 if __name__ == "__main__":
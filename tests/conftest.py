@@ -0,0 +1,38 @@
+import ipaddress
+import socket
+import pytest
+
+
+def _is_local(address):
+    if not isinstance(address, tuple):
+        # Unix-сокеты (multiprocessing) не выходят в сеть
+        return True
+    host = address[0]
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+@pytest.fixture(autouse=True)
+def no_network(monkeypatch):
+    """Запрещает тестам соединения за пределы локальной машины."""
+    connect = socket.socket.connect
+
+    def guarded_connect(sock, address):
+        if not _is_local(address):
+            raise OSError(f"Сеть в тестах недоступна: {address}")
+        return connect(sock, address)
+
+    monkeypatch.setattr(socket.socket, "connect", guarded_connect)
+    monkeypatch.setattr(socket, "getaddrinfo", _no_dns(socket.getaddrinfo))
+
+
+def _no_dns(getaddrinfo):
+    def guarded_getaddrinfo(host, *args, **kwargs):
+        if host not in (None, "localhost") and not _is_local((host,)):
+            raise socket.gaierror(f"Сеть в тестах недоступна: {host}")
+        return getaddrinfo(host, *args, **kwargs)
+    return guarded_getaddrinfo
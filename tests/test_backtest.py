@@ -0,0 +1,23 @@
+import numpy as np
+from utils.backtest import simulate
+from utils.rebalance import calculate_new_range, should_rebalance
+
+
+def test_rebalances_where_bot_would(tmp_path, monkeypatch):
+    # Логгер кошелька пишет в logs/ текущего каталога
+    monkeypatch.chdir(tmp_path)
+    prices = np.array([2500.0, 2520.0, 2541.0, 2546.0, 2550.0, 2500.0])
+    result = simulate(prices, range_width=100, threshold_percent=10, decimals0=18, decimals1=6)
+    # Для ручной проверки — та же последовательность решений через функции основного цикла
+    rebalances, lower, upper = 0, *calculate_new_range(prices[0], 100, "backtest")
+    for price in prices[1:]:
+        if should_rebalance(price, lower, upper, 0.1, "backtest"):
+            rebalances += 1
+            lower, upper = calculate_new_range(price, 100, "backtest")
+    assert result["rebalances"] == rebalances == 2
+
+
+def test_flat_prices_never_rebalance():
+    result = simulate(np.full(100, 2500.0), range_width=100, threshold_percent=10, decimals0=18, decimals1=6)
+    assert result["rebalances"] == 0 and result["time_in_range"] == 1.0
+    assert abs(result["il_usd"]) < 1e-6
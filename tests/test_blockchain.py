@@ -0,0 +1,101 @@
+import os
+import pytest
+import requests
+from eth_account import Account
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+from benchmarks.chain_standin import StandInChain, StandInProvider
+from utils.chain_context import ChainContext, use_chain
+from utils.errors import BroadcastUnknownError
+from utils.rebalance import add_liquidity
+from utils.select_chain import CHAIN_PROFILES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACCOUNT = Account.from_key("0x" + "42" * 32)
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(monkeypatch, tmp_path):
+    # Логи бота пишутся в текущую папку, а ABI читаются по путям относительно корня репозитория
+    (tmp_path / "utils").symlink_to(os.path.join(ROOT, "utils"))
+    monkeypatch.chdir(tmp_path)
+
+
+class FlakySendProvider(StandInProvider):
+    """Узел, на котором отправка транзакции завершается заданными сбоями."""
+
+    def __init__(self, chain, failures):
+        super().__init__(chain)
+        # "lost" — узел принял транзакцию, но ответ потерян; "refused" — соединение не установлено
+        self.failures = list(failures)
+
+    def make_request(self, method, params):
+        if method == "eth_sendRawTransaction" and self.failures:
+            failure = self.failures.pop(0)
+            if failure == "refused":
+                raise requests.ConnectionError(MaxRetryError(None, "/", NewConnectionError(None, "Connection refused")))
+            try:
+                self.chain.handle(method, params)
+            except ValueError:
+                # Ответ узла (в том числе отказ) не дошёл до бота
+                pass
+            raise requests.ReadTimeout("Read timed out")
+        return super().make_request(method, params)
+
+
+def make_context(chain, failures=()):
+    config = {key: value for key, value in CHAIN_PROFILES["Base"].items() if not key.startswith("RPC_URL_")}
+    provider = FlakySendProvider(chain, failures)
+    return ChainContext(dict(config, RPC_URL_1="http://node"), "base", provider_factory=lambda url: provider)
+
+
+def mint(context):
+    with use_chain(context):
+        return add_liquidity(context.web3(), ACCOUNT.address, ACCOUNT.key, 2450, 2550, amount0=0.5,
+                             current_price=2500.0)
+
+
+def mined(chain):
+    return chain.nonces[ACCOUNT.address.lower()], len(chain.positions)
+
+
+def test_lost_send_response_does_not_mint_twice():
+    chain = StandInChain()
+    context = make_context(chain, ["lost"])
+    tx_hash = mint(context)
+    # Повтор отправил те же байты, узел ответил "already known"
+    assert tx_hash in chain.receipts
+    assert mined(chain) == (1, 1)
+    assert context.nonce_manager.next_nonce(context.web3(), ACCOUNT.address) == 1
+
+
+def test_unknown_send_is_not_retried_with_a_new_nonce():
+    chain = StandInChain()
+    # Ответ теряется при каждой попытке: исход отправки неизвестен
+    context = make_context(chain, ["lost"] * 10)
+    with pytest.raises(BroadcastUnknownError):
+        mint(context)
+    assert mined(chain) == (1, 1)
+    # Nonce не сброшен и не использован повторно, транзакция отслеживается
+    assert context.nonce_manager.next_nonce(context.web3(), ACCOUNT.address) == 1
+    assert len(context.receipt_tracker()._by_hash) == 1
+
+
+def test_send_that_never_reached_a_node_is_retried():
+    chain = StandInChain()
+    context = make_context(chain, ["refused"])
+    tx_hash = mint(context)
+    assert tx_hash in chain.receipts
+    assert mined(chain) == (1, 1)
+
+
+def test_tracking_error_after_send_does_not_resend(monkeypatch):
+    chain = StandInChain()
+    context = make_context(chain)
+
+    def broken_track(*args, **kwargs):
+        raise RuntimeError("трекер недоступен")
+
+    monkeypatch.setattr(context.receipt_tracker(), "track", broken_track)
+    tx_hash = mint(context)
+    assert tx_hash in chain.receipts
+    assert mined(chain) == (1, 1)
@@ -0,0 +1,76 @@
+import os
+import threading
+import pytest
+from benchmarks.chain_standin import StandInChain, StandInProvider
+from utils.blockchain import get_web3
+from utils.chain_context import ChainContext, current_chain, use_chain
+from utils.multicall import get_multicall3
+from utils.rebalance import build_mint_params
+from utils.select_chain import CHAIN_PROFILES, get_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WALLET = "0x" + "11" * 20
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(monkeypatch, tmp_path):
+    # Логи бота пишутся в текущую папку, а ABI читаются по путям относительно корня репозитория
+    (tmp_path / "utils").symlink_to(os.path.join(ROOT, "utils"))
+    monkeypatch.chdir(tmp_path)
+
+
+def make_context(chain, name, **config):
+    return ChainContext(dict(CHAIN_PROFILES["Base"], **config), name, {"AMOUNT0": "0.5", "REBALANCE_BURN": "yes"},
+                        provider_factory=lambda url: StandInProvider(chain))
+
+
+def test_profiles_in_threads_use_their_own_chain():
+    chains = {"base": StandInChain(chain_id=8453), "eth": StandInChain(chain_id=1)}
+    contexts = {name: make_context(chain, name) for name, chain in chains.items()}
+    seen = {}
+
+    def run(name):
+        with use_chain(contexts[name]):
+            web3 = get_web3()
+            seen[name] = (web3.eth.chain_id, current_chain().nonce_manager.next_nonce(web3, WALLET),
+                          get_multicall3(), get_config())
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in contexts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert seen["base"][0] == 8453 and seen["eth"][0] == 1
+    # Nonce, контракты и настройки не общие между профилями
+    assert contexts["base"].nonce_manager is not contexts["eth"].nonce_manager
+    assert seen["base"][2] is not seen["eth"][2]
+    assert seen["base"][2].w3 is contexts["base"].web3()
+    assert seen["base"][3] is contexts["base"].config
+    assert chains["base"].calls["eth_getTransactionCount"] == 1
+    assert chains["eth"].calls["eth_getTransactionCount"] == 1
+
+
+def test_settings_are_typed_by_default():
+    context = make_context(StandInChain(), "base")
+    assert context.setting("AMOUNT0", 0.0) == 0.5
+    assert context.setting("REBALANCE_BURN", False) is True
+    assert context.setting("RANGE_WIDTH", 100.0) == 100.0
+    assert context.decimals0 == 18 and context.decimals1 == 6
+
+
+def test_mint_amounts_use_pool_decimals():
+    usdc = make_context(StandInChain(), "usdc")
+    dai = make_context(StandInChain(), "dai", DECIMALS1=18)
+    with use_chain(usdc):
+        usdc_params, usdc_value = build_mint_params(WALLET, 2450, 2550, current_price=2500.0)
+    with use_chain(dai):
+        dai_params, dai_value = build_mint_params(WALLET, 2450, 2550, current_price=2500.0)
+
+    # amount0 из настроек профиля, в wei
+    assert usdc_value == dai_value == usdc_params[5] == 5 * 10 ** 17
+    # Тики сдвинуты на 10^12 (около 276324 тиков с точностью до шага 60), количество второго токена
+    # в минимальных единицах — на 10^12 с точностью до округления границ
+    assert abs(dai_params[3] - usdc_params[3] - 276324) <= 60
+    assert abs(dai_params[4] - usdc_params[4] - 276324) <= 60
+    assert 0.9 < dai_params[6] / usdc_params[6] / 10 ** 12 < 1.1
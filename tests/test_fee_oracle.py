@@ -0,0 +1,61 @@
+import pytest
+from web3 import Web3
+from web3.exceptions import Web3RPCError
+from benchmarks.chain_standin import StandInChain, StandInProvider
+from utils.fee_oracle import FeeOracle
+from utils.rpc_pool import RpcPool
+
+GWEI = 10 ** 9
+
+
+class FlakyProvider(StandInProvider):
+    """Провайдер, у которого запросы истории комиссий не доходят до узла."""
+
+    def make_request(self, method, params):
+        if method == "eth_feeHistory":
+            raise ConnectionError("Соединение сброшено")
+        return super().make_request(method, params)
+
+
+class NoFeeHistoryChain(StandInChain):
+    """Узел без eth_feeHistory."""
+
+    def handle(self, method, params):
+        if method == "eth_feeHistory":
+            raise ValueError("unsupported")
+        return super().handle(method, params)
+
+
+def make_web3(chain, provider=StandInProvider):
+    return Web3(RpcPool(["standin"], provider_factory=lambda url: provider(chain), read_cache=False))
+
+
+def test_eip1559_fees_shared_within_ttl():
+    chain = StandInChain(base_fee_gwei=10)
+    web3 = make_web3(chain)
+    oracle = FeeOracle(base_multiplier=2, ttl=60)
+    fees = oracle.get_fee_params(web3)
+    assert fees == {"maxFeePerGas": 21 * GWEI, "maxPriorityFeePerGas": GWEI}
+    assert oracle.get_fee_params(web3) == fees
+    assert chain.calls["eth_feeHistory"] == 1
+    oracle.invalidate()
+    oracle.get_fee_params(web3)
+    assert chain.calls["eth_feeHistory"] == 2
+
+
+def test_max_fee_caps_priority():
+    web3 = make_web3(StandInChain(base_fee_gwei=10))
+    fees = FeeOracle(max_fee=GWEI // 2).get_fee_params(web3)
+    assert fees == {"maxFeePerGas": GWEI // 2, "maxPriorityFeePerGas": GWEI // 2}
+
+
+def test_legacy_gas_price_without_base_fee():
+    web3 = make_web3(StandInChain(base_fee_gwei=0))
+    assert set(FeeOracle().get_fee_params(web3)) == {"gasPrice"}
+
+
+def test_rpc_error_is_not_treated_as_legacy_chain():
+    with pytest.raises(Web3RPCError):
+        FeeOracle().get_fee_params(make_web3(NoFeeHistoryChain()))
+    with pytest.raises(ConnectionError):
+        FeeOracle().get_fee_params(make_web3(StandInChain(), FlakyProvider))
@@ -0,0 +1,47 @@
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Импорт выполняется в отдельном процессе: в процессе тестов модули уже могут быть импортированы
+SCRIPT = """
+import importlib, pkgutil, socket
+
+attempts = []
+
+def blocked(*args, **kwargs):
+    attempts.append(args)
+    raise OSError("RPC недоступен")
+
+socket.socket.connect = blocked
+socket.create_connection = blocked
+socket.getaddrinfo = blocked
+
+import utils
+for module in pkgutil.iter_modules(utils.__path__):
+    importlib.import_module("utils." + module.name)
+import main
+print(len(attempts))
+"""
+
+
+def test_import_without_rpc(tmp_path):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop("CHAIN", None)
+    result = subprocess.run([sys.executable, "-c", SCRIPT], cwd=tmp_path, env=env, capture_output=True, text=True,
+                            timeout=120)
+    assert result.returncode == 0, result.stderr
+    # Ни одной попытки соединения и ни одного файла (настроек, логов, баз) при импорте
+    assert result.stdout.split()[-1] == "0"
+    assert os.listdir(tmp_path) == []
+
+
+def test_get_web3_without_rpc(monkeypatch):
+    from utils import blockchain, chain_context, select_chain
+    # Сеть заблокирована фикстурой no_network: все RPC недоступны
+    monkeypatch.setattr(chain_context.time, "sleep", lambda seconds: None)
+    context = chain_context.ChainContext(dict(select_chain.CHAIN_PROFILES["Base"]), "Base")
+    with chain_context.use_chain(context), pytest.raises(ConnectionError):
+        blockchain.get_web3()
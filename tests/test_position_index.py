@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+import pytest
+from web3.exceptions import Web3RPCError
+from utils.position_index import PositionIndex, is_range_too_large
+from utils.retry_decorator import DeadlineExceeded
+
+POSITION_MANAGER = "0x03a520b32C04BF3bEEf7BEb72E919cf822Ed34f1"
+
+
+class LogsNode:
+    """eth_getLogs с ограничением диапазона блоков, как у публичных RPC."""
+
+    def __init__(self, max_range, error=None):
+        self.max_range = max_range
+        self.error = error
+        self.requests = []
+
+    def get_logs(self, params):
+        self.requests.append(params)
+        if self.error is not None:
+            raise self.error
+        if params["toBlock"] - params["fromBlock"] + 1 > self.max_range:
+            raise Web3RPCError("{'code': -32000, 'message': 'block range is too wide'}")
+        return []
+
+
+def make_index(tmp_path):
+    return PositionIndex(POSITION_MANAGER, db_path=str(tmp_path / "positions.db"), start_block=0)
+
+
+def test_range_shrinks_on_range_error(tmp_path):
+    index = make_index(tmp_path)
+    node = LogsNode(max_range=1_000)
+    web3 = SimpleNamespace(eth=node)
+    ranges = [(start, end) for start, end, _ in index._get_logs(web3, [["0x01"], ["0x02"]], 0, 9_999)]
+    assert ranges[0][0] == 0 and ranges[-1][1] == 9_999
+    assert all(end - start + 1 <= 1_000 for start, end in ranges)
+    # Оба фильтра читаются на одних и тех же диапазонах
+    answered = [(r["fromBlock"], r["toBlock"]) for r in node.requests if r["toBlock"] - r["fromBlock"] < 1_000]
+    assert len(answered) == 2 * len(ranges)
+
+
+@pytest.mark.parametrize("error", [ConnectionError("connection reset"), DeadlineExceeded("Лимит времени исчерпан")])
+def test_other_errors_surface_without_shrinking(tmp_path, error):
+    index = make_index(tmp_path)
+    chunk_size = index.chunk_size
+    node = LogsNode(max_range=10 ** 9, error=error)
+    with pytest.raises(type(error)):
+        list(index._get_logs(SimpleNamespace(eth=node), [["0x01"]], 0, 9_999))
+    assert index.chunk_size == chunk_size
+    assert len(node.requests) == 1
+
+
+def test_is_range_too_large():
+    wrapped = ConnectionError("Не удалось выполнить запрос")
+    wrapped.__cause__ = Web3RPCError("query returned more than 10000 results")
+    assert is_range_too_large(wrapped)
+    assert not is_range_too_large(ConnectionError("connection reset"))
@@ -0,0 +1,86 @@
+import pytest
+from web3 import Web3
+from benchmarks.chain_standin import StandInChain, StandInProvider, AGGREGATOR_ADDRESS
+from utils import rpc_pool
+from utils.price_watcher import PriceWatcher, decode_answer, ANSWER_UPDATED_TOPIC
+from utils.rpc_pool import CircuitBreaker, RpcPool
+
+FEED_ADDRESS = "0x71041dddad3595F9CEd3DcCFBe3D1F4b0a16Bb70"
+
+
+def make_watcher(chain):
+    web3 = Web3(RpcPool(["standin"], provider_factory=lambda url: StandInProvider(chain)))
+    return PriceWatcher(web3, FEED_ADDRESS, ws_url=None, poll_interval=0.01)
+
+
+def test_filter_mode_reports_price_updates():
+    chain = StandInChain(price=2500.0)
+    watcher = make_watcher(chain)
+    assert watcher.start() == "filter"
+    assert watcher.last_price == 2500.0
+    assert watcher.wait_for_update(0.05) is None
+
+    chain.update_price(2612.5)
+    assert watcher.wait_for_update(1) == 2612.5
+    # Фильтр следит за агрегатором, а не за прокси
+    params = next(iter(chain.filters.values()))["params"]
+    assert AGGREGATOR_ADDRESS in (params["address"] if isinstance(params["address"], list) else [params["address"]])
+
+
+def test_filter_recreated_after_node_drops_it():
+    chain = StandInChain(price=2500.0)
+    watcher = make_watcher(chain)
+    watcher.start()
+    chain.filters.clear()
+    assert watcher.wait_for_update(0.05) is None
+    assert len(chain.filters) == 1
+
+    chain.update_price(2400.0)
+    assert watcher.wait_for_update(1) == 2400.0
+
+
+def test_update_during_filter_loss_is_not_missed():
+    chain = StandInChain(price=2500.0)
+    watcher = make_watcher(chain)
+    watcher.start()
+    chain.filters.clear()
+    chain.update_price(2450.0)
+    # Событие ушло в удалённый фильтр, но цена прочитана при его пересоздании
+    assert watcher.wait_for_update(1) == 2450.0
+
+
+def test_filter_mode_with_several_rpcs(monkeypatch):
+    monkeypatch.setattr(rpc_pool, "RPC_EXPLORE_RATE", 0.5)
+    chain = StandInChain(price=2500.0)
+    # Каждый RPC — отдельный узел со своими фильтрами
+    providers = {f"http://node{i}": StandInProvider(chain, own_filters=True) for i in range(3)}
+    web3 = Web3(RpcPool(list(providers), provider_factory=providers.__getitem__))
+    watcher = PriceWatcher(web3, FEED_ADDRESS, ws_url=None, poll_interval=0.01)
+    assert watcher.start() == "filter"
+
+    for price in (2510.0, 2490.0, 2530.0, 2470.0):
+        chain.update_price(price)
+        assert watcher.wait_for_update(1) == price
+    # Фильтр создан один раз и не пересоздавался
+    assert sum(len(provider.filters) for provider in providers.values()) == 1
+    assert all(endpoint.breaker.state == CircuitBreaker.CLOSED for endpoint in web3.provider.endpoints)
+
+
+def test_block_mode_without_filters():
+    chain = StandInChain(price=2500.0, filters=False)
+    watcher = make_watcher(chain)
+    assert watcher.start() == "blocks"
+
+    chain.update_price(2550.0)
+    assert watcher.wait_for_update(1) == 2550.0
+    # Новый блок без изменения цены не считается обновлением
+    chain.update_price(2550.0)
+    assert watcher.wait_for_update(0.05) is None
+
+
+@pytest.mark.parametrize("price", [2500.0, -1.5])
+def test_decode_answer(price):
+    raw = int(price * 10 ** 8).to_bytes(32, "big", signed=True)
+    log = {"topics": [ANSWER_UPDATED_TOPIC, "0x" + raw.hex()]}
+    assert decode_answer(log) == price
+    assert decode_answer({"topics": [bytes.fromhex(ANSWER_UPDATED_TOPIC[2:]), raw]}) == price
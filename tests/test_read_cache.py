@@ -0,0 +1,80 @@
+import threading
+import pytest
+from web3 import Web3
+from benchmarks.chain_standin import StandInChain, StandInProvider
+from utils import rpc_pool
+from utils.price_watcher import FEED_ABI
+from utils.read_cache import BlockReadCache
+from utils.retry_decorator import DeadlineExceeded, deadline
+from utils.rpc_pool import CircuitBreaker, RpcPool
+
+CALL = {"to": "0x" + "11" * 20, "data": "0x"}
+
+
+def test_latest_call_is_pinned_to_cached_block():
+    cache = BlockReadCache(lambda: 42, block_ttl=60)
+    sent = []
+    send = lambda method, params: sent.append(params) or {"result": "0x01"}
+    assert cache.request("eth_call", [CALL, "latest"], send) == {"result": "0x01"}
+    assert cache.request("eth_call", [CALL, "latest"], send) == {"result": "0x01"}
+    assert sent == [[CALL, hex(42)]]
+    cache.request("eth_getBlockByNumber", ["latest", False], send)
+    assert sent[-1] == [hex(42), False]
+
+
+def test_unknown_pinned_block_falls_back_to_latest():
+    cache = BlockReadCache(lambda: 42, block_ttl=60)
+    sent = []
+
+    def lagging_send(method, params):
+        sent.append(params)
+        if params[-1] == hex(42):
+            return {"error": {"code": -32000, "message": "header not found"}}
+        return {"result": "0x01"}
+
+    assert cache.request("eth_call", [CALL, "latest"], lagging_send) == {"result": "0x01"}
+    assert sent == [[CALL, hex(42)], [CALL, "latest"]]
+    # Ответ отстающего RPC не кэшируется под номером блока, которого у него нет
+    assert cache.stats()["entries"] == 0
+
+
+def test_lagging_rpc_serves_pinned_reads(monkeypatch):
+    # Номер блока и чтение часто приходят с разных RPC
+    monkeypatch.setattr(rpc_pool, "RPC_EXPLORE_RATE", 0.5)
+    chain = StandInChain(price=2500.0)
+    providers = {"http://fresh": StandInProvider(chain), "http://lagging": StandInProvider(chain, lag=1)}
+    pool = RpcPool(list(providers), provider_factory=providers.__getitem__, batch_interval=0)
+    pool.read_cache.block_ttl = 0
+    web3 = Web3(pool)
+    feed = web3.eth.contract(address="0x71041dddad3595F9CEd3DcCFBe3D1F4b0a16Bb70", abi=FEED_ABI)
+
+    for step in range(60):
+        chain.update_price(2500.0 + step)
+        # Номер блока от отстающего RPC даёт ответ предыдущего блока, но не ошибку
+        assert feed.functions.latestAnswer().call() in ((2500 + step) * 10 ** 8, (2499 + step) * 10 ** 8)
+        assert web3.eth.get_block("latest")["number"] >= chain.block_number - 1
+    assert providers["http://lagging"].unknown_blocks > 0
+    # Отставание RPC не считается его ошибкой
+    assert all(endpoint.breaker.state == CircuitBreaker.CLOSED and endpoint.error_rate == 0
+               for endpoint in pool.endpoints)
+
+
+def test_waiter_respects_deadline():
+    cache = BlockReadCache(lambda: 1, block_ttl=60)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_send(method, params):
+        started.set()
+        release.wait(5)
+        return {"result": "0x"}
+
+    owner = threading.Thread(target=cache.request, args=("eth_call", [CALL, "latest"], slow_send))
+    owner.start()
+    started.wait(5)
+    try:
+        with deadline(0.05), pytest.raises(DeadlineExceeded):
+            cache.request("eth_call", [CALL, "latest"], slow_send)
+    finally:
+        release.set()
+        owner.join()
@@ -0,0 +1,151 @@
+import os
+import time
+import pytest
+import rlp
+from eth_account import Account
+from web3 import Web3
+from benchmarks.chain_standin import StandInChain, StandInProvider
+from utils.chain_context import ChainContext
+from utils.fee_oracle import FeeOracle
+from utils.receipt_tracker import ReceiptTracker, TransactionFailedError
+from utils.select_chain import CHAIN_PROFILES
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACCOUNT = Account.from_key("0x" + "42" * 32)
+GWEI = 10 ** 9
+
+
+@pytest.fixture(autouse=True)
+def in_tmp_path(monkeypatch, tmp_path):
+    # Логи бота пишутся в текущую папку, а ABI читаются по путям относительно корня репозитория
+    (tmp_path / "utils").symlink_to(os.path.join(ROOT, "utils"))
+    monkeypatch.chdir(tmp_path)
+
+
+class MempoolProvider(StandInProvider):
+    """Узел, который не включает в блок транзакции с maxFeePerGas ниже рыночной, пока их не отпустят."""
+
+    def __init__(self, chain, min_fee=0):
+        super().__init__(chain)
+        self.min_fee = min_fee
+        self.mempool = []
+        self.batches = []
+
+    def make_request(self, method, params):
+        if method == "eth_sendRawTransaction":
+            raw = bytes.fromhex(params[0][2:])
+            # Поля транзакции EIP-1559: chainId, nonce, maxPriorityFeePerGas, maxFeePerGas, ...
+            if int.from_bytes(rlp.decode(raw[1:])[3], "big") < self.min_fee:
+                self.mempool.append(params[0])
+                return {"jsonrpc": "2.0", "id": 0, "result": Web3.keccak(raw).to_0x_hex()}
+        return super().make_request(method, params)
+
+    def make_batch_request(self, batch_requests):
+        self.batches.append(len(batch_requests))
+        return super().make_batch_request(batch_requests)
+
+    def release(self):
+        # Все транзакции мемпула включаются в блоки разом, опрос квитанций видит их одновременно
+        with self.chain._lock:
+            for raw in self.mempool:
+                self.chain.send_raw_transaction(raw)
+            self.mempool.clear()
+
+
+def send(web3, nonce, max_fee=15 * GWEI):
+    transaction = {"to": "0x" + "11" * 20, "value": 0, "gas": 21_000, "nonce": nonce, "chainId": 1, "data": "0x",
+                   "maxFeePerGas": max_fee, "maxPriorityFeePerGas": GWEI}
+    signed = web3.eth.account.sign_transaction(transaction, ACCOUNT.key)
+    return web3.eth.send_raw_transaction(signed.raw_transaction).to_0x_hex(), transaction
+
+
+def make_tracker(provider, **kwargs):
+    config = {key: value for key, value in CHAIN_PROFILES["Base"].items() if not key.startswith("RPC_URL_")}
+    web3 = ChainContext(dict(config, RPC_URL_1="http://node"), "base", provider_factory=lambda url: provider).web3()
+    options = dict(poll_interval=0.01, timeout=5, speedup_after=0, fee_oracle=FeeOracle(ttl=0))
+    options.update(kwargs)
+    return web3, ReceiptTracker(web3, **options)
+
+
+def test_receipts_are_polled_in_batches():
+    chain = StandInChain()
+    provider = MempoolProvider(chain, min_fee=100 * GWEI)
+    web3, tracker = make_tracker(provider, batch_size=2)
+    hashes = [send(web3, nonce)[0] for nonce in range(5)]
+    for tx_hash in hashes:
+        tracker.track(tx_hash, ACCOUNT.address)
+    time.sleep(0.05)
+    provider.release()
+    receipts = tracker.wait(hashes, 5)
+    assert [receipt["transactionHash"] for receipt in receipts] == hashes
+    assert all(receipt["status"] == 1 for receipt in receipts)
+    # Последний опрос получил все 5 квитанций тремя пакетами по batch_size
+    assert provider.batches[-3:] == [2, 2, 1]
+    assert max(provider.batches) == 2
+    assert tracker.stats()["confirmed"] == 5
+
+
+def test_reverted_transaction_fails_wait():
+    chain = StandInChain()
+    web3, tracker = make_tracker(MempoolProvider(chain))
+    ok_hash, _ = send(web3, 0)
+    failed_hash, _ = send(web3, 1)
+    chain.receipts[failed_hash]["status"] = "0x0"
+    tracker.track(ok_hash, ACCOUNT.address)
+    future = tracker.track(failed_hash, ACCOUNT.address)
+    with pytest.raises(TransactionFailedError):
+        tracker.wait([ok_hash, failed_hash], 5)
+    # Квитанция с ошибкой доступна через Future
+    assert future.result(0)["status"] == 0
+    assert tracker.wait([ok_hash], 5)[0]["status"] == 1
+
+
+def test_untracked_and_lost_transactions():
+    chain = StandInChain()
+    web3, tracker = make_tracker(MempoolProvider(chain, min_fee=100 * GWEI), timeout=0.2)
+    with pytest.raises(ValueError):
+        tracker.wait(["0x" + "00" * 32])
+    tx_hash, _ = send(web3, 0)
+    tracker.track(tx_hash, ACCOUNT.address)
+    # Транзакция так и не включена: трекер завершает её по своему timeout, раньше ожидания wait
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        tracker.wait([tx_hash], 5)
+    assert time.monotonic() - started < 2
+    tx_hash, _ = send(web3, 1)
+    tracker.track(tx_hash, ACCOUNT.address)
+    with pytest.raises(TimeoutError):
+        tracker.wait([tx_hash], 0.05)
+
+
+def test_stuck_transaction_is_replaced_at_the_same_nonce():
+    chain = StandInChain()
+    # Рынок требует 20 gwei, исходная транзакция отправлена с 15 gwei и зависает
+    provider = MempoolProvider(chain, min_fee=20 * GWEI)
+    web3, tracker = make_tracker(provider, speedup_after=0.05, fee_oracle=FeeOracle(ttl=0, max_fee=25 * GWEI))
+    tx_hash, transaction = send(web3, 0)
+    tracker.track(tx_hash, ACCOUNT.address, ACCOUNT.key, transaction)
+    receipt, = tracker.wait([tx_hash], 5)
+    replacement = receipt["transactionHash"]
+    assert replacement != tx_hash
+    assert tracker.future(replacement) is tracker.future(tx_hash)
+    # Включена одна транзакция с тем же nonce, комиссия повышена в пределах FEE_MAX_FEE_WEI
+    assert chain.nonces[ACCOUNT.address.lower()] == 1
+    assert 20 * GWEI <= tracker._by_hash[replacement].transaction["maxFeePerGas"] <= 25 * GWEI
+    # Исходная транзакция из мемпула уже не может быть включена
+    with pytest.raises(ValueError, match="nonce too low"):
+        provider.release()
+
+
+def test_speedup_stops_at_max_fee():
+    chain = StandInChain()
+    provider = MempoolProvider(chain, min_fee=20 * GWEI)
+    web3, tracker = make_tracker(provider, timeout=0.5, speedup_after=0.05,
+                                 fee_oracle=FeeOracle(ttl=0, max_fee=15 * GWEI))
+    tx_hash, transaction = send(web3, 0)
+    tracker.track(tx_hash, ACCOUNT.address, ACCOUNT.key, transaction)
+    with pytest.raises(TimeoutError):
+        tracker.wait([tx_hash], 5)
+    # Повысить комиссию без превышения ограничения нельзя: замена не отправлялась
+    assert len(provider.mempool) == 1
+    assert chain.nonces[ACCOUNT.address.lower()] == 0
@@ -0,0 +1,172 @@
+import time
+import pytest
+import requests
+from web3.exceptions import ContractLogicError, Web3RPCError
+from utils.errors import BroadcastUnknownError, PreflightError
+from utils.retry_decorator import (DeadlineExceeded, PERMANENT, RATE_LIMITED, RateLimitError, SEND_ACCEPTED,
+                                   SEND_NOT_SENT, SEND_UNKNOWN, TRANSIENT, backoff, check_deadline, classify_error,
+                                   classify_send_error, deadline, remaining, retry_on_exception)
+from utils.rpc_pool import CircuitOpenError
+
+
+def _rpc_error(code, message):
+    return Web3RPCError(message, rpc_response={"jsonrpc": "2.0", "id": 1, "error": {"code": code, "message": message}})
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def _wrapped(error):
+    try:
+        raise error
+    except Exception as cause:
+        wrapper = ConnectionError(f"Не удалось выполнить запрос ни на одном из RPC узлов: {cause}")
+        wrapper.__cause__ = cause
+        return wrapper
+
+
+def _connection_refused():
+    try:
+        requests.post("http://127.0.0.1:9", timeout=1)
+    except requests.ConnectionError as e:
+        return e
+    pytest.skip("порт 9 неожиданно принимает соединения")
+
+
+@pytest.mark.parametrize("error, expected", [
+    (requests.ReadTimeout("read timed out"), TRANSIENT),
+    (requests.ConnectionError("connection aborted"), TRANSIENT),
+    (_rpc_error(-32000, "header not found"), TRANSIENT),
+    (_http_error(502), TRANSIENT),
+    (_http_error(429), RATE_LIMITED),
+    (_rpc_error(-32005, "daily request count exceeded, request rate limited"), RATE_LIMITED),
+    (RateLimitError("лимит"), RATE_LIMITED),
+    (ContractLogicError("execution reverted: STF"), PERMANENT),
+    (PreflightError("execution reverted"), PERMANENT),
+    (_rpc_error(-32000, "insufficient funds for gas * price + value"), PERMANENT),
+    (ValueError("неверный адрес"), PERMANENT),
+    (DeadlineExceeded("срок истёк"), PERMANENT),
+    (BroadcastUnknownError("ответ потерян"), PERMANENT),
+    # Обёртка классифицируется по исходной ошибке
+    (_wrapped(requests.ReadTimeout("read timed out")), TRANSIENT),
+    (_wrapped(ContractLogicError("execution reverted")), PERMANENT),
+])
+def test_classify_error(error, expected):
+    assert classify_error(error) == expected
+
+
+@pytest.mark.parametrize("error, expected", [
+    (_rpc_error(-32000, "already known"), SEND_ACCEPTED),
+    (_rpc_error(-32000, "nonce too low: next nonce 5, tx nonce 4"), SEND_ACCEPTED),
+    (_rpc_error(-32000, "replacement transaction underpriced"), SEND_ACCEPTED),
+    (_rpc_error(-32000, "insufficient funds for gas * price + value"), SEND_NOT_SENT),
+    (_rpc_error(-32005, "rate limited"), SEND_NOT_SENT),
+    (_http_error(429), SEND_NOT_SENT),
+    (CircuitOpenError("все RPC исключены"), SEND_NOT_SENT),
+    (DeadlineExceeded("срок истёк"), SEND_NOT_SENT),
+    # Запрос мог дойти до узла: ответ потерян или узел не смог ответить
+    (requests.ReadTimeout("read timed out"), SEND_UNKNOWN),
+    (requests.ConnectionError("Connection aborted: RemoteDisconnected"), SEND_UNKNOWN),
+    (_http_error(502), SEND_UNKNOWN),
+    (_rpc_error(-32603, "internal error"), SEND_UNKNOWN),
+    (_wrapped(requests.ReadTimeout("read timed out")), SEND_UNKNOWN),
+    (_wrapped(_rpc_error(-32000, "already known")), SEND_ACCEPTED),
+])
+def test_classify_send_error(error, expected):
+    assert classify_send_error(error) == expected
+
+
+def test_refused_connection_is_not_sent():
+    error = _connection_refused()
+    assert classify_send_error(error) == SEND_NOT_SENT
+    assert classify_send_error(_wrapped(error)) == SEND_NOT_SENT
+    assert classify_error(error) == TRANSIENT
+
+
+def test_backoff_bounds():
+    for attempt in range(1, 8):
+        assert 0 <= backoff(TRANSIENT, attempt, min_wait=0.5, max_wait=4) <= 4
+        # Половина паузы после превышения лимита фиксирована
+        assert 10 <= backoff(RATE_LIMITED, attempt, min_wait=20, max_wait=20) <= 20
+    assert backoff(TRANSIENT, 1, retry_after=7) == 7
+
+
+def test_transient_errors_are_retried_and_permanent_are_not():
+    calls = []
+
+    @retry_on_exception(max_attempts=3, min_wait=0.001, max_wait=0.001)
+    def flaky(error):
+        calls.append(error)
+        raise error
+
+    with pytest.raises(requests.ReadTimeout):
+        flaky(requests.ReadTimeout("read timed out"))
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(ContractLogicError):
+        flaky(ContractLogicError("execution reverted"))
+    assert len(calls) == 1
+
+
+def test_nested_calls_share_one_retry_loop():
+    inner_calls = []
+
+    @retry_on_exception(max_attempts=3, min_wait=0.001, max_wait=0.001)
+    def inner():
+        inner_calls.append(1)
+        raise requests.ReadTimeout("read timed out")
+
+    @retry_on_exception(max_attempts=3, min_wait=0.001, max_wait=0.001)
+    def outer():
+        return inner()
+
+    with pytest.raises(requests.ReadTimeout):
+        outer()
+    # Повторяет только внешний вызов: 3 попытки, а не 3 x 3
+    assert len(inner_calls) == 3
+
+
+def test_retries_stop_at_budget():
+    calls = []
+
+    @retry_on_exception(max_attempts=100, min_wait=0.2, max_wait=0.2, budget=0.5)
+    def always_fails():
+        calls.append(time.monotonic())
+        raise RateLimitError("лимит", retry_after=0.2)
+
+    started = time.monotonic()
+    with pytest.raises(RateLimitError):
+        always_fails()
+    # Пауза, не укладывающаяся в оставшийся срок, не выполняется
+    assert time.monotonic() - started < 0.5
+    assert 1 < len(calls) < 5
+
+
+def test_nested_deadline_cannot_extend_outer():
+    with deadline(0.2):
+        with deadline(10):
+            assert remaining() <= 0.2
+        assert remaining(0.05) == 0.05
+        time.sleep(0.25)
+        assert remaining() == 0
+        with pytest.raises(DeadlineExceeded):
+            check_deadline()
+    assert remaining() is None
+    assert remaining(3) == 3
+
+
+def test_expired_deadline_skips_decorated_call():
+    calls = []
+
+    @retry_on_exception()
+    def read():
+        calls.append(1)
+
+    with deadline(0):
+        with pytest.raises(DeadlineExceeded):
+            read()
+    assert calls == []
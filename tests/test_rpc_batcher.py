@@ -0,0 +1,32 @@
+import threading
+from web3 import Web3
+from benchmarks.chain_standin import StandInChain, StandInProvider
+from utils.metrics import instrumented, metrics
+from utils.rpc_pool import RpcPool
+
+
+def test_batched_reads_keep_method_and_operation():
+    chain = StandInChain()
+    web3 = Web3(RpcPool(["standin"], provider_factory=lambda url: StandInProvider(chain, latency=0.05),
+                        read_cache=False, batch_interval=0.02))
+    results = []
+    addresses = [Web3.to_checksum_address(f"0x{i:040x}") for i in range(1, 9)]
+
+    @instrumented
+    def read_nonce_for_test(address):
+        return results.append(web3.eth.get_transaction_count(address))
+
+    threads = [threading.Thread(target=read_nonce_for_test, args=(address,)) for address in addresses]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [0] * len(addresses)
+    batcher = web3.provider.batcher
+    assert batcher.batches < batcher.requests
+    with metrics._lock:
+        counts = {key: series.count for key, series in metrics._series.items()}
+    assert sum(count for (method, _, operation), count in counts.items()
+               if operation == "read_nonce_for_test") == len(addresses)
+    assert all(method == "eth_getTransactionCount" for (method, _, operation) in counts if operation == "read_nonce_for_test")
@@ -0,0 +1,87 @@
+import pytest
+from web3 import Web3
+from benchmarks.chain_standin import StandInChain, StandInProvider, AGGREGATOR_ADDRESS
+from utils import rpc_pool
+from utils.price_watcher import ANSWER_UPDATED_TOPIC
+from utils.rpc_pool import CircuitBreaker, RpcPool, RPC_TIMEOUT
+
+
+def make_nodes(chain, count, **kwargs):
+    """Пул из нескольких узлов одной сети, каждый со своими фильтрами."""
+    providers = {f"http://node{i}": StandInProvider(chain, own_filters=True) for i in range(count)}
+    return RpcPool(list(providers), provider_factory=providers.__getitem__, **kwargs), providers
+
+
+def test_opens_after_consecutive_errors():
+    breaker = CircuitBreaker(threshold=3, cooldown=10, max_cooldown=40)
+    breaker.record_failure(0)
+    breaker.record_failure(0)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow(0)
+    breaker.record_failure(0)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow(5)
+    assert breaker.retry_after(5) == 5
+
+
+def test_success_resets_error_count():
+    breaker = CircuitBreaker(threshold=2, cooldown=10, max_cooldown=40)
+    breaker.record_failure(0)
+    breaker.record_success()
+    breaker.record_failure(0)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_one_probe():
+    breaker = CircuitBreaker(threshold=1, cooldown=10, max_cooldown=40)
+    breaker.record_failure(0)
+    assert breaker.allow(10)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Пока пробный запрос выполняется, остальные запросы не пропускаются
+    assert not breaker.allow(10.5)
+    # Зависший пробный запрос перестаёт блокировать RPC после таймаута
+    assert breaker.allow(10 + RPC_TIMEOUT + 1)
+
+
+def test_failed_probe_doubles_cooldown_up_to_max():
+    breaker = CircuitBreaker(threshold=1, cooldown=10, max_cooldown=25)
+    breaker.record_failure(0)
+    now = 0
+    for expected in (20, 25, 25):
+        now = breaker.open_until
+        assert breaker.allow(now)
+        breaker.record_failure(now)
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.open_until - now == expected
+
+    assert breaker.allow(breaker.open_until)
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.cooldown == 10
+
+
+def test_rate_limit_opens_immediately_for_requested_pause():
+    breaker = CircuitBreaker(threshold=3, cooldown=10, max_cooldown=40)
+    breaker.record_failure(0, rate_limited=True, retry_after=30)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow(29) and breaker.allow(30)
+
+
+def test_filter_requests_go_to_the_node_that_created_the_filter(monkeypatch):
+    # Каждый запрос уходит не на лучший RPC, а на «случайный» (для обновления статистики)
+    monkeypatch.setattr(rpc_pool, "RPC_EXPLORE_RATE", 1.0)
+    chain = StandInChain()
+    pool, providers = make_nodes(chain, 3)
+    web3 = Web3(pool)
+    log_filter = web3.eth.filter({"address": AGGREGATOR_ADDRESS, "topics": [ANSWER_UPDATED_TOPIC]})
+    owner = next(p for p in providers.values() if p.filters)
+
+    for price in (2510.0, 2520.0, 2530.0):
+        chain.update_price(price)
+        assert len(log_filter.get_new_entries()) == 1
+        web3.eth.block_number
+    assert web3.eth.uninstall_filter(log_filter.filter_id)
+    assert owner.filters == {}
+    assert all(endpoint.breaker.state == CircuitBreaker.CLOSED and endpoint.error_rate == 0
+               for endpoint in pool.endpoints)
+    # Удалённый фильтр пулу больше не известен
+    with pytest.raises(ValueError):
+        log_filter.get_new_entries()
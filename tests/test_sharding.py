@@ -0,0 +1,116 @@
+import json
+import multiprocessing
+import os
+import sys
+import time
+import types
+from collections import Counter
+from utils import sharding
+from utils.sharding import LeaseManager, shard_env, shard_of, shard_wallets
+
+# fork: процессам-участникам не нужно заново импортировать модули теста
+CONTEXT = multiprocessing.get_context("fork")
+
+
+def _addresses(count):
+    return [f"0x{i:040x}" for i in range(count)]
+
+
+def _acquire_one(shard_dir, shard_count, owner, results):
+    results.put((owner, LeaseManager(shard_dir, owner=owner, ttl=60).acquire_any(shard_count)))
+
+
+def _worker_with_idle_main(shard_dir, ttl):
+    def idle_main(argv=None, password=None):
+        with open(os.path.join(shard_dir, "argv.json"), "w") as argv_file:
+            json.dump(argv, argv_file)
+        time.sleep(60)
+
+    # Основной цикл бота не нужен: проверяется только аренда шарда
+    sys.modules["main"] = types.SimpleNamespace(main=idle_main)
+    sharding.run_worker(1, shard_dir, argv=["--chain", "base", "--config", "config.json"], ttl=ttl)
+
+
+def _wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_shard_of_is_stable_and_balanced():
+    addresses = _addresses(4000)
+    shards = [shard_of(address, 4) for address in addresses]
+    # Номер шарда не зависит от регистра адреса и процесса
+    assert shards == [shard_of(address.upper().replace("0X", "0x"), 4) for address in addresses]
+    counts = Counter(shards)
+    assert set(counts) == {0, 1, 2, 3}
+    assert all(800 < count < 1200 for count in counts.values())
+
+    wallets = [(address, "key") for address in addresses]
+    parts = [shard_wallets(wallets, shard, 4) for shard in range(4)]
+    assert sorted(pair for part in parts for pair in part) == sorted(wallets)
+
+
+def test_lease_expires_and_is_taken_over(tmp_path):
+    first = LeaseManager(str(tmp_path), owner="first", ttl=0.5)
+    second = LeaseManager(str(tmp_path), owner="second", ttl=0.5)
+    assert first.acquire(0)
+    assert not second.acquire(0)
+    assert second.acquire_any(2) == 1
+    assert first.renew(0)
+
+    time.sleep(0.6)
+    # Аренда не продлена вовремя: шард достаётся резервному процессу, прежний владелец его теряет
+    assert second.acquire(0)
+    assert not first.renew(0)
+    first.release(0)
+    assert not first.acquire(0)
+    second.release(0)
+    assert first.acquire(0)
+
+
+def test_processes_take_distinct_shards(tmp_path):
+    results = CONTEXT.Queue()
+    processes = [CONTEXT.Process(target=_acquire_one, args=(str(tmp_path), 3, f"worker-{i}", results))
+                 for i in range(5)]
+    for process in processes:
+        process.start()
+    acquired = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join(30)
+
+    shards = [shard for _, shard in acquired if shard is not None]
+    # Три шарда у трёх процессов, остальные ждут как резервные
+    assert sorted(shards) == [0, 1, 2]
+    for owner, shard in acquired:
+        if shard is not None:
+            with open(tmp_path / f"lease-{shard}.json") as lease_file:
+                assert json.load(lease_file)["owner"] == owner
+
+
+def test_worker_exits_when_lease_is_lost(tmp_path):
+    shard_dir = str(tmp_path)
+    lease_path = os.path.join(shard_dir, "lease-0.json")
+    worker = CONTEXT.Process(target=_worker_with_idle_main, args=(shard_dir, 0.6))
+    worker.start()
+    try:
+        assert _wait_for(lambda: os.path.exists(os.path.join(shard_dir, "argv.json")))
+        # Каждый шард пишет настройки сети в свой файл
+        with open(os.path.join(shard_dir, "argv.json")) as argv_file:
+            argv = json.load(argv_file)
+        assert argv[-2:] == ["--config", shard_env(0, 1, shard_dir)["CONFIG_PATH"]]
+        assert shard_env(0, 2, shard_dir)["CONFIG_PATH"] != shard_env(1, 2, shard_dir)["CONFIG_PATH"]
+
+        # Шард захвачен другим процессом (например, пока этот не продлевал аренду)
+        with open(lease_path, "w") as lease_file:
+            json.dump({"owner": "other", "expires": time.time() + 60}, lease_file)
+        worker.join(10)
+        assert worker.exitcode == 1
+        with open(lease_path) as lease_file:
+            assert json.load(lease_file)["owner"] == "other"
+    finally:
+        if worker.is_alive():
+            worker.terminate()
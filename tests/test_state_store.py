@@ -0,0 +1,113 @@
+import sqlite3
+import pytest
+from eth_abi import encode
+from utils.position_index import TRANSFER_TOPIC, address_topic, uint_topic
+from utils.state_store import POOL_MINT_TOPIC, ZERO_TOPIC, StateStore, minted_position, minted_token_id
+
+WALLET = "0x" + "ab" * 20
+OTHER = "0x" + "cd" * 20
+POSITION_MANAGER = "0x03a520b32c04bf3beef7beb72e919cf822ed34f1"
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = StateStore(str(tmp_path / "state.db"))
+    yield store
+    store.close()
+
+
+def mint_receipt(owner, token_id, tick_lower, tick_upper, liquidity, block=100, status=1):
+    transfer = {"topics": [TRANSFER_TOPIC, ZERO_TOPIC, address_topic(owner), uint_topic(token_id)], "data": "0x"}
+    mint = {"topics": [POOL_MINT_TOPIC, address_topic(POSITION_MANAGER),
+                       "0x" + encode(["int24"], [tick_lower]).hex(), "0x" + encode(["int24"], [tick_upper]).hex()],
+            "data": "0x" + encode(["address", "uint128", "uint256", "uint256"],
+                                  [POSITION_MANAGER, liquidity, 10, 20]).hex()}
+    return {"status": status, "blockNumber": block, "logs": [transfer, mint]}
+
+
+def chain_state(token_id, tick_lower=0, tick_upper=0, liquidity=0, allowance=2 ** 256 - 1):
+    # Структура positions(): tickLower, tickUpper и liquidity на 5-м, 6-м и 7-м местах
+    position = None if token_id is None else (0, POSITION_MANAGER, "", "", 500, tick_lower, tick_upper, liquidity)
+    return {"allowance": allowance, "token_id": token_id, "position": position, "liquidity": liquidity}
+
+
+def test_minted_token_id_and_position():
+    receipt = mint_receipt(WALLET, 7, -200_010, -199_000, 10 ** 20)
+    assert minted_token_id(receipt, WALLET) == 7
+    assert minted_token_id(receipt, OTHER) is None
+    assert minted_position(receipt, WALLET) == {"token_id": 7, "tick_lower": -200_010, "tick_upper": -199_000,
+                                                "liquidity": 10 ** 20}
+    # Без события Mint известен только ID позиции
+    receipt["logs"].pop()
+    assert minted_position(receipt, WALLET)["tick_lower"] is None
+
+
+def test_reconcile_stores_snapshot_used_on_restart(store):
+    changed = store.reconcile({WALLET: chain_state(5, -200_000, -199_000, 2 ** 130), OTHER: chain_state(None)}, 50)
+    assert sorted(changed) == [WALLET, OTHER]
+    states = store.known_states([WALLET, OTHER])
+    assert states[WALLET]["token_id"] == 5
+    assert states[WALLET]["liquidity"] == 2 ** 130
+    assert states[WALLET]["position"]["tick_lower"] == -200_000
+    assert states[OTHER] == {"allowance": True, "token_id": None, "position": None, "liquidity": 0}
+    # Повторная сверка с тем же ID позиции изменений не находит
+    assert store.reconcile({WALLET: chain_state(5, -200_000, -199_000, 1)}, 60) == []
+
+
+def test_wallet_without_approve_or_with_pending_tx_is_reread(store):
+    store.reconcile({WALLET: chain_state(None, allowance=0), OTHER: chain_state(None)}, 50)
+    store.add_pending(OTHER, "0x01", "add")
+    assert store.known_states([WALLET, OTHER]) == {}
+    store.add_pending(WALLET, "0x02", "approve")
+    store.confirm_tx("0x02", {"status": 1, "blockNumber": 51, "logs": []})
+    # Approve не меняет позицию: снимок остаётся в силе
+    assert list(store.known_states([WALLET, OTHER])) == [WALLET]
+
+
+def test_confirmed_mint_replaces_snapshot(store):
+    store.reconcile({WALLET: chain_state(5, -200_000, -199_000, 100)}, 50)
+    store.add_pending(WALLET, "0x01", "remove")
+    store.add_pending(WALLET, "0x02", "add")
+    store.confirm_tx("0x01", {"status": 1, "blockNumber": 60, "logs": []})
+    assert store.get_wallets()[WALLET]["last_rebalance_block"] == 60
+    store.confirm_tx("0x02", mint_receipt(WALLET, 9, -198_000, -197_000, 300, block=61))
+    assert store.get_pending() == []
+    state = store.known_states([WALLET])[WALLET]
+    assert state["token_id"] == 9
+    assert (state["position"]["tick_lower"], state["position"]["tick_upper"], state["liquidity"]) == \
+           (-198_000, -197_000, 300)
+
+
+def test_confirmed_tx_without_mint_makes_snapshot_stale(store):
+    store.reconcile({WALLET: chain_state(5, -200_000, -199_000, 100)}, 50)
+    store.add_pending(WALLET, "0x01", "remove")
+    store.confirm_tx("0x01", {"status": 1, "blockNumber": 60, "logs": []})
+    # Ликвидность удалена после снимка: кошелёк перечитывается из сети
+    assert store.known_states([WALLET]) == {}
+    store.reconcile({WALLET: chain_state(5, -200_000, -199_000, 0)}, 60)
+    assert store.known_states([WALLET])[WALLET]["liquidity"] == 0
+
+
+def test_failed_or_lost_tx_only_clears_pending(store):
+    store.reconcile({WALLET: chain_state(5, -200_000, -199_000, 100)}, 50)
+    store.add_pending(WALLET, "0x01", "add")
+    store.add_pending(WALLET, "0x02", "add")
+    store.confirm_tx("0x01", mint_receipt(WALLET, 9, -198_000, -197_000, 300, block=61, status=0))
+    store.confirm_tx("0x02", None)
+    assert store.get_pending() == []
+    saved = store.get_wallets()[WALLET]
+    assert (saved["token_id"], saved["last_rebalance_block"]) == (5, None)
+    assert store.known_states([WALLET])[WALLET]["token_id"] == 5
+
+
+def test_old_wallets_table_is_replaced(tmp_path):
+    path = str(tmp_path / "state.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE wallets (address TEXT PRIMARY KEY, range_lower REAL, range_upper REAL, "
+               "token_id INTEGER, last_rebalance_block INTEGER, updated_at REAL)")
+    db.execute("INSERT INTO wallets VALUES (?, 1.0, 2.0, 5, 10, 0)", (WALLET,))
+    db.commit()
+    db.close()
+    store = StateStore(path)
+    assert store.get_wallets() == {}
+    store.close()
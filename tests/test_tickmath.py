@@ -0,0 +1,82 @@
+from math import isqrt
+import numpy as np
+import pytest
+from utils import tickmath
+from utils.tickmath import MIN_TICK, MAX_TICK, MIN_SQRT_RATIO, MAX_SQRT_RATIO
+
+# Значения TickMath.getSqrtRatioAtTick из тестов Uniswap v3-core
+KNOWN_SQRT_RATIOS = [
+    (MIN_TICK, 4295128739),
+    (MIN_TICK + 1, 4295343490),
+    (-100, 78833030112140176575862854579),
+    (-50, 79030349367926598376800521322),
+    (0, 79228162514264337593543950336),
+    (50, 79426470787362580746886972461),
+    (100, 79625275426524748796330556128),
+    (MAX_TICK - 1, 1461373636630004318706518188784493106690254656249),
+    (MAX_TICK, 1461446703485210103287273052203988822378723970342),
+]
+
+
+def encode_price_sqrt(reserve1, reserve0):
+    """Аналог encodePriceSqrt из тестов Uniswap."""
+    return isqrt(reserve1 * 2 ** 192 // reserve0)
+
+
+@pytest.mark.parametrize("tick, sqrt_ratio", KNOWN_SQRT_RATIOS)
+def test_get_sqrt_ratio_at_tick(tick, sqrt_ratio):
+    assert tickmath.get_sqrt_ratio_at_tick(tick) == sqrt_ratio
+
+
+@pytest.mark.parametrize("tick", [MIN_TICK - 1, MAX_TICK + 1])
+def test_get_sqrt_ratio_at_tick_out_of_range(tick):
+    with pytest.raises(ValueError):
+        tickmath.get_sqrt_ratio_at_tick(tick)
+
+
+def test_get_tick_at_sqrt_ratio_bounds():
+    assert tickmath.get_tick_at_sqrt_ratio(MIN_SQRT_RATIO) == MIN_TICK
+    assert tickmath.get_tick_at_sqrt_ratio(MAX_SQRT_RATIO - 1) == MAX_TICK - 1
+    assert tickmath.get_tick_at_sqrt_ratio(2 ** 96) == 0
+    for sqrt_ratio in (MIN_SQRT_RATIO - 1, MAX_SQRT_RATIO):
+        with pytest.raises(ValueError):
+            tickmath.get_tick_at_sqrt_ratio(sqrt_ratio)
+
+
+@pytest.mark.parametrize("tick", [MIN_TICK, -200000, -60, -1, 0, 1, 60, 201234, MAX_TICK - 1])
+def test_tick_round_trip(tick):
+    sqrt_ratio = tickmath.get_sqrt_ratio_at_tick(tick)
+    assert tickmath.get_tick_at_sqrt_ratio(sqrt_ratio) == tick
+    # Тик — наибольший, для которого getSqrtRatioAtTick(tick) <= sqrtPriceX96
+    if tick > MIN_TICK:
+        assert tickmath.get_tick_at_sqrt_ratio(sqrt_ratio - 1) == tick - 1
+
+
+# Значения LiquidityAmounts из тестов Uniswap v3-periphery: диапазон 100/110 – 110/100
+@pytest.mark.parametrize("price, liquidity, amounts", [
+    ((1, 1), 2148, (99, 99)),
+    ((99, 110), 1048, (99, 0)),
+    ((111, 100), 2097, (0, 199)),
+])
+def test_liquidity_amounts(price, liquidity, amounts):
+    sqrt_p = encode_price_sqrt(*price)
+    sqrt_a, sqrt_b = encode_price_sqrt(100, 110), encode_price_sqrt(110, 100)
+    assert tickmath.get_liquidity_for_amounts(sqrt_p, sqrt_a, sqrt_b, 100, 200) == liquidity
+    assert tickmath.get_amounts_for_liquidity(sqrt_p, sqrt_a, sqrt_b, liquidity) == amounts
+
+
+def test_batch_functions_match_exact():
+    prices = [1500.0, 2499.99, 2500.0, 3333.33]
+    ticks = tickmath.prices_to_ticks(prices, 18, 6)
+    assert list(ticks) == [tickmath.price_to_tick(price, 18, 6) for price in prices]
+
+    lower, upper = tickmath.round_ticks(ticks - 7, ticks + 7, fee=3000)
+    assert np.all(lower % 60 == 0) and np.all(upper % 60 == 0)
+    assert np.all(lower <= ticks - 7) and np.all(upper >= ticks + 7)
+
+
+def test_tick_spacing():
+    assert tickmath.get_tick_spacing(500) == 10
+    assert tickmath.get_tick_spacing(3000) == 60
+    with pytest.raises(ValueError):
+        tickmath.get_tick_spacing(1234)
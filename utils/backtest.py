@@ -0,0 +1,195 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from utils.rebalance import range_around, rebalance_triggers
+from utils.select_chain import CHAIN_PROFILES, resolve_chain_name
+from utils import tickmath
+from utils.unimath import FEE
+
+GAS_PER_REBALANCE = 450_000  # collect + decreaseLiquidity + mint
+SCAN_BLOCK = 1024  # Начальный размер блока при поиске следующей ребалансировки
+
+_shared = {}
+
+
+def load_prices(csv_path, price_column="price", volume_column="volume"):
+    """
+    Загружает ряд цен (и, если есть, объёмов торгов в USD) из CSV.
+
+    :param csv_path: Путь к CSV с заголовком.
+    :param price_column: Имя колонки с ценой.
+    :param volume_column: Имя колонки с объёмом (необязательная).
+    :return: Кортеж (prices, volumes или None) в виде массивов NumPy.
+    """
+    prices, volumes = [], []
+    with open(csv_path, newline="") as csv_file:
+        reader = csv.DictReader(csv_file)
+        has_volume = volume_column in (reader.fieldnames or [])
+        for row in reader:
+            prices.append(float(row[price_column]))
+            if has_volume:
+                volumes.append(float(row[volume_column]))
+    return np.asarray(prices, dtype=np.float64), (np.asarray(volumes, dtype=np.float64) if volumes else None)
+
+
+def _next_rebalance(prices, start, low, high):
+    """Находит первый индекс после start, где цена выходит из полосы [low, high], или None."""
+    n = len(prices)
+    block = SCAN_BLOCK
+    i = start + 1
+    while i < n:
+        segment = prices[i:i + block]
+        hits = np.flatnonzero((segment > high) | (segment < low))
+        if hits.size:
+            return i + int(hits[0])
+        i += block
+        block *= 2
+    return None
+
+
+def simulate(prices, range_width, threshold_percent, decimals0, decimals1, amount0=1.0, volumes=None, pool_share=0.0,
+             fee=FEE, gas_per_rebalance=GAS_PER_REBALANCE, gas_price_gwei=10.0):
+    """
+    Прогоняет стратегию ребалансировки по историческому ряду цен.
+
+    Моменты ребалансировок находятся последовательно теми же функциями, что и в основном цикле
+    (rebalance.range_around, rebalance.rebalance_triggers). Затем тики, ликвидность и количества
+    токенов всех позиций считаются векторными функциями tickmath над массивами отрезков целиком.
+
+    :param prices: Массив цен ETH в USD.
+    :param range_width: Ширина диапазона (RANGE_WIDTH).
+    :param threshold_percent: Порог ребалансировки в процентах (THRESHOLD_PERCENT).
+    :param decimals0: Количество знаков token0 пула.
+    :param decimals1: Количество знаков token1 пула.
+    :param amount0: Количество ETH, добавляемое при каждой ребалансировке (AMOUNT0).
+    :param volumes: Массив объёмов торгов пула в USD на каждом шаге или None.
+    :param pool_share: Доля позиции в ликвидности пула, пока цена в диапазоне.
+    :param fee: Комиссия пула.
+    :param gas_per_rebalance: Газ на одну ребалансировку.
+    :param gas_price_gwei: Цена газа в gwei.
+    :return: Словарь с метриками: rebalances, fees_usd, gas_usd, il_usd, net_usd, time_in_range.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    threshold = threshold_percent / 100
+    fee_rate = fee / 1_000_000
+
+    # Начала отрезков (моменты ребалансировок) и диапазоны, выставленные в эти моменты
+    starts, lowers, uppers = [], [], []
+    start = 0
+    while start is not None:
+        range_lower, range_upper = range_around(float(prices[start]), range_width)
+        starts.append(start)
+        lowers.append(range_lower)
+        uppers.append(range_upper)
+        trigger_lower, trigger_upper = rebalance_triggers(range_lower, range_upper, threshold)
+        start = _next_rebalance(prices, start, trigger_lower, trigger_upper)
+    starts = np.asarray(starts)
+    ends = starts[1:]
+    # Цена в конце отрезка: момент следующей ребалансировки или последняя цена ряда
+    stops = np.append(ends, len(prices) - 1)
+
+    # Границы позиций после округления к тикам, как в add_liquidity
+    tick_lower, tick_upper = tickmath.round_ticks(tickmath.prices_to_ticks(lowers, decimals0, decimals1),
+                                                  tickmath.prices_to_ticks(uppers, decimals0, decimals1), fee)
+    price_lower = tickmath.ticks_to_prices(tick_lower, decimals0, decimals1)
+    price_upper = tickmath.ticks_to_prices(tick_upper, decimals0, decimals1)
+    sqrt_a, sqrt_b = tickmath.ticks_to_sqrt_prices(tick_lower), tickmath.ticks_to_sqrt_prices(tick_upper)
+    # Цены и количества в минимальных единицах токенов, как в контракте
+    raw_scale = 10.0 ** (decimals1 - decimals0)
+    sqrt_p = np.sqrt(prices[starts] * raw_scale)
+    # Ликвидность на весь amount0, как в unimath.eth_to_usdc: token1 добавляется сколько потребуется
+    liquidity = tickmath.liquidity_for_amounts(sqrt_p, sqrt_a, sqrt_b, amount0 * 10.0 ** decimals0, np.inf)
+    liquidity = np.where(sqrt_p < sqrt_b, liquidity, 0.0)
+    amount1 = tickmath.amounts_for_liquidity(sqrt_p, sqrt_a, sqrt_b, liquidity)[1] / 10.0 ** decimals1
+
+    # Шаг ребалансировки относится уже к следующему отрезку
+    segment = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(prices))))
+    in_range = (prices >= price_lower[segment]) & (prices <= price_upper[segment])
+    fees_usd = 0.0
+    if volumes is not None and pool_share:
+        fees_usd = float(np.sum(np.asarray(volumes, dtype=np.float64)[in_range])) * fee_rate * pool_share
+
+    # Непостоянные потери: стоимость позиции в конце отрезка против простого удержания токенов
+    final_price = prices[stops]
+    lp0, lp1 = tickmath.amounts_for_liquidity(np.sqrt(final_price * raw_scale), sqrt_a, sqrt_b, liquidity)
+    il_usd = float(np.sum(lp0 / 10.0 ** decimals0 * final_price + lp1 / 10.0 ** decimals1
+                          - (amount0 * final_price + amount1)))
+    gas_usd = float(np.sum(gas_per_rebalance * gas_price_gwei * 1e-9 * prices[ends]))
+
+    return {
+        "rebalances": len(ends),
+        "fees_usd": fees_usd,
+        "gas_usd": gas_usd,
+        "il_usd": il_usd,
+        "net_usd": fees_usd + il_usd - gas_usd,
+        "time_in_range": int(in_range.sum()) / max(len(prices), 1),
+    }
+
+
+def _init_worker(prices, volumes):
+    _shared["prices"] = prices
+    _shared["volumes"] = volumes
+
+
+def _run_point(args):
+    range_width, threshold_percent, kwargs = args
+    result = simulate(_shared["prices"], range_width, threshold_percent, volumes=_shared["volumes"], **kwargs)
+    result.update(range_width=range_width, threshold_percent=threshold_percent)
+    return result
+
+
+def sweep(prices, range_widths, thresholds, volumes=None, workers=None, **kwargs):
+    """
+    Перебирает сетку параметров RANGE_WIDTH x THRESHOLD_PERCENT в пуле процессов.
+
+    :param prices: Массив цен.
+    :param range_widths: Список ширин диапазона.
+    :param thresholds: Список порогов в процентах.
+    :param volumes: Массив объёмов или None.
+    :param workers: Количество процессов (по умолчанию — число ядер).
+    :param kwargs: Дополнительные параметры simulate.
+    :return: Список результатов, отсортированный по net_usd по убыванию.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    grid = [(width, threshold, kwargs) for width, threshold in itertools.product(range_widths, thresholds)]
+    # Ряд цен передаётся в процессы один раз через initializer, а не с каждой задачей
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker,
+                             initargs=(prices, volumes)) as executor:
+        results = list(executor.map(_run_point, grid, chunksize=max(1, len(grid) // (4 * (workers or os.cpu_count())))))
+    return sorted(results, key=lambda r: r["net_usd"], reverse=True)
+
+
+def _parse_list(value):
+    return [float(x) for x in value.split(",") if x]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бэктест стратегии ребалансировки по историческим ценам.")
+    parser.add_argument("csv_path", help="CSV с колонкой price (и необязательной volume)")
+    parser.add_argument("--chain", default=os.getenv("CHAIN", "base"),
+                        help="Сеть, из профиля которой берутся децималы токенов и комиссия пула")
+    parser.add_argument("--widths", type=_parse_list, default=[os.getenv("RANGE_WIDTH", "100")],
+                        help="Ширины диапазона через запятую")
+    parser.add_argument("--thresholds", type=_parse_list, default=[os.getenv("THRESHOLD_PERCENT", "10")],
+                        help="Пороги в процентах через запятую")
+    parser.add_argument("--amount0", type=float, default=float(os.getenv("AMOUNT0", 1)))
+    parser.add_argument("--pool-share", type=float, default=0.0)
+    parser.add_argument("--gas-price-gwei", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    chain_name = resolve_chain_name(args.chain)
+    if chain_name is None:
+        parser.error(f"Неизвестная сеть: {args.chain}")
+    profile = CHAIN_PROFILES[chain_name]
+
+    prices, volumes = load_prices(args.csv_path)
+    results = sweep(prices, [float(w) for w in args.widths], [float(t) for t in args.thresholds], volumes=volumes,
+                    workers=args.workers, decimals0=int(profile["DECIMALS0"]), decimals1=int(profile["DECIMALS1"]),
+                    fee=int(profile.get("FEE", FEE)), amount0=args.amount0, pool_share=args.pool_share,
+                    gas_price_gwei=args.gas_price_gwei)
+    print(json.dumps(results, indent=4))
@@ -1,66 +1,126 @@
 from web3 import Web3
 import os, time
 from utils.logger import setup_logger
-import json
-from utils.select_chain import load_config
+from utils.chain_context import current_chain
 from dotenv import load_dotenv
-from utils.retry_decorator import retry_on_exception
+from utils.metrics import instrumented
+from utils.errors import BroadcastUnknownError
+from utils.retry_decorator import (PERMANENT, RPC_RETRY_LIMIT, SEND_ACCEPTED, SEND_UNKNOWN, backoff, classify_error,
+                                   classify_send_error, remaining, retry_after_hint, retry_on_exception)
+from utils.receipt_tracker import get_receipt_tracker
 
 load_dotenv()
-config = load_config()
-# Подключение к Ethereum
-RPC_URL_1 = config["RPC_URL_1"]
-RPC_URL_2 = config["RPC_URL_2"]
-RPC_URL_3 = config["RPC_URL_3"]
-RPC_RETRY_LIMIT = int(os.getenv("RPC_RETRY_LIMIT", 3))
 
 GAS_PRICE_MULTIPLIER = float(os.getenv("GAS_PRICE_MULTIPLIER", 1.2))
 POSITION_MANAGER_ABI_PATH = os.getenv('POSITION_MANAGER_ABI_PATH', 'utils/position_manager_abi.json')
-POSITION_MANAGER_ADDRESS = config['POSITION_MANAGER_ADDRESS']
 
-rpc_urls = [RPC_URL_1, RPC_URL_2, RPC_URL_3]
-current_rpc_index = 0
+def get_rpc_urls():
+    """Возвращает список RPC выбранной сети."""
+    return current_chain().rpc_urls()
 
 
-# Функция для переключения RPC
+# Функция для подключения через пул RPC
 def get_web3():
-    """Возвращает объект Web3 для взаимодействия с блокчейном."""
-    global current_rpc_index
-    attempts = 0
-    while attempts < RPC_RETRY_LIMIT:
-        try:
-            web3 = Web3(Web3.HTTPProvider(rpc_urls[current_rpc_index]))
-            if web3.eth.get_block('latest') != None:
-                return web3
-            else:
-                raise ConnectionError("Подключение не удалось.")
-        except Exception as e:
-            attempts += 1
-            current_rpc_index = (current_rpc_index + 1) % len(rpc_urls)
-            print(
-                f"Ошибка подключения: {e}. Переключение на следующий RPC ({rpc_urls[current_rpc_index]}) через 10 секунд.")
-            time.sleep(10)
-    raise ConnectionError("Не удалось подключиться ни к одному из RPC узлов.")
-
-
-web3 = get_web3()
+    """
+    Возвращает объект Web3 текущей сети, запросы которого распределяются по пулу RPC с учётом задержек и ошибок.
+    Подключение создаётся и проверяется при первом обращении, а не при импорте модуля.
+    """
+    return current_chain().web3()
 
 
 def get_contract(contract_address, abi_path):
     """
-    Загружает контракт по адресу и ABI.
+    Возвращает контракт по адресу и ABI из реестра контрактов текущей сети.
 
     :param contract_address: Адрес смарт-контракта.
     :param abi_path: Путь к файлу с ABI.
     :return: Экземпляр контракта.
     """
-    with open(abi_path, 'r') as abi_file:
-        abi = json.load(abi_file)
-    contract = web3.eth.contract(address=web3.to_checksum_address(contract_address), abi=abi)
-    return contract
+    return current_chain().contract(contract_address, abi_path)
+
+
+def broadcast(web3, raw_transaction, max_attempts=RPC_RETRY_LIMIT):
+    """
+    Отправляет подписанную транзакцию. При сбое отправляются те же байты, поэтому повтор не может
+    создать вторую транзакцию: узел, уже получивший её, ответит "already known" или "nonce too low".
+
+    :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+    :param raw_transaction: Подписанная транзакция (bytes).
+    :param max_attempts: Максимальное количество попыток отправки.
+    :return: Хэш транзакции.
+    :raises BroadcastUnknownError: Если неизвестно, принял ли её хотя бы один узел.
+    """
+    tx_hash = Web3.keccak(raw_transaction).to_0x_hex()
+    unknown = None
+    for attempt in range(1, max_attempts + 1):
+        try:
+            web3.eth.send_raw_transaction(raw_transaction)
+            return tx_hash
+        except Exception as e:
+            outcome = classify_send_error(e)
+            if outcome == SEND_ACCEPTED:
+                return tx_hash
+            if outcome == SEND_UNKNOWN:
+                unknown = e
+            elif classify_error(e) == PERMANENT and unknown is None:
+                # Узел отклонил транзакцию (или срок истёк до отправки): повтор не поможет
+                raise
+            error = e
+        pause = backoff(classify_error(error), attempt, retry_after_hint(error))
+        left = remaining()
+        if attempt == max_attempts or (left is not None and pause >= left):
+            break
+        time.sleep(pause)
+    if unknown is not None:
+        raise BroadcastUnknownError(f"Неизвестно, принята ли транзакция {tx_hash}: {unknown}") from unknown
+    raise error
+
+
+def sign_and_send(web3, wallet_address, private_key, transaction):
+    """
+    Подписывает транзакцию со следующим nonce кошелька, отправляет её и передаёт в отслеживание.
+
+    Nonce освобождается, только если транзакция не подписана или ни один узел её не принял.
+    Транзакция, исход отправки которой неизвестен, остаётся с выданным nonce и отслеживается:
+    она либо будет включена в блок, либо заменена трекером с тем же nonce.
+
+    :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+    :param wallet_address: Адрес кошелька.
+    :param private_key: Приватный ключ кошелька.
+    :param transaction: Транзакция без nonce (с газом, комиссией и chainId).
+    :return: Хэш транзакции.
+    :raises BroadcastUnknownError: Если неизвестно, принята ли транзакция (повторять вызов нельзя).
+    """
+    chain = current_chain()
+    try:
+        transaction = {**transaction, "nonce": chain.nonce_manager.next_nonce(web3, wallet_address)}
+        signed_tx = web3.eth.account.sign_transaction(transaction, private_key=private_key)
+    except Exception:
+        chain.nonce_manager.reset(wallet_address)
+        raise
+    try:
+        tx_hash = broadcast(web3, signed_tx.raw_transaction)
+    except BroadcastUnknownError:
+        _track(signed_tx.hash.to_0x_hex(), wallet_address, private_key, transaction)
+        raise
+    except Exception:
+        # Транзакция не принята ни одним узлом: nonce свободен
+        chain.nonce_manager.reset(wallet_address)
+        raise
+    _track(tx_hash, wallet_address, private_key, transaction)
+    return tx_hash
+
+
+def _track(tx_hash, wallet_address, private_key, transaction):
+    try:
+        get_receipt_tracker().track(tx_hash, wallet_address, private_key, transaction)
+    except Exception as e:
+        # Транзакция уже отправлена: ошибка отслеживания не должна приводить к повторной отправке
+        setup_logger(wallet_address).error(f"Не удалось поставить транзакцию {tx_hash} на отслеживание: {e}")
 
 
 @retry_on_exception()
+@instrumented
 def get_user_position(position_manager_address, abi_path, user_address):
     """
     Получает ID позиции пользователя на Uniswap V3.
@@ -86,6 +146,7 @@ def get_user_position(position_manager_address, abi_path, user_address):
 
 
 @retry_on_exception()
+@instrumented
 def get_position_liquidity(position_manager_address, abi_path, position_id, wallet_address):
     """
     Получает объём ликвидности для позиции.
@@ -111,6 +172,7 @@ def get_position_liquidity(position_manager_address, abi_path, position_id, wall
 
 
 @retry_on_exception()
+@instrumented
 def check_allowance(wallet_address, position_manager_address, token_address, erc20_abi_path):
     """
     Получает информацию об allowance от erc20.
@@ -133,6 +195,7 @@ def check_allowance(wallet_address, position_manager_address, token_address, erc
 
 
 @retry_on_exception()
+@instrumented
 def approve_token(wallet_address, private_key, position_manager_address, token_address, erc20_abi_path):
     """
     Отправляет транзакцию approve для кошелька.
@@ -145,7 +208,9 @@ def approve_token(wallet_address, private_key, position_manager_address, token_a
     :return: Хэш транзакции approve.
     """
     logger = setup_logger(wallet_address)
+    chain = current_chain()
     try:
+        web3 = get_web3()
         amount_to_approve = 2 ** 256 - 1
         erc20_contract = get_contract(token_address, erc20_abi_path)
 
@@ -156,19 +221,18 @@ def approve_token(wallet_address, private_key, position_manager_address, token_a
             "from": wallet_address
         }) * GAS_PRICE_MULTIPLIER)
 
-        transaction = erc20_contract.functions.approve(
-            Web3.to_checksum_address(position_manager_address),
-            amount_to_approve
-            ).build_transaction({
+        transaction = {
             'from': Web3.to_checksum_address(wallet_address),
-            'nonce': web3.eth.get_transaction_count(wallet_address),
+            'to': erc20_contract.address,
+            'data': erc20_contract.encode_abi("approve", [Web3.to_checksum_address(position_manager_address),
+                                                          amount_to_approve]),
+            'value': 0,
             'gas': gas_estimate,
-            'gasPrice': int(web3.eth.gas_price * GAS_PRICE_MULTIPLIER)
-        })
-
-        signed_txn = web3.eth.account.sign_transaction(transaction, private_key)
-        txn_hash = web3.eth.send_raw_transaction(signed_txn.raw_transaction).hex()
-        return txn_hash
+            'chainId': web3.eth.chain_id,
+            **chain.fee_oracle.get_fee_params(web3)
+        }
+        return sign_and_send(web3, wallet_address, private_key, transaction)
     except Exception as e:
+        chain.fee_oracle.invalidate()
         logger.error(f"Ошибка при подтверждении токенов для кошелька {wallet_address}: {e}")
         raise
@@ -0,0 +1,193 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from web3 import Web3
+from dotenv import load_dotenv
+from utils import contracts as registry
+from utils.fee_oracle import FeeOracle
+from utils.logger import log_profile
+from utils.nonce_manager import NonceManager
+from utils.receipt_tracker import ReceiptTracker
+from utils.rpc_pool import RpcPool
+
+load_dotenv()
+RPC_RETRY_LIMIT = int(os.getenv("RPC_RETRY_LIMIT", 3))
+CONFIG_PATH = os.getenv("CONFIG_PATH", "config.json")  # Файл настроек сети для запуска без профилей
+
+# Децималы токенов пула, если профиль сети их не задаёт (WETH/USDC)
+DEFAULT_DECIMALS0 = 18
+DEFAULT_DECIMALS1 = 6
+
+# Контекст сети текущего потока (профиль оркестратора) и контекст по умолчанию (обычный запуск)
+_current = contextvars.ContextVar("chain_context", default=None)
+_default = None
+_default_lock = threading.Lock()
+
+
+class ChainContext:
+    """
+    Всё, что относится к одной сети и пулу: настройки, подключение через пул RPC, nonce кошельков,
+    оценка комиссии, отслеживание квитанций и реестр контрактов.
+
+    Модули бота получают их через current_chain(), поэтому несколько профилей (сетей и пулов)
+    работают в одном процессе, каждый в своём потоке со своим контекстом.
+    """
+
+    def __init__(self, config, name=None, settings=None, provider_factory=None):
+        """
+        :param config: Настройки сети и пула (RPC_URL_*, токены, адреса контрактов, FEE, DECIMALS0/1).
+        :param name: Имя профиля для логов.
+        :param settings: Настройки бота профиля, заменяющие переменные окружения (RANGE_WIDTH и т.д.).
+        :param provider_factory: Функция, создающая провайдер для одного RPC (по умолчанию — HTTP).
+        """
+        self.config = config
+        self.name = name
+        self.settings = {key: str(value) for key, value in (settings or {}).items()}
+        self.provider_factory = provider_factory
+        self.nonce_manager = NonceManager()
+        self.fee_oracle = FeeOracle()
+        self.rpc_pool = None
+        self._web3 = None
+        self._tracker = None
+        self._contracts = {}
+        self._lock = threading.Lock()
+
+    @property
+    def decimals0(self):
+        """Децималы первого токена пула."""
+        return int(self.config.get("DECIMALS0", DEFAULT_DECIMALS0))
+
+    @property
+    def decimals1(self):
+        """Децималы второго токена пула."""
+        return int(self.config.get("DECIMALS1", DEFAULT_DECIMALS1))
+
+    def setting(self, name, default=None):
+        """
+        Возвращает настройку бота: значение из профиля, приведённое к типу значения по умолчанию,
+        или значение по умолчанию (прочитанное модулем из окружения).
+
+        :param name: Имя переменной окружения (например, RANGE_WIDTH).
+        :param default: Значение по умолчанию.
+        :return: Значение настройки.
+        """
+        if name not in self.settings:
+            return default
+        value = self.settings[name]
+        if isinstance(default, bool):
+            return value.lower() in ("1", "true", "yes")
+        return value if default is None else type(default)(value)
+
+    def rpc_urls(self):
+        """Возвращает список RPC сети (RPC_URL_1, RPC_URL_2, ... из настроек)."""
+        keys = sorted((key for key in self.config if key.startswith("RPC_URL_")), key=lambda key: int(key[8:]))
+        return [self.config[key] for key in keys if self.config[key]]
+
+    def web3(self):
+        """
+        Возвращает объект Web3 сети, запросы которого распределяются по пулу RPC.
+        Подключение создаётся и проверяется при первом обращении.
+        """
+        if self._web3 is not None:
+            return self._web3
+        with self._lock:
+            if self._web3 is not None:
+                return self._web3
+            if self.rpc_pool is None:
+                self.rpc_pool = RpcPool(self.rpc_urls(), self.provider_factory)
+            attempts = 0
+            while attempts < RPC_RETRY_LIMIT:
+                try:
+                    web3 = Web3(self.rpc_pool)
+                    if web3.eth.get_block('latest') != None:
+                        self._web3 = web3
+                        return web3
+                    else:
+                        raise ConnectionError("Подключение не удалось.")
+                except Exception as e:
+                    attempts += 1
+                    # Пул уже перебрал все RPC, поэтому пауза нужна только на случай полной недоступности сети
+                    print(f"Ошибка подключения: {e}. Повторная попытка через 1 секунду.")
+                    time.sleep(1)
+            raise ConnectionError("Не удалось подключиться ни к одному из RPC узлов.")
+
+    def receipt_tracker(self):
+        """Возвращает ReceiptTracker сети, создавая его при первом обращении."""
+        web3 = self.web3()
+        with self._lock:
+            if self._tracker is None:
+                self._tracker = ReceiptTracker(web3, fee_oracle=self.fee_oracle)
+            return self._tracker
+
+    def contract(self, contract_address, abi):
+        """
+        Возвращает закэшированный экземпляр контракта сети.
+
+        :param contract_address: Адрес смарт-контракта.
+        :param abi: Путь к файлу с ABI или сам ABI (список).
+        :return: Экземпляр контракта.
+        """
+        key = (contract_address.lower(), abi if isinstance(abi, str) else id(abi))
+        contract = self._contracts.get(key)
+        if contract is None:
+            web3 = self.web3()
+            with self._lock:
+                contract = self._contracts.get(key)
+                if contract is None:
+                    contract = web3.eth.contract(address=registry.to_checksum(contract_address),
+                                                 abi=registry.load_abi(abi) if isinstance(abi, str) else abi)
+                    self._contracts[key] = contract
+        return contract
+
+    def reset(self):
+        """Сбрасывает nonce и оценку комиссии (например, перед перезапуском упавшего профиля)."""
+        self.nonce_manager = NonceManager()
+        self.fee_oracle.invalidate()
+
+
+def set_default_chain(context):
+    """
+    Задаёт контекст сети для потоков, не выбравших свой (обычный запуск одной сети).
+
+    :param context: ChainContext.
+    """
+    global _default
+    with _default_lock:
+        _default = context
+
+
+def current_chain():
+    """
+    Возвращает контекст сети текущего потока. Вне use_chain — контекст по умолчанию,
+    который при первом обращении создаётся из файла настроек CONFIG_PATH.
+
+    :return: ChainContext.
+    """
+    global _default
+    context = _current.get()
+    if context is not None:
+        return context
+    with _default_lock:
+        if _default is None:
+            from utils.select_chain import load_config
+            _default = ChainContext(load_config(CONFIG_PATH))
+        return _default
+
+
+@contextmanager
+def use_chain(context):
+    """
+    Выполняет блок в контексте сети. Контекст наследуется задачами, запущенными с копией контекста
+    (пул потоков кошельков), и помечает записи логов именем профиля.
+
+    :param context: ChainContext.
+    """
+    token = _current.set(context)
+    profile_token = log_profile.set(context.name)
+    try:
+        yield context
+    finally:
+        log_profile.reset(profile_token)
+        _current.reset(token)
@@ -0,0 +1,101 @@
+import json
+import os
+from functools import lru_cache
+from web3 import Web3
+from eth_abi import encode
+from eth_utils import function_abi_to_4byte_selector, get_abi_input_types, get_abi_output_types
+
+# ABI загружаются с диска один раз; экземпляры контрактов хранит контекст сети (utils.chain_context)
+@lru_cache(maxsize=None)
+def _load_abi(abi_path):
+    with open(abi_path, 'r') as abi_file:
+        return json.load(abi_file)
+
+
+def load_abi(abi_path):
+    """
+    Возвращает ABI из файла, прочитанного только при первом обращении.
+
+    :param abi_path: Путь к файлу с ABI.
+    :return: ABI в виде списка.
+    """
+    return _load_abi(os.path.abspath(abi_path))
+
+
+@lru_cache(maxsize=None)
+def to_checksum(address):
+    """
+    Возвращает checksum-адрес, вычисленный один раз для каждого адреса.
+
+    :param address: Адрес в любом регистре.
+    :return: Checksum-адрес.
+    """
+    return Web3.to_checksum_address(address)
+
+
+@lru_cache(maxsize=None)
+def _function_abis(abi_path):
+    functions = {}
+    for item in load_abi(abi_path):
+        # Для перегруженных функций (safeTransferFrom) сохраняется первая версия
+        if item.get("type") == "function" and item["name"] not in functions:
+            functions[item["name"]] = item
+    return functions
+
+
+@lru_cache(maxsize=None)
+def get_selector(abi_path, fn_name):
+    """
+    Возвращает 4-байтовый селектор функции из ABI.
+
+    :param abi_path: Путь к файлу с ABI.
+    :param fn_name: Имя функции.
+    :return: Селектор в виде bytes.
+    """
+    return function_abi_to_4byte_selector(_function_abis(abi_path)[fn_name])
+
+
+@lru_cache(maxsize=None)
+def get_output_types(abi_path, fn_name):
+    """
+    Возвращает список типов возвращаемых значений функции из ABI.
+
+    :param abi_path: Путь к файлу с ABI.
+    :param fn_name: Имя функции.
+    :return: Список ABI-типов.
+    """
+    return get_abi_output_types(_function_abis(abi_path)[fn_name])
+
+
+@lru_cache(maxsize=None)
+def get_input_types(abi_path, fn_name):
+    """
+    Возвращает список типов аргументов функции из ABI.
+
+    :param abi_path: Путь к файлу с ABI.
+    :param fn_name: Имя функции.
+    :return: Список ABI-типов.
+    """
+    return get_abi_input_types(_function_abis(abi_path)[fn_name])
+
+
+def encode_function_call(abi_path, fn_name, args):
+    """
+    Кодирует calldata вызова по заранее вычисленным селектору и типам аргументов,
+    без построения объекта функции контракта.
+
+    :param abi_path: Путь к файлу с ABI.
+    :param fn_name: Имя функции.
+    :param args: Аргументы функции (структуры передаются кортежами).
+    :return: Calldata в виде hex-строки.
+    """
+    return "0x" + (get_selector(abi_path, fn_name) + encode(get_input_types(abi_path, fn_name), args)).hex()
+
+
+def clear_registry():
+    """Очищает кэш ABI и вычисленных по ним селекторов и типов."""
+    _load_abi.cache_clear()
+    _function_abis.cache_clear()
+    get_selector.cache_clear()
+    get_output_types.cache_clear()
+    get_input_types.cache_clear()
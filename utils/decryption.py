@@ -1,46 +1,70 @@
 import base64
 import binascii
 import hashlib
-import msvcrt 
+import re
 from Crypto.Cipher import AES
 from Crypto.Protocol.KDF import PBKDF2
 from Crypto.Util.Padding import unpad
-from web3 import Web3
+
+
+# Строка Base64 (зашифрованный ключ) и приватный ключ в hex
+BASE64_RE = re.compile(r'^[A-Za-z0-9+/]+={0,2}$')
+HEX_KEY_RE = re.compile(r'^(0x)?[0-9a-fA-F]{64}$')
 
 
 def is_base64(s):
-    if not len(s):
+    """
+    Проверяет, является ли строка зашифрованным ключом в Base64 (а не приватным ключом в hex).
+    Проверка выполняется без вычисления ключа и без криптографических операций.
+
+    :param s: Строка из файла кошельков.
+    :return: True, если строка — корректный Base64.
+    """
+    if not s or HEX_KEY_RE.match(s):
+        return False
+    if len(s) % 4 or not BASE64_RE.match(s):
         return False
     try:
-        if len(s) == 64:
-            Web3().eth.account.from_key(s)
-            return False
-    except Exception:
-        ...
-    try:
-        decoded = base64.b64decode(s)
-        reencoded = base64.b64encode(decoded)
-        return reencoded == s.encode()
-    except Exception:
+        return base64.b64encode(base64.b64decode(s, validate=True)) == s.encode()
+    except (binascii.Error, ValueError):
         return False
 
 
-def get_cipher(password):
+def derive_key(password):
+    """
+    Вычисляет ключ шифрования из пароля. Достаточно вызвать один раз для всех ключей файла.
+
+    :param password: Пароль.
+    :return: Ключ AES (32 байта).
+    """
     salt = hashlib.sha256(password.encode('utf-8')).digest()
-    key = PBKDF2(password.encode('utf-8'), salt, dkLen=32, count=1)
-    return AES.new(key, AES.MODE_ECB)
+    return PBKDF2(password.encode('utf-8'), salt, dkLen=32, count=1)
 
 
-def decrypt_private_key(encrypted_base64_pk, password):
-    cipher = get_cipher(password)
+def get_cipher(password):
+    return AES.new(derive_key(password), AES.MODE_ECB)
+
+
+def decrypt_with_key(encrypted_base64_pk, key):
+    """
+    Расшифровывает приватный ключ уже вычисленным ключом шифрования.
+
+    :param encrypted_base64_pk: Зашифрованный ключ в Base64.
+    :param key: Ключ из derive_key.
+    :return: Приватный ключ в hex с префиксом 0x.
+    """
     encrypted_pk = base64.b64decode(encrypted_base64_pk)
-    decrypted_bytes = unpad(cipher.decrypt(encrypted_pk), 16)
+    decrypted_bytes = unpad(AES.new(key, AES.MODE_ECB).decrypt(encrypted_pk), 16)
     decrypted_hex = binascii.hexlify(decrypted_bytes).decode()
     if len(decrypted_hex) in (66, 42):
         decrypted_hex = decrypted_hex[2:]
     return '0x' + decrypted_hex
 
 
+def decrypt_private_key(encrypted_base64_pk, password):
+    return decrypt_with_key(encrypted_base64_pk, derive_key(password))
+
+
 def get_password(prompt="Введите пароль для расшифровки: "):
     """
     Ввод пароля с отображением звездочек (*) вместо вводимых символов.
@@ -54,6 +78,8 @@ def get_password(prompt="Введите пароль для расшифровк
 
     if os.name == 'nt':
         # Реализация для Windows
+        import msvcrt
+
         print(prompt, end='', flush=True)
         password = ""
         while True:
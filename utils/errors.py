@@ -0,0 +1,14 @@
+# Признаки ошибки выполнения транзакции (в отличие от ошибок самого RPC)
+REVERT_MARKERS = ("revert", "insufficient funds", "gas required exceeds", "out of gas", "invalid opcode")
+
+
+class PreflightError(RuntimeError):
+    """Транзакция откатится при выполнении: она не подписывается и не отправляется."""
+
+
+class RequestNotSentError(ConnectionError):
+    """Запрос не был отправлен ни на один RPC (например, все RPC исключены размыкателями)."""
+
+
+class BroadcastUnknownError(RuntimeError):
+    """Ответ на отправку транзакции потерян: она могла попасть в mempool, поэтому повторно не подписывается."""
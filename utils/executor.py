@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
+import os
+import time
+from dotenv import load_dotenv
+from utils.retry_decorator import deadline as time_limit, remaining
+
+load_dotenv()
+
+REBALANCE_CONCURRENCY = int(os.getenv("REBALANCE_CONCURRENCY", 16))  # Максимум кошельков, обрабатываемых одновременно
+REBALANCE_DEADLINE = float(os.getenv("REBALANCE_DEADLINE", 120))  # Лимит времени на цикл ребалансировки (секунды)
+
+
+class WalletTimeoutError(TimeoutError):
+    """Кошелёк не успел обработаться до истечения лимита времени цикла."""
+
+
+def _run_until(until, task, *args):
+    # Задача, брошенная по истечении лимита, прекращает запросы к RPC, а не продолжает их в фоне
+    with time_limit(until - time.monotonic()):
+        return task(*args)
+
+
+def run_for_wallets(task, wallets, loggers, max_workers=REBALANCE_CONCURRENCY, deadline=REBALANCE_DEADLINE):
+    """
+    Параллельно выполняет задачу для каждого кошелька в ограниченном пуле потоков.
+
+    Ошибка одного кошелька не влияет на остальные. Кошельки, не завершившиеся до deadline,
+    отмечаются WalletTimeoutError; ещё не начатые задачи отменяются. Задачи выполняются в копии
+    контекста вызывающего потока с тем же сроком: после deadline их RPC-запросы и повторы
+    прекращаются (retry_decorator.deadline).
+
+    :param task: Функция task(wallet_address, private_key), выполняемая для кошелька.
+    :param wallets: Список пар (адрес, приватный ключ).
+    :param loggers: Словарь логгеров по адресам кошельков.
+    :param max_workers: Максимальное количество одновременно обрабатываемых кошельков.
+    :param deadline: Лимит времени на весь цикл в секундах.
+    :return: Словарь {адрес: результат задачи или исключение}.
+    """
+    results = {}
+    deadline = remaining(deadline)
+    until = time.monotonic() + deadline
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(wallets))),
+                                  thread_name_prefix="rebalance")
+    try:
+        futures = {executor.submit(contextvars.copy_context().run, _run_until, until, task, address, private_key): address
+                   for address, private_key in wallets}
+        done, not_done = wait(futures, timeout=deadline)
+        for future in done:
+            address = futures[future]
+            try:
+                results[address] = future.result()
+            except Exception as e:
+                loggers[address].error(f"Ошибка для кошелька {address}: {e}")
+                results[address] = e
+        for future in not_done:
+            address = futures[future]
+            future.cancel()
+            loggers[address].error(f"Кошелёк {address} не обработан за {deadline:.0f} секунд.")
+            results[address] = WalletTimeoutError(address)
+    finally:
+        # Не ждём зависшие задачи: они завершатся в фоне, не задерживая следующий цикл
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
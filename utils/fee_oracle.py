@@ -0,0 +1,99 @@
+import os
+import statistics
+import threading
+import time
+from dotenv import load_dotenv
+from web3.exceptions import Web3RPCError
+
+load_dotenv()
+
+FEE_HISTORY_BLOCKS = int(os.getenv("FEE_HISTORY_BLOCKS", 5))  # Количество блоков истории для оценки чаевых
+FEE_PRIORITY_PERCENTILE = float(os.getenv("FEE_PRIORITY_PERCENTILE", 50))  # Перцентиль чаевых в блоках
+FEE_BASE_MULTIPLIER = float(os.getenv("FEE_BASE_MULTIPLIER", 2))  # Запас к базовой комиссии в maxFeePerGas
+FEE_MIN_PRIORITY_WEI = int(os.getenv("FEE_MIN_PRIORITY_WEI", 0))  # Минимальные чаевые
+FEE_MAX_FEE_WEI = int(os.getenv("FEE_MAX_FEE_WEI", 0))  # Ограничение maxFeePerGas (0 — без ограничения)
+FEE_CACHE_TTL = float(os.getenv("FEE_CACHE_TTL", 2))  # Время жизни оценки в секундах (примерно время блока)
+GAS_PRICE_MULTIPLIER = float(os.getenv("GAS_PRICE_MULTIPLIER", 1.2))  # Для сетей без EIP-1559
+
+METHOD_NOT_FOUND = -32601
+
+
+class FeeOracle:
+    """
+    Общая для всех транзакций оценка комиссии EIP-1559.
+
+    Запрашивает eth_feeHistory не чаще раза в FEE_CACHE_TTL секунд (примерно время блока)
+    и выдаёт всем транзакциям одинаковые maxFeePerGas и maxPriorityFeePerGas:
+    чаевые — перцентиль FEE_PRIORITY_PERCENTILE за последние FEE_HISTORY_BLOCKS блоков,
+    максимальная комиссия — базовая комиссия следующего блока с запасом FEE_BASE_MULTIPLIER плюс чаевые.
+    Если сеть не поддерживает EIP-1559, возвращается gasPrice с GAS_PRICE_MULTIPLIER.
+    Ошибки RPC при запросе истории комиссий не подменяются gasPrice и передаются вызывающему коду.
+    """
+
+    def __init__(self, history_blocks=FEE_HISTORY_BLOCKS, percentile=FEE_PRIORITY_PERCENTILE,
+                 base_multiplier=FEE_BASE_MULTIPLIER, ttl=FEE_CACHE_TTL, min_priority=FEE_MIN_PRIORITY_WEI,
+                 max_fee=FEE_MAX_FEE_WEI):
+        self.history_blocks = history_blocks
+        self.percentile = percentile
+        self.base_multiplier = base_multiplier
+        self.ttl = ttl
+        self.min_priority = min_priority
+        self.max_fee = max_fee
+        self._lock = threading.Lock()
+        self._fees = None
+        self._fetched_at = 0.0
+
+    def _fee_history(self, web3):
+        try:
+            return web3.eth.fee_history(self.history_blocks, 'latest', [self.percentile])
+        except Web3RPCError as e:
+            error = e.rpc_response.get("error") if isinstance(e.rpc_response, dict) else None
+            if isinstance(error, dict) and error.get("code") == METHOD_NOT_FOUND:
+                # Узел не знает eth_feeHistory: сеть без EIP-1559
+                return {}
+            raise
+
+    def cap(self, max_fee, priority_fee):
+        """
+        Применяет ограничение max_fee и не даёт чаевым превысить maxFeePerGas.
+
+        :param max_fee: maxFeePerGas.
+        :param priority_fee: maxPriorityFeePerGas.
+        :return: Кортеж (maxFeePerGas, maxPriorityFeePerGas).
+        """
+        if self.max_fee:
+            max_fee = min(max_fee, self.max_fee)
+        return max_fee, min(priority_fee, max_fee)
+
+    def _fetch(self, web3):
+        history = self._fee_history(web3)
+        base_fees = history.get("baseFeePerGas") or []
+        if not base_fees or not base_fees[-1]:
+            # Сеть без EIP-1559
+            return {"gasPrice": int(web3.eth.gas_price * GAS_PRICE_MULTIPLIER)}
+
+        # Последний элемент baseFeePerGas — базовая комиссия следующего блока
+        next_base_fee = base_fees[-1]
+        rewards = [reward[0] for reward in history.get("reward") or [] if reward]
+        priority_fee = max(int(statistics.median(rewards)) if rewards else 0, self.min_priority)
+        max_fee, priority_fee = self.cap(int(next_base_fee * self.base_multiplier) + priority_fee, priority_fee)
+        return {"maxFeePerGas": max_fee, "maxPriorityFeePerGas": priority_fee}
+
+    def get_fee_params(self, web3):
+        """
+        Возвращает поля комиссии для транзакции.
+
+        :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+        :return: Словарь {"maxFeePerGas", "maxPriorityFeePerGas"} или {"gasPrice"}.
+        """
+        with self._lock:
+            if self._fees is not None and time.monotonic() - self._fetched_at < self.ttl:
+                return dict(self._fees)
+            self._fees = self._fetch(web3)
+            self._fetched_at = time.monotonic()
+            return dict(self._fees)
+
+    def invalidate(self):
+        """Сбрасывает оценку, следующая транзакция запросит комиссию заново."""
+        with self._lock:
+            self._fees = None
@@ -1,5 +1,13 @@
+import atexit
+import contextvars
+import json
 import logging
 import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler
 from dotenv import load_dotenv
 
 # Загружаем настройки из .env
@@ -8,42 +16,187 @@ load_dotenv()
 # Получаем настройки из переменных окружения
 LOG_FOLDER = os.getenv("LOG_FOLDER", "logs")
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # Преобразуем уровень в верхний регистр
+LOG_FILE = os.getenv("LOG_FILE", "bot.jsonl")  # Общий файл логов всех кошельков (JSON по строке на запись)
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))  # Размер файла, после которого он ротируется
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))  # Количество хранимых ротированных файлов
+LOG_PER_WALLET = os.getenv("LOG_PER_WALLET", "0").lower() in ("1", "true", "yes")  # Дополнительно файл на кошелёк
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "1").lower() in ("1", "true", "yes")  # Вывод в консоль
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 500))  # Максимум записей, записываемых за один раз
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_backend = None
+_backend_lock = threading.Lock()
+
+# Имя профиля (сети и пула), от имени которого пишется запись; задаётся оркестратором профилей
+log_profile = contextvars.ContextVar("log_profile", default=None)
+
+
+def format_json(record):
+    """
+    Преобразует запись лога в строку JSON.
+
+    :param record: Запись logging.LogRecord (сообщение уже отформатировано QueueHandler).
+    :return: Строка JSON без перевода строки.
+    """
+    return json.dumps({
+        "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+        "level": record.levelname,
+        "wallet": getattr(record, "wallet", None),
+        "profile": getattr(record, "profile", None),
+        "logger": record.name,
+        "thread": record.threadName,
+        "message": record.getMessage(),
+    }, ensure_ascii=False)
+
+
+class LogWriter:
+    """
+    Фоновый поток записи логов.
+
+    Забирает записи из очереди пачками, записывает их в общий ротируемый файл JSON
+    одним вызовом write на пачку и, если включено, в файлы кошельков. Файлы кошельков
+    открываются только на время записи пачки, поэтому число открытых дескрипторов
+    не зависит от количества кошельков.
+    """
+
+    def __init__(self, log_queue, log_folder=LOG_FOLDER, log_file=LOG_FILE, max_bytes=LOG_MAX_BYTES,
+                 backup_count=LOG_BACKUP_COUNT, per_wallet=LOG_PER_WALLET, console=LOG_CONSOLE,
+                 batch_size=LOG_BATCH_SIZE):
+        self.queue = log_queue
+        self.log_folder = log_folder
+        self.path = os.path.join(log_folder, log_file)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.per_wallet = per_wallet
+        self.console = console
+        self.batch_size = batch_size
+        self.text_formatter = logging.Formatter(TEXT_FORMAT)
+        self._stream = None
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.log_folder, exist_ok=True)
+        self._stream = open(self.path, "a", encoding="utf-8")
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Дописывает оставшиеся записи и останавливает поток."""
+        if self._thread is None:
+            return
+        self.queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._stream.close()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            records = [record for record in batch if record is not None]
+            if records:
+                try:
+                    self._write(records)
+                except Exception as e:
+                    print(f"Ошибка записи логов: {e}", file=sys.stderr)
+            if stop:
+                return
+
+    def _write(self, records):
+        self._stream.write("".join(format_json(record) + "\n" for record in records))
+        self._stream.flush()
+        if self.max_bytes and self._stream.tell() >= self.max_bytes:
+            self._rollover()
+
+        if self.console:
+            sys.stderr.write("".join(self.text_formatter.format(record) + "\n" for record in records))
+            sys.stderr.flush()
+
+        if self.per_wallet:
+            by_wallet = {}
+            for record in records:
+                if getattr(record, "wallet", None):
+                    by_wallet.setdefault(record.wallet, []).append(self.text_formatter.format(record) + "\n")
+            for wallet, lines in by_wallet.items():
+                with open(os.path.join(self.log_folder, f"{wallet}.log"), "a", encoding="utf-8") as wallet_file:
+                    wallet_file.write("".join(lines))
+
+    def _rollover(self):
+        self._stream.close()
+        for i in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{i}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{i + 1}")
+        if self.backup_count:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._stream = open(self.path, "a", encoding="utf-8")
+
+
+class WalletQueueHandler(QueueHandler):
+    """QueueHandler, помечающий каждую запись адресом кошелька (имя логгера) и профилем."""
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.wallet = record.name
+        record.profile = log_profile.get()
+        return record
+
+
+def get_queue_handler(log_folder=LOG_FOLDER):
+    """
+    Возвращает общий QueueHandler, при первом вызове запуская фоновый поток записи.
+
+    :param log_folder: Путь к папке логов.
+    :return: Объект WalletQueueHandler.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            log_queue = queue.SimpleQueue()
+            writer = LogWriter(log_queue, log_folder)
+            writer.start()
+            atexit.register(writer.stop)
+            _backend = (WalletQueueHandler(log_queue), writer)
+        return _backend[0]
+
+
+def shutdown_logging():
+    """Дописывает все записи из очереди на диск и останавливает поток записи."""
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend[1].stop()
+            _backend = None
+
 
-# Убедимся, что папка для логов существует
-if not os.path.exists(LOG_FOLDER):
-    os.makedirs(LOG_FOLDER)
 # Функция для настройки логера
-def setup_logger(wallet_address, log_folder="logs", log_level="INFO"):
+def setup_logger(wallet_address, log_folder=LOG_FOLDER, log_level=LOG_LEVEL):
     """
-    Настройка логгера для каждого кошелька с сохранением логов в отдельный файл.
+    Настройка логгера для каждого кошелька.
+
+    Все логгеры пишут в общую очередь; запись на диск выполняется фоновым потоком,
+    поэтому повторные вызовы дешёвые и не открывают новых файлов.
+
     :param wallet_address: Адрес кошелька.
     :param log_folder: Путь к папке логов.
     :param log_level: Уровень логирования.
     :return: Объект logger.
     """
-    # Убедимся, что папка для логов существует
-    os.makedirs(log_folder, exist_ok=True)
-
     # Получаем уникальный логгер для кошелька
     logger = logging.getLogger(wallet_address)
 
-    # Если обработчики уже существуют, не добавляем их заново
+    # Если обработчик уже подключен, не добавляем его заново
     if not logger.handlers:
-        # Устанавливаем уровень логирования
         logger.setLevel(log_level)
+        logger.addHandler(get_queue_handler(log_folder))
+        logger.propagate = False
 
-        # Создаем форматтер для логов
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-
-        # Настраиваем файл для логов
-        log_filename = os.path.join(log_folder, f"{wallet_address}.log")
-        file_handler = logging.FileHandler(log_filename, 'w', 'utf-8')
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-
-        # Настраиваем консольный вывод
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
-
-    return logger
\ No newline at end of file
+    return logger
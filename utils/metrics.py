@@ -0,0 +1,236 @@
+import bisect
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_FILE = os.getenv("METRICS_FILE")  # Файл для метрик в формате Prometheus (необязательно)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # Порт HTTP-эндпоинта /metrics (0 — выкл.)
+
+# Границы корзин гистограммы задержек (секунды)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Имя функции бота, из которой выполняется RPC-вызов
+_operation = contextvars.ContextVar("rpc_operation", default="other")
+# Размер последнего HTTP-запроса/ответа в текущем потоке (заполняется хуком сессии requests)
+_http_bytes = threading.local()
+
+
+class _Series:
+    """Счётчики и гистограмма задержек для одной комбинации меток."""
+
+    __slots__ = ("count", "errors", "bytes_sent", "bytes_received", "latency_sum", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latency_sum = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, latency, error, sent, received):
+        self.count += 1
+        self.errors += error
+        self.bytes_sent += sent
+        self.bytes_received += received
+        self.latency_sum += latency
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, latency)] += 1
+
+
+class RpcMetrics:
+    """
+    Сборщик метрик RPC: количество вызовов, ошибки, байты и гистограммы задержек
+    по JSON-RPC методу, RPC-узлу и функции бота, из которой сделан вызов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = defaultdict(_Series)
+        self._cycle = defaultdict(_Series)
+        # Начало текущего цикла для каждого набора RPC (у каждого профиля сети — свой цикл)
+        self._cycle_started = {}
+        self._started = time.monotonic()
+
+    def observe(self, method, endpoint, latency, error=False, sent=0, received=0, operation=None):
+        """
+        Записывает один RPC-вызов.
+
+        :param method: JSON-RPC метод.
+        :param endpoint: Адрес RPC.
+        :param latency: Время вызова в секундах.
+        :param error: Завершился ли вызов ошибкой.
+        :param sent: Размер запроса в байтах.
+        :param received: Размер ответа в байтах.
+        :param operation: Функция бота (по умолчанию — из текущего контекста).
+        """
+        key = (method, endpoint, operation or _operation.get())
+        with self._lock:
+            self._series[key].observe(latency, error, sent, received)
+            self._cycle[key].observe(latency, error, sent, received)
+
+    def observe_batch(self, requests, endpoint, latency, error=False, sent=0, received=0):
+        """
+        Записывает пакетный HTTP-запрос как отдельные вызовы входящих в него запросов.
+        Каждому запросу засчитывается задержка всего пакета и равная доля байтов.
+
+        :param requests: Список кортежей (метод, функция бота).
+        :param endpoint: Адрес RPC.
+        :param latency: Время пакетного запроса в секундах.
+        :param error: Завершился ли пакетный запрос ошибкой.
+        :param sent: Размер пакетного запроса в байтах.
+        :param received: Размер ответа в байтах.
+        """
+        count = len(requests) or 1
+        for method, operation in requests:
+            self.observe(method, endpoint, latency, error, sent // count, received // count, operation)
+
+    def render_prometheus(self):
+        """
+        Возвращает метрики в текстовом формате Prometheus.
+
+        :return: Строка с метриками.
+        """
+        with self._lock:
+            items = [(key, series.count, series.errors, series.bytes_sent, series.bytes_received,
+                      series.latency_sum, list(series.buckets)) for key, series in self._series.items()]
+        lines = [
+            "# TYPE rpc_requests_total counter",
+            "# TYPE rpc_errors_total counter",
+            "# TYPE rpc_bytes_sent_total counter",
+            "# TYPE rpc_bytes_received_total counter",
+            "# TYPE rpc_latency_seconds histogram",
+        ]
+        for (method, endpoint, operation), count, errors, sent, received, latency_sum, buckets in items:
+            labels = f'method="{method}",endpoint="{endpoint}",operation="{operation}"'
+            lines.append(f"rpc_requests_total{{{labels}}} {count}")
+            lines.append(f"rpc_errors_total{{{labels}}} {errors}")
+            lines.append(f"rpc_bytes_sent_total{{{labels}}} {sent}")
+            lines.append(f"rpc_bytes_received_total{{{labels}}} {received}")
+            cumulative = 0
+            for bound, bucket in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+                cumulative += bucket
+                lines.append(f'rpc_latency_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"rpc_latency_seconds_sum{{{labels}}} {latency_sum}")
+            lines.append(f"rpc_latency_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path=METRICS_FILE):
+        """
+        Атомарно записывает метрики в файл (для node_exporter textfile collector).
+
+        :param path: Путь к файлу.
+        """
+        if not path:
+            return
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as metrics_file:
+            metrics_file.write(self.render_prometheus())
+        os.replace(tmp_path, path)
+
+    def cycle_summary(self, endpoints=None):
+        """
+        Возвращает однострочную сводку RPC за текущий цикл и начинает новый цикл.
+
+        :param endpoints: RPC, вызовы которых входят в сводку (по умолчанию все). Профили сетей,
+                          работающие в одном процессе, подводят итоги только по своим RPC.
+        :return: Строка сводки.
+        """
+        scope = frozenset(endpoints) if endpoints is not None else None
+        with self._lock:
+            if scope is None:
+                cycle, self._cycle = self._cycle, defaultdict(_Series)
+            else:
+                cycle = {key: self._cycle.pop(key) for key in list(self._cycle) if key[1] in scope}
+            now = time.monotonic()
+            elapsed = now - self._cycle_started.get(scope, self._started)
+            self._cycle_started[scope] = now
+        total = sum(s.count for s in cycle.values())
+        errors = sum(s.errors for s in cycle.values())
+        traffic = sum(s.bytes_sent + s.bytes_received for s in cycle.values())
+        by_operation = defaultdict(lambda: [0, 0.0])
+        for (method, _, operation), series in cycle.items():
+            by_operation[f"{operation}:{method}"][0] += series.count
+            by_operation[f"{operation}:{method}"][1] += series.latency_sum
+        top = sorted(by_operation.items(), key=lambda item: item[1][1], reverse=True)[:5]
+        details = ", ".join(f"{name}={count} ({latency * 1000:.0f} мс)" for name, (count, latency) in top)
+        return (f"RPC за цикл ({elapsed:.1f} с): {total} вызовов, {errors} ошибок, "
+                f"{traffic / 1024:.1f} КБ; больше всего времени: {details or '-'}")
+
+
+metrics = RpcMetrics()
+
+
+def instrumented(fn):
+    """
+    Декоратор: RPC-вызовы внутри функции учитываются в метриках под её именем.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _operation.set(name)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _operation.reset(token)
+
+    return wrapper
+
+
+def current_operation():
+    """
+    :return: Имя функции бота, из которой выполняется RPC-вызов в текущем контексте.
+    """
+    return _operation.get()
+
+
+def record_http_bytes(response, *args, **kwargs):
+    """Хук сессии requests: сохраняет размеры запроса и ответа для текущего потока."""
+    body = response.request.body
+    _http_bytes.value = (len(body) if body else 0, len(response.content))
+    return response
+
+
+def take_http_bytes():
+    """
+    Возвращает и сбрасывает размеры последнего HTTP-обмена в текущем потоке.
+
+    :return: Кортеж (отправлено, получено) в байтах.
+    """
+    value = getattr(_http_bytes, "value", (0, 0))
+    _http_bytes.value = (0, 0)
+    return value
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port=METRICS_PORT):
+    """
+    Запускает в фоне HTTP-эндпоинт с метриками в формате Prometheus.
+
+    :param port: Порт (0 — не запускать).
+    :return: Экземпляр сервера или None.
+    """
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
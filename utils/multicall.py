@@ -0,0 +1,189 @@
+from web3 import Web3
+import os
+from dotenv import load_dotenv
+from eth_abi import decode
+from utils.chain_context import current_chain
+from utils.contracts import to_checksum, encode_function_call, get_output_types
+from utils.metrics import instrumented
+from utils.retry_decorator import retry_on_exception
+
+load_dotenv()
+
+# Multicall3 развёрнут по одному и тому же адресу в Ethereum и Base
+MULTICALL3_ADDRESS = Web3.to_checksum_address(
+    os.getenv("MULTICALL3_ADDRESS", "0xcA11bde05977b3631167028862bE2a173976CA11"))
+# Ограничения на размер одного вызова aggregate3
+MULTICALL_MAX_CALLS = int(os.getenv("MULTICALL_MAX_CALLS", 500))
+MULTICALL_MAX_CALLDATA = int(os.getenv("MULTICALL_MAX_CALLDATA", 100_000))  # байт
+MULTICALL_GAS_BUDGET = int(os.getenv("MULTICALL_GAS_BUDGET", 25_000_000))
+MULTICALL_CALL_GAS = int(os.getenv("MULTICALL_CALL_GAS", 30_000))  # оценка газа на один подвызов
+
+MULTICALL3_ABI = [
+    {
+        "inputs": [
+            {
+                "components": [
+                    {"internalType": "address", "name": "target", "type": "address"},
+                    {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                    {"internalType": "bytes", "name": "callData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Call3[]",
+                "name": "calls",
+                "type": "tuple[]",
+            }
+        ],
+        "name": "aggregate3",
+        "outputs": [
+            {
+                "components": [
+                    {"internalType": "bool", "name": "success", "type": "bool"},
+                    {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+                ],
+                "internalType": "struct Multicall3.Result[]",
+                "name": "returnData",
+                "type": "tuple[]",
+            }
+        ],
+        "stateMutability": "payable",
+        "type": "function",
+    }
+]
+
+
+def get_multicall3():
+    """Возвращает контракт Multicall3 текущей сети, создавая его при первом обращении."""
+    return current_chain().contract(MULTICALL3_ADDRESS, MULTICALL3_ABI)
+
+
+def encode_call(target, abi_path, fn_name, args):
+    """
+    Кодирует вызов функции контракта для передачи в aggregate3.
+
+    :param target: Адрес контракта.
+    :param abi_path: Путь к файлу с ABI контракта.
+    :param fn_name: Имя функции.
+    :param args: Аргументы функции.
+    :return: Кортеж (target, calldata, output_types).
+    """
+    return to_checksum(target), encode_function_call(abi_path, fn_name, args), get_output_types(abi_path, fn_name)
+
+
+def split_into_chunks(calls):
+    """
+    Разбивает список вызовов на пачки с учётом количества вызовов, размера calldata и газа.
+
+    :param calls: Список кортежей (target, calldata, output_types).
+    :return: Список пачек вызовов.
+    """
+    chunks = []
+    current, size, gas = [], 0, 0
+    for call in calls:
+        call_size = len(call[1]) // 2  # hex -> байты
+        if current and (len(current) >= MULTICALL_MAX_CALLS
+                        or size + call_size > MULTICALL_MAX_CALLDATA
+                        or gas + MULTICALL_CALL_GAS > MULTICALL_GAS_BUDGET):
+            chunks.append(current)
+            current, size, gas = [], 0, 0
+        current.append(call)
+        size += call_size
+        gas += MULTICALL_CALL_GAS
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+@retry_on_exception()
+@instrumented
+def _aggregate3(chunk, block_identifier='latest'):
+    return get_multicall3().functions.aggregate3(
+        [(target, True, calldata) for target, calldata, _ in chunk]
+    ).call(block_identifier=block_identifier)
+
+
+def aggregate(calls, block_identifier='latest'):
+    """
+    Выполняет список вызовов через Multicall3 минимальным числом eth_call.
+
+    :param calls: Список кортежей (target, calldata, output_types), см. encode_call.
+    :param block_identifier: Блок, на котором читается состояние.
+    :return: Список декодированных результатов (None для упавших вызовов) в исходном порядке.
+    """
+    results = []
+    for chunk in split_into_chunks(calls):
+        for (_, _, output_types), (success, return_data) in zip(chunk, _aggregate3(chunk, block_identifier)):
+            if not success or not return_data:
+                results.append(None)
+                continue
+            decoded = decode(output_types, return_data)
+            results.append(decoded[0] if len(decoded) == 1 else decoded)
+    return results
+
+
+def get_wallets_state(wallet_addresses, position_manager_address, abi_path, token_address, erc20_abi_path):
+    """
+    Считывает состояние всех кошельков пакетно: allowance, ID последней позиции и данные позиции.
+
+    Заменяет отдельные вызовы get_user_position, get_position_liquidity и check_allowance
+    для каждого кошелька тремя раундами aggregate3 (количество NFT и allowance, ID позиций, данные позиций).
+
+    :param wallet_addresses: Список адресов кошельков.
+    :param position_manager_address: Адрес контракта NonFungiblePositionManager.
+    :param abi_path: Путь к файлу с ABI контракта.
+    :param token_address: Адрес токена, для которого проверяется allowance.
+    :param erc20_abi_path: Путь с ABI ERC20.
+    :return: Словарь {адрес: {"allowance", "token_id", "position", "liquidity"}}. Значения, которые не удалось
+             прочитать (упавший подвызов), равны None: пустой allowance или позицию нельзя отличить от ошибки чтения.
+    """
+    spender = to_checksum(position_manager_address)
+
+    # Раунд 1: количество NFT и allowance для каждого кошелька
+    calls = []
+    for address in wallet_addresses:
+        calls.append(encode_call(spender, abi_path, "balanceOf", [address]))
+        calls.append(encode_call(token_address, erc20_abi_path, "allowance", [address, spender]))
+    results = aggregate(calls)
+
+    states = {}
+    balances = {}
+    for i, address in enumerate(wallet_addresses):
+        balances[address] = results[2 * i]
+        states[address] = {
+            "allowance": results[2 * i + 1],
+            "token_id": None,
+            "position": None,
+            # Ликвидность известна только для кошельков без NFT; для остальных она читается ниже
+            "liquidity": 0 if balances[address] == 0 else None,
+        }
+    with_positions = [address for address in wallet_addresses if balances[address]]
+
+    # Раунд 2: ID последней позиции
+    token_ids = aggregate([
+        encode_call(spender, abi_path, "tokenOfOwnerByIndex", [address, balances[address] - 1])
+        for address in with_positions
+    ])
+    for address, token_id in zip(with_positions, token_ids):
+        states[address]["token_id"] = token_id
+
+    # Раунд 3: данные позиций
+    with_ids = [address for address in with_positions if states[address]["token_id"] is not None]
+    positions = aggregate([
+        encode_call(spender, abi_path, "positions", [states[address]["token_id"]])
+        for address in with_ids
+    ])
+    for address, position in zip(with_ids, positions):
+        if position is not None:
+            states[address]["position"] = position
+            states[address]["liquidity"] = position[7]  # Ликвидность находится на 7-м месте в структуре
+
+    return states
+
+
+def unread_wallets(states):
+    """
+    Возвращает кошельки, позицию которых не удалось прочитать (упал один из подвызовов).
+    Такие кошельки нельзя считать пустыми: они пропускаются до успешного чтения.
+
+    :param states: Состояние кошельков из get_wallets_state.
+    :return: Список адресов.
+    """
+    return [address for address, state in states.items() if state["liquidity"] is None]
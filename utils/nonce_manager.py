@@ -0,0 +1,77 @@
+import threading
+
+
+class NonceManager:
+    """
+    Локальный распределитель nonce для кошельков.
+
+    Nonce запрашивается у ноды один раз на кошелёк (с учётом pending-транзакций),
+    дальше выдаётся последовательно без обращений к RPC. После ошибки отправки
+    счётчик сбрасывается и при следующем обращении сверяется с блокчейном.
+    """
+
+    def __init__(self):
+        self._nonces = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _wallet_lock(self, address):
+        with self._lock:
+            return self._locks.setdefault(address.lower(), threading.Lock())
+
+    def next_nonce(self, web3, address):
+        """
+        Выдаёт следующий nonce для кошелька.
+
+        :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+        :param address: Адрес кошелька.
+        :return: Nonce для новой транзакции.
+        """
+        key = address.lower()
+        with self._wallet_lock(address):
+            if key not in self._nonces:
+                self._nonces[key] = web3.eth.get_transaction_count(address, 'pending')
+            nonce = self._nonces[key]
+            self._nonces[key] = nonce + 1
+            return nonce
+
+    def prefetch(self, web3, addresses, batch_size=100):
+        """
+        Запрашивает nonce сразу для многих кошельков пакетными JSON-RPC запросами.
+        Кошельки, nonce которых уже известен, пропускаются.
+
+        :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+        :param addresses: Адреса кошельков.
+        :param batch_size: Максимум запросов в одном пакете.
+        """
+        with self._lock:
+            missing = [address for address in addresses if address.lower() not in self._nonces]
+        for i in range(0, len(missing), batch_size):
+            chunk = missing[i:i + batch_size]
+            responses = web3.provider.make_batch_request(
+                [("eth_getTransactionCount", [address, "pending"]) for address in chunk])
+            if not isinstance(responses, list):
+                raise ConnectionError(f"RPC вернул ошибку пакетного запроса: {responses}")
+            for address, response in zip(chunk, responses):
+                if "result" in response:
+                    with self._wallet_lock(address):
+                        self._nonces.setdefault(address.lower(), int(response["result"], 16))
+
+    def set_nonce(self, address, nonce):
+        """
+        Устанавливает следующий nonce кошелька, уже известный вызывающему коду.
+
+        :param address: Адрес кошелька.
+        :param nonce: Nonce следующей транзакции.
+        """
+        with self._wallet_lock(address):
+            self._nonces[address.lower()] = nonce
+
+    def reset(self, address):
+        """
+        Сбрасывает локальный счётчик кошелька, следующий nonce будет запрошен у ноды.
+
+        :param address: Адрес кошелька.
+        """
+        with self._wallet_lock(address):
+            self._nonces.pop(address.lower(), None)
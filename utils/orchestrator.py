@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from utils.chain_context import ChainContext, use_chain
+from utils.select_chain import chain_config, resolve_chain_name
+
+load_dotenv()
+
+PROFILES_PATH = os.getenv("PROFILES_PATH", "profiles.json")  # Файл с профилями сетей и пулов
+PROFILES_DATA_DIR = os.getenv("PROFILES_DATA_DIR", "profiles")  # Папка для состояния профилей
+PROFILE_RESTART_DELAY = float(os.getenv("PROFILE_RESTART_DELAY", 10))  # Пауза перед перезапуском профиля (секунды)
+PROFILE_MAX_RESTART_DELAY = float(os.getenv("PROFILE_MAX_RESTART_DELAY", 300))  # Максимальная пауза
+
+# Настройки бота, которые профиль может задать в "env"; остальные переменные окружения общие для процесса
+PROFILE_SETTINGS = ("RANGE_WIDTH", "THRESHOLD_PERCENT", "AMOUNT0", "REBALANCE_MODE", "REBALANCE_BURN",
+                    "PRICE_TRIGGER", "POSITION_SOURCE", "CYCLE_BUDGET", "ADD_IF_EMPTY", "WALLETS_PATH",
+                    "STATE_DB_PATH", "POSITION_INDEX_PATH", "WALLET_CACHE_PATH")
+
+
+def load_profiles(path=PROFILES_PATH):
+    """
+    Загружает и проверяет профили из JSON файла.
+
+    Формат: {"profiles": [{"name": ..., "chain": "base", "wallets": "wallets.txt",
+    "config": {параметры сети и пула}, "env": {настройки бота из PROFILE_SETTINGS}}, ...]}.
+
+    :param path: Путь к файлу профилей.
+    :return: Список профилей.
+    """
+    with open(path, "r") as profiles_file:
+        profiles = json.load(profiles_file)["profiles"]
+    names = set()
+    wallets = {}
+    for profile in profiles:
+        name = profile.get("name")
+        if not name or name in names:
+            raise ValueError(f"У каждого профиля должно быть уникальное имя: {name!r}")
+        names.add(name)
+        chain = resolve_chain_name(profile.get("chain", ""))
+        if chain is None:
+            raise ValueError(f"Неизвестная сеть в профиле {name}: {profile.get('chain')!r}")
+        shared = sorted(set(profile.get("env", {})) - set(PROFILE_SETTINGS))
+        if shared:
+            raise ValueError(f"Профиль {name} не может задавать {', '.join(shared)}: "
+                             f"эти настройки общие для всех профилей процесса")
+        # Один кошелёк в двух профилях одной сети получит конфликтующие nonce
+        key = (chain, os.path.abspath(profile.get("wallets", "wallets.txt")))
+        if key in wallets:
+            raise ValueError(f"Профили {wallets[key]} и {name} используют одни кошельки в сети {chain}")
+        wallets[key] = name
+    return profiles
+
+
+def profile_settings(profile, data_dir=PROFILES_DATA_DIR):
+    """
+    Возвращает настройки бота профиля: отдельные файлы состояния, индекса и кэша кошельков
+    для каждого профиля плюс настройки из профиля.
+
+    :param profile: Профиль.
+    :param data_dir: Папка для данных профилей.
+    :return: Словарь настроек (имя переменной окружения -> значение).
+    """
+    folder = os.path.join(data_dir, profile["name"])
+    settings = {
+        "STATE_DB_PATH": os.path.join(folder, "state.db"),
+        "POSITION_INDEX_PATH": os.path.join(folder, "positions.db"),
+        "WALLET_CACHE_PATH": os.path.join(folder, ".wallets_cache"),
+        "WALLETS_PATH": profile.get("wallets", "wallets.txt"),
+        # В потоке профиля некому ответить на вопрос о пустых кошельках
+        "ADD_IF_EMPTY": "0",
+    }
+    settings.update({key: str(value) for key, value in profile.get("env", {}).items()})
+    return settings
+
+
+def create_context(profile, data_dir=PROFILES_DATA_DIR, provider_factory=None):
+    """
+    Создаёт контекст сети профиля: настройки сети с заменами из "config" и настройки бота из "env".
+
+    :param profile: Профиль.
+    :param data_dir: Папка для данных профилей.
+    :param provider_factory: Функция, создающая провайдер для одного RPC (по умолчанию — HTTP).
+    :return: ChainContext.
+    """
+    _, config = chain_config(profile["chain"], profile.get("config"))
+    os.makedirs(os.path.join(data_dir, profile["name"]), exist_ok=True)
+    return ChainContext(config, profile["name"], profile_settings(profile, data_dir), provider_factory)
+
+
+def run_profile(context, password=None):
+    """
+    Запускает основной цикл бота в контексте сети профиля (в текущем потоке).
+
+    :param context: ChainContext профиля.
+    :param password: Пароль от ключей.
+    """
+    import main
+    with use_chain(context):
+        main.run(password)
+
+
+class Orchestrator:
+    """
+    Запускает несколько профилей (сеть, пул, кошельки) одновременно в одном процессе.
+
+    Каждый профиль работает в своём потоке со своим ChainContext: пулом RPC, кэшами, nonce,
+    оценкой комиссии, отслеживанием квитанций и расписанием проверок. Логи и метрики общие,
+    записи логов помечены именем профиля. Упавший профиль перезапускается с растущей паузой,
+    остальные продолжают работу.
+    """
+
+    def __init__(self, profiles, data_dir=PROFILES_DATA_DIR, password=None, provider_factory=None):
+        """
+        :param profiles: Список профилей из load_profiles.
+        :param data_dir: Папка для данных профилей.
+        :param password: Пароль от ключей, общий для всех профилей.
+        :param provider_factory: Функция, создающая провайдер для одного RPC (по умолчанию — HTTP).
+        """
+        self.profiles = {profile["name"]: profile for profile in profiles}
+        self.password = password
+        self.contexts = {name: create_context(profile, data_dir, provider_factory)
+                         for name, profile in self.profiles.items()}
+        self._threads = {}
+        self._errors = {}
+        self._started_at = {}
+        self._restart_at = {}
+        self._delays = {}
+
+    def _run(self, name):
+        try:
+            run_profile(self.contexts[name], self.password)
+            self._errors[name] = "основной цикл завершился"
+        except BaseException as e:
+            # SystemExit тоже: main.run завершает работу через exit(), если нет approve
+            self._errors[name] = f"{type(e).__name__}: {e}"
+
+    def _start(self, name):
+        from utils.logger import setup_logger
+        thread = threading.Thread(target=self._run, args=(name,), name=f"profile-{name}", daemon=True)
+        self._errors.pop(name, None)
+        thread.start()
+        self._threads[name] = thread
+        self._started_at[name] = time.monotonic()
+        setup_logger("orchestrator").info(f"Профиль {name} запущен.")
+
+    def start(self):
+        """Запускает потоки всех профилей."""
+        for name in self.profiles:
+            self._start(name)
+
+    def check(self):
+        """Перезапускает завершившиеся профили по истечении паузы."""
+        from utils.logger import setup_logger
+        logger = setup_logger("orchestrator")
+        now = time.monotonic()
+        for name, thread in list(self._threads.items()):
+            if thread.is_alive():
+                continue
+            if name not in self._restart_at:
+                # Профиль, проработавший дольше максимальной паузы, перезапускается быстро
+                if now - self._started_at[name] > PROFILE_MAX_RESTART_DELAY:
+                    self._delays[name] = PROFILE_RESTART_DELAY
+                delay = self._delays.get(name, PROFILE_RESTART_DELAY)
+                self._delays[name] = min(delay * 2, PROFILE_MAX_RESTART_DELAY)
+                self._restart_at[name] = now + delay
+                logger.error(f"Профиль {name} остановлен ({self._errors.get(name)}), "
+                             f"перезапуск через {delay:.0f} с.")
+            elif now >= self._restart_at[name]:
+                del self._restart_at[name]
+                # Nonce и комиссии упавшего профиля перечитываются из сети
+                self.contexts[name].reset()
+                self._start(name)
+
+    def run(self, interval=1.0):
+        """
+        Запускает профили и следит за ними до прерывания. Потоки профилей завершаются вместе с процессом.
+
+        :param interval: Интервал проверки потоков в секундах.
+        """
+        from utils.metrics import start_http_server
+        # Один HTTP-эндпоинт метрик на процесс, метрики всех профилей различаются метками RPC
+        start_http_server()
+        self.start()
+        while True:
+            time.sleep(interval)
+            self.check()
+
+
+def ask_password(profiles):
+    """
+    Запрашивает пароль один раз, если ключи хотя бы одного профиля зашифрованы.
+
+    :param profiles: Список профилей.
+    :return: Пароль или None.
+    """
+    from utils.decryption import is_base64, derive_key, decrypt_with_key, get_password
+    from utils.wallet_loader import read_key_lines
+    for profile in profiles:
+        lines = read_key_lines(profile.get("wallets", "wallets.txt"))
+        if lines and is_base64(lines[0]):
+            # Пароль проверяется здесь, иначе профили будут падать и перезапускаться
+            while True:
+                password = get_password("Введите пароль для расшифровки ключей: ").strip()
+                try:
+                    decrypt_with_key(lines[0], derive_key(password))
+                    return password
+                except (ValueError, UnicodeDecodeError):
+                    print("Неверный пароль, попробуйте снова.")
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Запуск нескольких сетей и пулов в одном экземпляре бота.")
+    parser.add_argument("--profiles", default=PROFILES_PATH, help="Файл с профилями")
+    parser.add_argument("--data-dir", default=PROFILES_DATA_DIR, help="Папка для состояния профилей")
+    args = parser.parse_args()
+
+    profiles = load_profiles(args.profiles)
+    Orchestrator(profiles, args.data_dir, ask_password(profiles)).run()
@@ -0,0 +1,134 @@
+import numpy as np
+from utils import tickmath
+from utils.rebalance import rebalance_triggers
+
+
+def position_ticks(state):
+    """
+    Возвращает тики и ликвидность позиции из состояния кошелька.
+
+    :param state: Состояние кошелька из multicall.get_wallets_state или PositionIndex.get_wallets_state.
+    :return: Кортеж (tick_lower, tick_upper, liquidity); для кошелька без позиции — (0, 0, 0).
+    """
+    position = state.get("position")
+    if not position:
+        return 0, 0, 0
+    if isinstance(position, dict):
+        return position["tick_lower"] or 0, position["tick_upper"] or 0, state.get("liquidity") or 0
+    # Структура positions(): tickLower, tickUpper и liquidity на 5-м, 6-м и 7-м местах
+    return position[5], position[6], state.get("liquidity") or 0
+
+
+class PositionBook:
+    """
+    Диапазоны позиций всех кошельков в массивах NumPy.
+
+    Для каждого кошелька хранятся тики позиции, ликвидность и заранее вычисленные цены
+    срабатывания порога (rebalance.rebalance_triggers, как в rebalance.should_rebalance).
+    Проверка всех позиций при новой цене — два сравнения массивов, без цикла по кошелькам.
+    """
+
+    def __init__(self, threshold_percent, decimals0, decimals1):
+        """
+        :param threshold_percent: Порог ребалансировки (доля ширины диапазона).
+        :param decimals0: Количество знаков token0 (из настроек сети).
+        :param decimals1: Количество знаков token1 (из настроек сети).
+        """
+        self.threshold_percent = threshold_percent
+        self.decimals0 = decimals0
+        self.decimals1 = decimals1
+        self.addresses = []
+        self._index = {}
+        self.tick_lower = np.zeros(0, dtype=np.int32)
+        self.tick_upper = np.zeros(0, dtype=np.int32)
+        # float64: точности хватает, чтобы отличать пустые позиции и сравнивать объёмы
+        self.liquidity = np.zeros(0, dtype=np.float64)
+        self._trigger_lower = np.zeros(0, dtype=np.float64)
+        self._trigger_upper = np.zeros(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def _grow(self, addresses):
+        new = [address for address in dict.fromkeys(addresses) if address not in self._index]
+        if not new:
+            return
+        for address in new:
+            self._index[address] = len(self.addresses)
+            self.addresses.append(address)
+        extra = len(new)
+        self.tick_lower = np.concatenate([self.tick_lower, np.zeros(extra, dtype=np.int32)])
+        self.tick_upper = np.concatenate([self.tick_upper, np.zeros(extra, dtype=np.int32)])
+        self.liquidity = np.concatenate([self.liquidity, np.zeros(extra, dtype=np.float64)])
+        self._trigger_lower = np.concatenate([self._trigger_lower, np.zeros(extra, dtype=np.float64)])
+        self._trigger_upper = np.concatenate([self._trigger_upper, np.zeros(extra, dtype=np.float64)])
+
+    def _set(self, rows, tick_lower, tick_upper, liquidity):
+        rows = np.asarray(rows, dtype=np.int64)
+        tick_lower = np.asarray(tick_lower, dtype=np.int32)
+        tick_upper = np.asarray(tick_upper, dtype=np.int32)
+        self.tick_lower[rows] = tick_lower
+        self.tick_upper[rows] = tick_upper
+        self.liquidity[rows] = np.asarray(liquidity, dtype=np.float64)
+        price_lower = tickmath.ticks_to_prices(tick_lower, self.decimals0, self.decimals1)
+        price_upper = tickmath.ticks_to_prices(tick_upper, self.decimals0, self.decimals1)
+        self._trigger_lower[rows], self._trigger_upper[rows] = rebalance_triggers(
+            price_lower, price_upper, self.threshold_percent)
+
+    def update(self, states):
+        """
+        Записывает позиции из прочитанного состояния кошельков.
+
+        :param states: Словарь {адрес: состояние} из get_wallets_state.
+        """
+        self._grow(states)
+        rows, ticks_lower, ticks_upper, liquidity = [], [], [], []
+        for address, state in states.items():
+            tick_lower, tick_upper, amount = position_ticks(state)
+            rows.append(self._index[address])
+            ticks_lower.append(tick_lower)
+            ticks_upper.append(tick_upper)
+            liquidity.append(amount)
+        if rows:
+            self._set(rows, ticks_lower, ticks_upper, liquidity)
+
+    def set_range(self, wallet_address, tick_lower, tick_upper):
+        """
+        Записывает диапазон только что отправленной позиции до того, как её прочитают из сети.
+
+        :param wallet_address: Адрес кошелька.
+        :param tick_lower: Нижний тик новой позиции.
+        :param tick_upper: Верхний тик новой позиции.
+        """
+        self._grow([wallet_address])
+        # Точная ликвидность неизвестна до подтверждения, важно лишь, что позиция не пустая
+        self._set([self._index[wallet_address]], [tick_lower], [tick_upper], [1])
+
+    def needs_action(self, current_price, include_empty=False):
+        """
+        Возвращает маску позиций, которым нужна ребалансировка при текущей цене.
+
+        :param current_price: Текущая цена ETH.
+        :param include_empty: Отмечать ли кошельки без ликвидности (для добавления новой позиции).
+        :return: Массив bool по порядку self.addresses.
+        """
+        active = self.liquidity > 0
+        out_of_range = (current_price > self._trigger_upper) | (current_price < self._trigger_lower)
+        mask = active & out_of_range
+        if include_empty:
+            mask |= ~active
+        return mask
+
+    def wallets_to_rebalance(self, current_price, include_empty=False):
+        """
+        Возвращает адреса кошельков, которым нужна ребалансировка при текущей цене.
+
+        :param current_price: Текущая цена ETH.
+        :param include_empty: Включать ли кошельки без ликвидности.
+        :return: Список адресов.
+        """
+        return [self.addresses[i] for i in np.flatnonzero(self.needs_action(current_price, include_empty))]
+
+    def empty_wallets(self):
+        """Возвращает адреса кошельков без ликвидности."""
+        return [self.addresses[i] for i in np.flatnonzero(self.liquidity <= 0)]
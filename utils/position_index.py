@@ -0,0 +1,288 @@
+import os
+import sqlite3
+import threading
+from eth_abi import decode
+from web3 import Web3
+from dotenv import load_dotenv
+from utils.multicall import aggregate, encode_call
+
+load_dotenv()
+
+POSITION_INDEX_PATH = os.getenv("POSITION_INDEX_PATH", "positions.db")  # Файл SQLite с индексом позиций
+POSITION_INDEX_START_BLOCK = os.getenv("POSITION_INDEX_START_BLOCK")  # Блок начала сканирования (по умолчанию — деплой)
+POSITION_INDEX_CONFIRMATIONS = int(os.getenv("POSITION_INDEX_CONFIRMATIONS", 0))  # Отставание от последнего блока
+LOGS_CHUNK_SIZE = int(os.getenv("LOGS_CHUNK_SIZE", 5_000))  # Начальный диапазон блоков в одном eth_getLogs
+LOGS_MAX_CHUNK_SIZE = int(os.getenv("LOGS_MAX_CHUNK_SIZE", 100_000))
+LOGS_TOPIC_GROUP = int(os.getenv("LOGS_TOPIC_GROUP", 100))  # Адресов или ID позиций в одном фильтре
+POSITION_MANAGER_ABI_PATH = os.getenv('POSITION_MANAGER_ABI_PATH', 'utils/position_manager_abi.json')
+
+TRANSFER_TOPIC = Web3.keccak(text="Transfer(address,address,uint256)").to_0x_hex()
+INCREASE_LIQUIDITY_TOPIC = Web3.keccak(text="IncreaseLiquidity(uint256,uint128,uint256,uint256)").to_0x_hex()
+DECREASE_LIQUIDITY_TOPIC = Web3.keccak(text="DecreaseLiquidity(uint256,uint128,uint256,uint256)").to_0x_hex()
+
+# Ответы RPC на слишком большой диапазон блоков или слишком много логов в eth_getLogs
+LOGS_RANGE_MARKERS = (
+    "block range", "range too large", "range is too large", "too wide", "is limited to", "too many blocks",
+    "returned more than", "too many results", "response size", "max results", "exceeds max",
+)
+
+# Блоки деплоя NonfungiblePositionManager: раньше событий позиций быть не может
+DEPLOY_BLOCKS = {
+    "0xc36442b4a4522e871399cd717abdd847ab11fe88": 12_369_651,  # Ethereum
+    "0x03a520b32c04bf3beef7beb72e919cf822ed34f1": 1_371_680,  # Base
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    token_id INTEGER PRIMARY KEY,
+    owner TEXT NOT NULL,
+    tick_lower INTEGER,
+    tick_upper INTEGER,
+    liquidity TEXT,
+    liquidity_block INTEGER
+);
+CREATE INDEX IF NOT EXISTS positions_owner ON positions (owner);
+CREATE TABLE IF NOT EXISTS wallets (
+    address TEXT PRIMARY KEY,
+    last_block INTEGER NOT NULL
+);
+"""
+
+
+def address_topic(address):
+    return "0x" + "00" * 12 + address.lower()[2:]
+
+
+def uint_topic(value):
+    return "0x" + value.to_bytes(32, "big").hex()
+
+
+def topic_to_address(topic):
+    return "0x" + bytes(topic)[-20:].hex()
+
+
+def is_range_too_large(exception):
+    """
+    Проверяет, отклонил ли RPC запрос логов из-за размера диапазона или ответа.
+
+    :param exception: Исключение (проверяется вся цепочка причин).
+    :return: True, если диапазон нужно уменьшить.
+    """
+    seen = set()
+    while exception is not None and id(exception) not in seen:
+        seen.add(id(exception))
+        message = str(exception).lower()
+        if any(marker in message for marker in LOGS_RANGE_MARKERS):
+            return True
+        exception = exception.__cause__ or exception.__context__
+    return False
+
+
+def _groups(items, size=LOGS_TOPIC_GROUP):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class PositionIndex:
+    """
+    Локальный индекс NFT-позиций кошельков в SQLite.
+
+    Владельцы позиций восстанавливаются по событиям Transfer контракта NonfungiblePositionManager,
+    ликвидность — по IncreaseLiquidity/DecreaseLiquidity. Тики и ликвидность новой позиции
+    читаются один раз через Multicall3 на блоке, до которого выполнено сканирование.
+    Для каждого кошелька хранится последний просканированный блок, поэтому после
+    перезапуска сканируются только новые блоки.
+    """
+
+    def __init__(self, position_manager_address, db_path=POSITION_INDEX_PATH, start_block=POSITION_INDEX_START_BLOCK,
+                 abi_path=POSITION_MANAGER_ABI_PATH):
+        """
+        :param position_manager_address: Адрес контракта NonfungiblePositionManager.
+        :param db_path: Путь к файлу SQLite.
+        :param start_block: Блок, с которого сканируются новые кошельки.
+        :param abi_path: Путь к файлу с ABI контракта.
+        """
+        self.position_manager = Web3.to_checksum_address(position_manager_address)
+        self.abi_path = abi_path
+        if start_block is None:
+            start_block = DEPLOY_BLOCKS.get(position_manager_address.lower(), 0)
+        self.start_block = int(start_block)
+        self.chunk_size = LOGS_CHUNK_SIZE
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    # -- сканирование --
+
+    def _get_logs(self, web3, topic_filters, from_block, to_block):
+        """
+        Читает логи диапазонами блоков, подстраивая размер диапазона под ограничения RPC.
+        Диапазон уменьшается только в ответ на ошибку размера диапазона или ответа;
+        остальные ошибки (сеть, лимит времени, исключённые RPC) передаются вызывающему коду.
+
+        :param topic_filters: Список фильтров topics; все они читаются на одном диапазоне.
+        :return: Генератор кортежей (начало диапазона, конец диапазона, список логов всех фильтров).
+        """
+        start = from_block
+        while start <= to_block:
+            end = min(start + self.chunk_size - 1, to_block)
+            try:
+                logs = [log for topics in topic_filters
+                        for log in web3.eth.get_logs({"address": self.position_manager, "topics": topics,
+                                                      "fromBlock": start, "toBlock": end})]
+            except Exception as e:
+                if not is_range_too_large(e) or self.chunk_size == 1:
+                    raise
+                # Слишком большой диапазон или слишком много логов: уменьшаем диапазон
+                self.chunk_size = max(1, self.chunk_size // 2)
+                continue
+            yield start, end, logs
+            if len(logs) < 1000:
+                self.chunk_size = min(self.chunk_size * 2, LOGS_MAX_CHUNK_SIZE)
+            start = end + 1
+
+    def _scan_transfers(self, web3, wallets, from_block, to_block):
+        wallet_topics = [address_topic(address) for address in wallets]
+        incoming = [TRANSFER_TOPIC, None, wallet_topics]
+        outgoing = [TRANSFER_TOPIC, wallet_topics]
+        tracked = {address.lower() for address in wallets}
+        for _, end, logs in self._get_logs(web3, [incoming, outgoing], from_block, to_block):
+            logs.sort(key=lambda log: (log["blockNumber"], log["logIndex"]))
+            with self._lock, self._db:
+                for log in logs:
+                    token_id = int.from_bytes(bytes(log["topics"][3]), "big")
+                    owner = topic_to_address(log["topics"][2])
+                    if owner in tracked:
+                        # Позиция пришла на кошелёк: ликвидность будет прочитана заново
+                        self._db.execute(
+                            "INSERT INTO positions (token_id, owner) VALUES (?, ?) ON CONFLICT(token_id) "
+                            "DO UPDATE SET owner = excluded.owner, liquidity_block = NULL", (token_id, owner))
+                    else:
+                        self._db.execute("UPDATE positions SET owner = ? WHERE token_id = ?", (owner, token_id))
+                self._db.executemany("INSERT INTO wallets (address, last_block) VALUES (?, ?) ON CONFLICT(address) "
+                                     "DO UPDATE SET last_block = excluded.last_block",
+                                     [(address, end) for address in tracked])
+
+    def _snapshot_new(self, owners, to_block):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT token_id FROM positions WHERE liquidity_block IS NULL "
+                f"AND owner IN ({','.join('?' * len(owners))})", owners).fetchall()
+        token_ids = [row[0] for row in rows]
+        if not token_ids:
+            return
+        positions = aggregate([encode_call(self.position_manager, self.abi_path, "positions", [token_id])
+                               for token_id in token_ids], block_identifier=to_block)
+        with self._lock, self._db:
+            for token_id, position in zip(token_ids, positions):
+                if position is None:
+                    # Позиция сожжена
+                    self._db.execute("UPDATE positions SET liquidity = '0', liquidity_block = ? WHERE token_id = ?",
+                                     (to_block, token_id))
+                else:
+                    self._db.execute("UPDATE positions SET tick_lower = ?, tick_upper = ?, liquidity = ?, "
+                                     "liquidity_block = ? WHERE token_id = ?",
+                                     (position[5], position[6], str(position[7]), to_block, token_id))
+
+    def _scan_liquidity(self, web3, owners, to_block):
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT token_id, liquidity_block FROM positions WHERE liquidity_block < ? "
+                f"AND owner IN ({','.join('?' * len(owners))})", [to_block] + owners).fetchall()
+        by_block = {}
+        for token_id, liquidity_block in rows:
+            by_block.setdefault(liquidity_block, []).append(token_id)
+        for liquidity_block, token_ids in by_block.items():
+            for group in _groups(token_ids):
+                topics = [[INCREASE_LIQUIDITY_TOPIC, DECREASE_LIQUIDITY_TOPIC], [uint_topic(t) for t in group]]
+                for _, end, logs in self._get_logs(web3, [topics], liquidity_block + 1, to_block):
+                    deltas = {}
+                    for log in logs:
+                        token_id = int.from_bytes(bytes(log["topics"][1]), "big")
+                        liquidity, = decode(["uint128"], bytes(log["data"])[:32])
+                        sign = 1 if Web3.to_hex(log["topics"][0]) == INCREASE_LIQUIDITY_TOPIC else -1
+                        deltas[token_id] = deltas.get(token_id, 0) + sign * liquidity
+                    with self._lock, self._db:
+                        for token_id in group:
+                            if token_id in deltas:
+                                current = self._db.execute("SELECT liquidity FROM positions WHERE token_id = ?",
+                                                           (token_id,)).fetchone()[0]
+                                self._db.execute("UPDATE positions SET liquidity = ? WHERE token_id = ?",
+                                                 (str(int(current) + deltas[token_id]), token_id))
+                            self._db.execute("UPDATE positions SET liquidity_block = ? WHERE token_id = ?",
+                                             (end, token_id))
+
+    def sync(self, web3, wallet_addresses):
+        """
+        Догоняет индекс до последнего блока: сканирует только блоки после последнего
+        просканированного для каждого кошелька.
+
+        :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+        :param wallet_addresses: Адреса кошельков.
+        :return: Номер блока, до которого актуален индекс.
+        """
+        to_block = web3.eth.block_number - POSITION_INDEX_CONFIRMATIONS
+        owners = [address.lower() for address in wallet_addresses]
+        with self._lock:
+            known = dict(self._db.execute("SELECT address, last_block FROM wallets").fetchall())
+        by_block = {}
+        for address in owners:
+            by_block.setdefault(known.get(address, self.start_block - 1) + 1, []).append(address)
+        for from_block, wallets in sorted(by_block.items()):
+            if from_block <= to_block:
+                for group in _groups(wallets):
+                    self._scan_transfers(web3, group, from_block, to_block)
+        for group in _groups(owners, 500):
+            self._snapshot_new(group, to_block)
+            self._scan_liquidity(web3, group, to_block)
+        return to_block
+
+    # -- запросы --
+
+    def get_positions(self, wallet_address):
+        """
+        Возвращает все позиции кошелька из индекса.
+
+        :param wallet_address: Адрес кошелька.
+        :return: Список словарей {token_id, tick_lower, tick_upper, liquidity} по возрастанию ID.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT token_id, tick_lower, tick_upper, liquidity FROM positions "
+                                    "WHERE owner = ? ORDER BY token_id", (wallet_address.lower(),)).fetchall()
+        return [{"token_id": token_id, "tick_lower": tick_lower, "tick_upper": tick_upper,
+                 "liquidity": int(liquidity or 0)} for token_id, tick_lower, tick_upper, liquidity in rows]
+
+    def get_active_position(self, wallet_address):
+        """
+        Возвращает активную позицию кошелька: последнюю с ненулевой ликвидностью,
+        а если таких нет — последнюю из всех.
+
+        :param wallet_address: Адрес кошелька.
+        :return: Словарь позиции или None, если позиций нет.
+        """
+        positions = self.get_positions(wallet_address)
+        with_liquidity = [position for position in positions if position["liquidity"]]
+        if with_liquidity:
+            return with_liquidity[-1]
+        return positions[-1] if positions else None
+
+    def get_wallets_state(self, wallet_addresses):
+        """
+        Возвращает состояние кошельков из индекса в формате multicall.get_wallets_state (без allowance).
+
+        :param wallet_addresses: Адреса кошельков.
+        :return: Словарь {адрес: {"allowance", "token_id", "position", "liquidity"}}.
+        """
+        states = {}
+        for address in wallet_addresses:
+            position = self.get_active_position(address)
+            states[address] = {
+                "allowance": None,
+                "token_id": position["token_id"] if position else None,
+                "position": position,
+                "liquidity": position["liquidity"] if position else 0,
+            }
+        return states
+
+    def close(self):
+        with self._lock:
+            self._db.close()
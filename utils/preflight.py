@@ -0,0 +1,116 @@
+import os
+from dotenv import load_dotenv
+from utils.errors import PreflightError, REVERT_MARKERS
+
+load_dotenv()
+
+PREFLIGHT_BATCH_SIZE = int(os.getenv("PREFLIGHT_BATCH_SIZE", 50))  # Транзакций в одном пакетном JSON-RPC запросе
+PREFLIGHT_ACCESS_LISTS = os.getenv("PREFLIGHT_ACCESS_LISTS", "1").lower() in ("1", "true", "yes")
+PREFLIGHT_GAS_MARGIN = float(os.getenv("PREFLIGHT_GAS_MARGIN", 1.2))  # Запас к оценке газа в лимите транзакции
+
+
+def _rpc_value(value):
+    return value if isinstance(value, str) else hex(value)
+
+
+def to_rpc_call(transaction):
+    """
+    Преобразует неподписанную транзакцию в параметры eth_call/eth_estimateGas.
+
+    :param transaction: Словарь {"from", "to", "data", "value"}.
+    :return: Словарь с hex-значениями.
+    """
+    call = {"from": transaction["from"], "to": transaction["to"], "data": transaction["data"]}
+    if transaction.get("value"):
+        call["value"] = _rpc_value(transaction["value"])
+    return call
+
+
+def _error_message(response):
+    error = response.get("error")
+    if isinstance(error, dict):
+        return error.get("message") or str(error)
+    return str(error)
+
+
+def _is_revert(response):
+    error = response.get("error")
+    if isinstance(error, dict) and error.get("code") == 3:
+        return True
+    message = _error_message(response).lower()
+    return any(marker in message for marker in REVERT_MARKERS)
+
+
+def _parse(estimate, created=None):
+    """
+    Разбирает ответы eth_estimateGas и eth_createAccessList одной транзакции.
+
+    :return: Словарь {"gas", "accessList"} или PreflightError.
+    """
+    if "error" in estimate:
+        if not _is_revert(estimate):
+            # Ошибка RPC (лимит запросов, недоступность) ничего не говорит о транзакции
+            raise ConnectionError(f"Ошибка RPC при симуляции: {_error_message(estimate)}")
+        return PreflightError(f"Транзакция откатится: {_error_message(estimate)}")
+    gas = int(estimate["result"], 16)
+    access_list = None
+    # RPC без eth_createAccessList возвращает ошибку метода: транзакция уходит без списка
+    created = (created or {}).get("result") or {}
+    if created.get("accessList") and not created.get("error"):
+        # Заранее объявленные адреса и слоты дешевле холодного доступа, поэтому оценка
+        # без списка остаётся верхней границей газа
+        access_list = created["accessList"]
+    return {"gas": int(gas * PREFLIGHT_GAS_MARGIN), "accessList": access_list}
+
+
+def simulate(web3, transactions, block_identifier="latest", access_lists=PREFLIGHT_ACCESS_LISTS,
+             batch_size=PREFLIGHT_BATCH_SIZE):
+    """
+    Симулирует транзакции пакетными запросами: eth_estimateGas выполняет каждую транзакцию
+    на текущем состоянии (откат возвращается ошибкой), eth_createAccessList в том же пакете
+    возвращает список адресов и слотов, к которым она обращается.
+
+    :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+    :param transactions: Список неподписанных транзакций {"from", "to", "data", "value"}.
+    :param block_identifier: Блок, на котором выполняется симуляция.
+    :param access_lists: Запрашивать ли access list.
+    :param batch_size: Количество транзакций в одном пакетном запросе.
+    :return: Список того же порядка: {"gas", "accessList"} или PreflightError для откатывающихся транзакций.
+    """
+    results = []
+    step = 2 if access_lists else 1
+    for i in range(0, len(transactions), batch_size):
+        requests = []
+        for transaction in transactions[i:i + batch_size]:
+            call = to_rpc_call(transaction)
+            requests.append(("eth_estimateGas", [call, block_identifier]))
+            if access_lists:
+                requests.append(("eth_createAccessList", [call, block_identifier]))
+        responses = web3.provider.make_batch_request(requests)
+        if not isinstance(responses, list):
+            raise ConnectionError(f"RPC вернул ошибку пакетного запроса: {responses}")
+        for j in range(0, len(responses), step):
+            results.append(_parse(responses[j], responses[j + 1] if access_lists else None))
+    return results
+
+
+def simulate_one(web3, transaction, access_lists=PREFLIGHT_ACCESS_LISTS):
+    """
+    Симулирует одну транзакцию. Запросы идут обычным путём провайдера и объединяются
+    в пакеты с запросами других потоков.
+
+    :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+    :param transaction: Неподписанная транзакция {"from", "to", "data", "value"}.
+    :param access_lists: Запрашивать ли access list.
+    :return: Словарь {"gas", "accessList"}.
+    :raises PreflightError: Если транзакция откатится.
+    """
+    call = to_rpc_call(transaction)
+    estimate = web3.provider.make_request("eth_estimateGas", [call, "latest"])
+    created = None
+    if access_lists and "error" not in estimate:
+        created = web3.provider.make_request("eth_createAccessList", [call, "latest"])
+    result = _parse(estimate, created)
+    if isinstance(result, PreflightError):
+        raise result
+    return result
@@ -0,0 +1,195 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from web3 import Web3
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PRICE_POLL_INTERVAL = float(os.getenv("PRICE_POLL_INTERVAL", 2))  # Интервал опроса фильтра/блоков (секунды)
+PRICE_WS_URL = os.getenv("PRICE_WS_URL")  # Websocket RPC для подписки на логи (необязательно)
+PRICE_DECIMALS = 8  # Цена в Chainlink хранится с 8 знаками
+
+# keccak("AnswerUpdated(int256,uint256,uint256)")
+ANSWER_UPDATED_TOPIC = Web3.keccak(text="AnswerUpdated(int256,uint256,uint256)").to_0x_hex()
+
+FEED_ABI = [
+    {
+        "inputs": [],
+        "name": "latestAnswer",
+        "outputs": [{"internalType": "int256", "name": "", "type": "int256"}],
+        "stateMutability": "view",
+        "type": "function",
+    },
+    {
+        "inputs": [],
+        "name": "aggregator",
+        "outputs": [{"internalType": "address", "name": "", "type": "address"}],
+        "stateMutability": "view",
+        "type": "function",
+    },
+]
+
+
+def decode_answer(log):
+    """
+    Извлекает цену из лога AnswerUpdated (значение в первом индексированном топике, int256).
+
+    :param log: Лог события.
+    :return: Цена.
+    """
+    topic = log["topics"][1]
+    raw = bytes(topic) if not isinstance(topic, str) else bytes.fromhex(topic[2:] if topic.startswith("0x") else topic)
+    return int.from_bytes(raw, "big", signed=True) / 10 ** PRICE_DECIMALS
+
+
+class PriceWatcher:
+    """
+    Отслеживает обновления цены Chainlink вместо опроса с фиксированным интервалом.
+
+    Источники событий в порядке приоритета: подписка на логи AnswerUpdated по websocket,
+    фильтр eth_newFilter с опросом, сравнение latestAnswer на каждом новом блоке.
+    Если фильтр потерян, события за время потери запрашиваются через eth_getLogs.
+    """
+
+    def __init__(self, web3, feed_address, ws_url=PRICE_WS_URL, poll_interval=PRICE_POLL_INTERVAL):
+        """
+        :param web3: Экземпляр Web3 (HTTP) для фильтров и чтения цены.
+        :param feed_address: Адрес прокси Chainlink Price Feed.
+        :param ws_url: Websocket RPC для подписки на логи или None.
+        :param poll_interval: Интервал опроса фильтра или номера блока в секундах.
+        """
+        self.web3 = web3
+        self.feed = web3.eth.contract(address=Web3.to_checksum_address(feed_address), abi=FEED_ABI)
+        self.ws_url = ws_url
+        self.poll_interval = poll_interval
+        self.mode = None
+        self.last_price = None
+        self._aggregator = None
+        self._filter = None
+        self._last_block = None
+        self._updates = queue.Queue()
+        self._ws_thread = None
+
+    def start(self):
+        """
+        Определяет адрес агрегатора и запускает наиболее эффективный доступный источник событий.
+
+        :return: Название выбранного режима ("ws", "filter" или "blocks").
+        """
+        try:
+            # События AnswerUpdated испускает агрегатор, а не прокси
+            self._aggregator = self.feed.functions.aggregator().call()
+        except Exception:
+            self._aggregator = self.feed.address
+        self.last_price = self._read_price()
+
+        if self.ws_url:
+            self._ws_thread = threading.Thread(target=self._run_ws, name="price-ws", daemon=True)
+            self._ws_thread.start()
+            self.mode = "ws"
+            return self.mode
+        self._start_filter()
+        return self.mode
+
+    def _log_params(self):
+        return {"address": self._aggregator, "topics": [ANSWER_UPDATED_TOPIC]}
+
+    def _start_filter(self):
+        """Создаёт фильтр событий, а если нода их не поддерживает — переходит на опрос блоков."""
+        self._last_block = self.web3.eth.block_number
+        try:
+            self._filter = self.web3.eth.filter(self._log_params())
+            self.mode = "filter"
+        except Exception:
+            self.mode = "blocks"
+
+    def _recover_filter(self):
+        """
+        Пересоздаёт потерянный фильтр и возвращает цену из последнего события, пропущенного за время потери.
+
+        :return: Цена или None, если событий не было.
+        """
+        self._filter = self.web3.eth.filter(self._log_params())
+        try:
+            # Блок последнего известного события включается: повтор события не меняет цену
+            logs = self.web3.eth.get_logs({**self._log_params(), "fromBlock": self._last_block, "toBlock": "latest"})
+        except Exception:
+            # Нода ограничивает eth_getLogs: читаем текущую цену
+            return self._read_price()
+        if not logs:
+            return None
+        self._last_block = logs[-1]["blockNumber"]
+        return decode_answer(logs[-1])
+
+    def _read_price(self):
+        return self.feed.functions.latestAnswer().call() / 10 ** PRICE_DECIMALS
+
+    def _run_ws(self):
+        try:
+            asyncio.run(self._subscribe_ws())
+        except Exception:
+            # Websocket недоступен: переходим на фильтр или опрос блоков
+            self._start_filter()
+
+    async def _subscribe_ws(self):
+        from web3 import AsyncWeb3, WebSocketProvider
+
+        async with AsyncWeb3(WebSocketProvider(self.ws_url)) as w3:
+            await w3.eth.subscribe("logs", self._log_params())
+            async for payload in w3.socket.process_subscriptions():
+                self._updates.put(decode_answer(payload["result"]))
+
+    def _poll(self):
+        """Проверяет источник событий один раз и возвращает новую цену или None."""
+        if self.mode == "ws":
+            try:
+                return self._updates.get_nowait()
+            except queue.Empty:
+                return None
+        if self.mode == "filter":
+            try:
+                entries = self._filter.get_new_entries()
+            except Exception:
+                # Фильтр удалён нодой (истёк срок жизни) или его RPC недоступен: создаём заново
+                return self._recover_filter()
+            if not entries:
+                return None
+            self._last_block = entries[-1]["blockNumber"]
+            return decode_answer(entries[-1])
+        block_number = self.web3.eth.block_number
+        if block_number == self._last_block:
+            return None
+        self._last_block = block_number
+        return self._read_price()
+
+    def wait_for_update(self, timeout):
+        """
+        Ожидает изменения цены не дольше timeout секунд.
+
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: Новая цена или None, если цена не изменилась за это время.
+        """
+        if self.mode is None:
+            self.start()
+        deadline = time.monotonic() + timeout
+        while True:
+            price = self._poll()
+            if price is not None and price != self.last_price:
+                self.last_price = price
+                return price
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if self.mode == "ws":
+                try:
+                    price = self._updates.get(timeout=remaining)
+                except queue.Empty:
+                    return None
+                if price != self.last_price:
+                    self.last_price = price
+                    return price
+            else:
+                time.sleep(min(self.poll_interval, remaining))
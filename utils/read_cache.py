@@ -0,0 +1,168 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+from utils.retry_decorator import DeadlineExceeded, remaining
+
+load_dotenv()
+
+READ_CACHE_ENABLED = os.getenv("READ_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+READ_CACHE_BLOCK_TTL = float(os.getenv("READ_CACHE_BLOCK_TTL", 1))  # Сколько секунд номер блока считается актуальным
+READ_CACHE_MAX_ENTRIES = int(os.getenv("READ_CACHE_MAX_ENTRIES", 10_000))  # Максимум ответов на один блок
+
+# Ответы, не зависящие от блока
+STATIC_METHODS = {"eth_chainId", "net_version"}
+# Ошибки узла, который ещё не получил запрошенный блок
+UNKNOWN_BLOCK_MARKERS = ("header not found", "unknown block", "block not found")
+
+
+def _is_latest(block_identifier):
+    return block_identifier in (None, "latest")
+
+
+def _is_unknown_block(method, response):
+    error = response.get("error")
+    if error is not None:
+        message = str(error.get("message", "") if isinstance(error, dict) else error).lower()
+        return any(marker in message for marker in UNKNOWN_BLOCK_MARKERS)
+    # eth_getBlockByNumber для неизвестного узлу блока возвращает null
+    return method == "eth_getBlockByNumber" and response.get("result", 0) is None
+
+
+class BlockReadCache:
+    """
+    Кэш чтений в пределах одного блока.
+
+    Ответы eth_call и eth_getBlockByNumber для блока 'latest' запоминаются по ключу
+    (номер блока, метод, параметры) и сбрасываются, как только номер блока меняется.
+    Запрос к RPC выполняется для того же номера блока, под которым запоминается ответ; если RPC,
+    получивший запрос, ещё не знает этот блок (номер блока мог прийти с другого RPC), запрос
+    повторяется для 'latest' и его ответ не кэшируется.
+    Номер блока запрашивается не чаще раза в READ_CACHE_BLOCK_TTL секунд. Одинаковые
+    запросы из разных потоков во время ожидания ответа объединяются в один RPC-вызов.
+    eth_chainId запоминается навсегда.
+    """
+
+    def __init__(self, fetch_block_number, block_ttl=READ_CACHE_BLOCK_TTL, max_entries=READ_CACHE_MAX_ENTRIES):
+        """
+        :param fetch_block_number: Функция без аргументов, возвращающая номер последнего блока.
+        :param block_ttl: Время в секундах, в течение которого номер блока не перезапрашивается.
+        :param max_entries: Максимальное число ответов в кэше одного блока.
+        """
+        self.fetch_block_number = fetch_block_number
+        self.block_ttl = block_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._block = None
+        self._block_checked_at = 0.0
+        self._entries = {}
+        self._static = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._block_lock = threading.Lock()
+
+    def block_number(self):
+        """
+        Возвращает номер последнего блока, запрашивая его не чаще раза в block_ttl секунд.
+
+        :return: Номер блока.
+        """
+        with self._block_lock:
+            if self._block is None or time.monotonic() - self._block_checked_at >= self.block_ttl:
+                block = self.fetch_block_number()
+                with self._lock:
+                    if block != self._block:
+                        # Новый блок: ответы предыдущего больше не актуальны
+                        self._entries.clear()
+                    self._block = block
+                self._block_checked_at = time.monotonic()
+            return self._block
+
+    def _key(self, method, params):
+        """
+        :return: Кортеж (ключ кэша, параметры запроса к RPC) или (None, params), если ответ не кэшируется.
+            Блок 'latest' в параметрах заменяется номером блока из ключа.
+        """
+        if method in STATIC_METHODS:
+            return (method, None), params
+        if method == "eth_call" and params and _is_latest(params[1] if len(params) > 1 else None):
+            block = self.block_number()
+            return (method, block, json.dumps(params[0], sort_keys=True)), [params[0], hex(block), *params[2:]]
+        if method == "eth_getBlockByNumber" and params and _is_latest(params[0]):
+            block = self.block_number()
+            full = bool(params[1]) if len(params) > 1 else False
+            return (method, block, full), [hex(block), *params[1:]]
+        return None, params
+
+    def request(self, method, params, send):
+        """
+        Выполняет запрос через кэш.
+
+        :param method: JSON-RPC метод.
+        :param params: Параметры.
+        :param send: Функция send(method, params), выполняющая запрос к RPC.
+        :return: Ответ JSON-RPC.
+        """
+        if method == "eth_blockNumber":
+            return {"jsonrpc": "2.0", "id": 0, "result": hex(self.block_number())}
+        key, pinned_params = self._key(method, params)
+        if key is None:
+            return send(method, params)
+
+        entries = self._static if method in STATIC_METHODS else self._entries
+        with self._lock:
+            response = entries.get(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if not owner:
+            try:
+                return future.result(timeout=remaining())
+            except FutureTimeoutError:
+                raise DeadlineExceeded(f"Лимит времени исчерпан в ожидании ответа на {method}")
+
+        cacheable = True
+        try:
+            response = send(method, pinned_params)
+            if pinned_params is not params and _is_unknown_block(method, response):
+                # RPC отстаёт от того, который сообщил номер блока: берём его последний блок без кэширования
+                response = send(method, params)
+                cacheable = False
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._inflight.pop(key, None)
+            # Ошибки не кэшируются; ответы устаревшего блока тоже
+            if cacheable and "error" not in response and (len(key) < 3 or key[1] == self._block) \
+                    and len(entries) < self.max_entries:
+                entries[key] = response
+        future.set_result(response)
+        return response
+
+    def clear(self):
+        """Сбрасывает кэш ответов и номер блока."""
+        with self._lock:
+            self._entries.clear()
+            self._block = None
+
+    def stats(self):
+        """
+        Возвращает статистику кэша.
+
+        :return: Словарь {block, entries, hits, misses}.
+        """
+        with self._lock:
+            return {"block": self._block, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -1,26 +1,71 @@
 from utils.logger import setup_logger
-from utils.blockchain import get_contract, get_position_liquidity
+from utils.blockchain import get_position_liquidity, sign_and_send
 from utils.pricing import get_eth_price
 from utils.unimath import eth_to_usdc, get_ticks_for_range, tick_to_price
+from utils.metrics import instrumented
 from utils.retry_decorator import retry_on_exception
+from utils.chain_context import current_chain
+from utils.contracts import encode_function_call, to_checksum
+from utils.preflight import simulate_one
 
 import os, time
+from decimal import Decimal
 from web3 import Web3
 from dotenv import load_dotenv
-from utils.select_chain import load_config
-config = load_config()
+from utils.select_chain import get_config
 load_dotenv()
 
-# Загрузка ABI и адреса контракта из .env
+# Загрузка ABI из .env
 POSITION_MANAGER_ABI_PATH = os.getenv('POSITION_MANAGER_ABI_PATH', 'utils/position_manager_abi.json')
-POSITION_MANAGER_ADDRESS = config[
-    'POSITION_MANAGER_ADDRESS']  # Адрес контракта Uniswap V3 Non-Fungible Position Manager
-TOKEN0 = config['TOKEN0']
-TOKEN1 = config['TOKEN1']
 
-AMOUNT0 = float(os.getenv('AMOUNT0'))
+# Значения по умолчанию; профиль оркестратора может задать свои (ChainContext.setting)
+AMOUNT0 = float(os.getenv('AMOUNT0', 0))
 
-GAS_PRICE_MULTIPLIER = float(os.getenv('GAS_PRICE_MULTIPLIER', 1.2))
+# Сжигать ли NFT старой позиции при ребалансировке одной транзакцией
+REBALANCE_BURN = os.getenv('REBALANCE_BURN', '0').lower() in ('1', 'true', 'yes')
+
+
+def get_position_manager_address():
+    """Возвращает адрес контракта Uniswap V3 Non-Fungible Position Manager выбранной сети."""
+    return get_config()['POSITION_MANAGER_ADDRESS']
+
+
+def get_pool_fee():
+    """Возвращает комиссию пула выбранной сети (FEE в настройках, по умолчанию 3000 — 0.3%)."""
+    return int(get_config().get('FEE', 3000))
+
+
+def to_token_units(amount, decimals):
+    """
+    Переводит количество токена в целые единицы контракта с учётом его децималов.
+    :param amount: Количество токена (например, 0.5 ETH).
+    :param decimals: Децималы токена.
+    :return: Количество в минимальных единицах (int).
+    """
+    return int(Decimal(str(amount)) * 10 ** decimals)
+
+
+def rebalance_triggers(range_lower, range_upper, threshold_percent):
+    """
+    Возвращает цены срабатывания порога ребалансировки: границы диапазона,
+    сдвинутые внутрь на долю threshold_percent его ширины. Принимает и массивы NumPy.
+    :param range_lower: Нижняя граница диапазона.
+    :param range_upper: Верхняя граница диапазона.
+    :param threshold_percent: Порог (доля ширины диапазона).
+    :return: Кортеж (нижняя цена срабатывания, верхняя цена срабатывания).
+    """
+    threshold_distance = (range_upper - range_lower) * threshold_percent
+    return range_lower + threshold_distance, range_upper - threshold_distance
+
+
+def range_around(current_price, range_width):
+    """
+    Возвращает границы диапазона шириной range_width, центрированного вокруг цены.
+    :param current_price: Текущая цена ETH.
+    :param range_width: Ширина диапазона.
+    :return: Кортеж (нижняя граница, верхняя граница).
+    """
+    return int(current_price - range_width / 2), int(current_price + range_width / 2)
 
 
 def should_rebalance(current_price, range_lower, range_upper, threshold_percent, wallet_address):
@@ -34,11 +79,11 @@ def should_rebalance(current_price, range_lower, range_upper, threshold_percent,
     :return: True, если нужно ребалансировать, иначе False.
     """
     logger = setup_logger(wallet_address)
-    threshold_distance = (range_upper - range_lower) * threshold_percent
-    if current_price > range_upper - threshold_distance:
+    trigger_lower, trigger_upper = rebalance_triggers(range_lower, range_upper, threshold_percent)
+    if current_price > trigger_upper:
         logger.warning("Цена приближается к верхней границе диапазона.")
         return True
-    elif current_price < range_lower + threshold_distance:
+    elif current_price < trigger_lower:
         logger.warning("Цена приближается к нижней границе диапазона.")
         return True
     return False
@@ -53,98 +98,231 @@ def calculate_new_range(current_price, range_width, wallet_address):
     :return: Кортеж (новая нижняя граница, новая верхняя граница).
     """
     logger = setup_logger(wallet_address)
-    center = current_price
-    new_lower = int(center - range_width / 2)
-    new_upper = int(center + range_width / 2)
+    new_lower, new_upper = range_around(current_price, range_width)
     logger.info(f"Новый диапазон ликвидности: {new_lower} - {new_upper}")
     return new_lower, new_upper
 
+def send_prepared(web3, wallet_address, private_key, transaction, preflight=None):
+    """
+    Подписывает и отправляет подготовленную транзакцию с лимитом газа и access list
+    из предварительной симуляции. Если симуляция не выполнялась пакетно, транзакция
+    симулируется здесь; откатывающаяся транзакция не подписывается.
+    :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+    :param wallet_address: Адрес кошелька.
+    :param private_key: Приватный ключ кошелька.
+    :param transaction: Неподписанная транзакция {"from", "to", "data", "value"}.
+    :param preflight: Результат simulate для этой транзакции ({"gas", "accessList"}).
+    :return: Хэш транзакции.
+    :raises PreflightError: Если транзакция откатится.
+    :raises BroadcastUnknownError: Если неизвестно, принята ли транзакция (см. blockchain.sign_and_send).
+    """
+    chain = current_chain()
+    if preflight is None:
+        preflight = simulate_one(web3, transaction)
+    txn = {
+        **transaction,
+        **chain.fee_oracle.get_fee_params(web3),
+        "gas": preflight["gas"],
+        "chainId": web3.eth.chain_id,
+    }
+    if preflight.get("accessList"):
+        txn["accessList"] = preflight["accessList"]
+    return sign_and_send(web3, wallet_address, private_key, txn)
+
+
+def _position_manager_call(wallet_address, data, value=0):
+    return {"from": to_checksum(wallet_address), "to": to_checksum(get_position_manager_address()),
+            "data": data, "value": value}
+
+
+def build_collect_call(wallet_address, token_id):
+    """
+    Подготавливает неподписанную транзакцию сбора комиссий.
+    :param wallet_address: Адрес кошелька.
+    :param token_id: ID позиции NFT на Uniswap.
+    :return: Транзакция {"from", "to", "data", "value"}.
+    """
+    return _position_manager_call(wallet_address, encode_function_call(
+        POSITION_MANAGER_ABI_PATH, "collect",
+        [(token_id, to_checksum(wallet_address), 2 ** 128 - 1, 2 ** 128 - 1)]))
+
+
+def build_decrease_call(web3, wallet_address, token_id, liquidity):
+    """
+    Подготавливает неподписанную транзакцию удаления ликвидности.
+    :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+    :param wallet_address: Адрес кошелька.
+    :param token_id: ID позиции NFT на Uniswap.
+    :param liquidity: Удаляемая ликвидность.
+    :return: Транзакция {"from", "to", "data", "value"}.
+    """
+    deadline = web3.eth.get_block('latest')['timestamp'] + 60
+    return _position_manager_call(wallet_address, encode_function_call(
+        POSITION_MANAGER_ABI_PATH, "decreaseLiquidity", [(token_id, liquidity, 0, 0, deadline)]))
+
+
 @retry_on_exception()
-def collect_fees(web3, wallet_address, private_key, token_id):
+@instrumented
+def collect_fees(web3, wallet_address, private_key, token_id, prepared=None):
     """
         Собирает комиссии из текущей позиции.
         :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
         :param wallet_address: Адрес кошелька.
         :param private_key: Приватный ключ кошелька.
         :param token_id: ID позиции NFT на Uniswap.
+        :param prepared: Пара (транзакция, результат simulate) из пакетной симуляции.
         """
     logger = setup_logger(wallet_address)
     try:
-        # Получаем контракт
-        position_manager = get_contract(POSITION_MANAGER_ADDRESS, POSITION_MANAGER_ABI_PATH)
         logger.info(f"Сбор комиссий для позиции с ID {token_id} начато.")
-        # Подготовка транзакции для вызова функции collect
-        params = {
-            "tokenId": token_id,
-            "recipient": wallet_address,
-            "amount0Max": 2 ** 128 - 1,
-            "amount1Max": 2 ** 128 - 1
-        }
-        gas_estimate = int(position_manager.functions.collect(params).estimate_gas({
-            "from": wallet_address
-        }) * GAS_PRICE_MULTIPLIER)
-        collect_txn = position_manager.functions.collect(params).build_transaction({
-            "from": wallet_address,
-            "gasPrice": web3.eth.gas_price,
-            "gas": gas_estimate,
-            "nonce": web3.eth.get_transaction_count(wallet_address)
-        })
-        # Подписание транзакции collect
-        signed_collect_txn = web3.eth.account.sign_transaction(collect_txn, private_key)
-        # Отправка транзакции collect
-        collect_txn_hash = web3.eth.send_raw_transaction(signed_collect_txn.raw_transaction).hex()
+        transaction, preflight = prepared or (build_collect_call(wallet_address, token_id), None)
+        collect_txn_hash = send_prepared(web3, wallet_address, private_key, transaction, preflight)
         logger.info(f"Комиссии успешно собраны для кошелька {wallet_address}. Хеш транзакции: {collect_txn_hash}")
-        return 1
+        return collect_txn_hash
     except Exception as e:
+        current_chain().fee_oracle.invalidate()
         logger.error(f"Ошибка при сборе комиссий для кошелька {wallet_address}: {e}")
         raise
 
 @retry_on_exception()
-def remove_liquidity(web3, wallet_address, private_key, token_id):
+@instrumented
+def remove_liquidity(web3, wallet_address, private_key, token_id, liquidity=None, prepared=None):
     """
     Удаляет ликвидность из текущей позиции.
     :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
     :param wallet_address: Адрес кошелька.
     :param private_key: Приватный ключ кошелька.
     :param token_id: ID позиции NFT на Uniswap.
+    :param liquidity: Ликвидность позиции, если уже известна (иначе читается из контракта).
+    :param prepared: Пара (транзакция, результат simulate) из пакетной симуляции.
     """
     logger = setup_logger(wallet_address)
     try:
         logger.info(f"Удаление ликвидности для позиции с ID {token_id} начато.")
-        liquidity = get_position_liquidity(POSITION_MANAGER_ADDRESS, POSITION_MANAGER_ABI_PATH, token_id, wallet_address)
-        position_manager = get_contract(POSITION_MANAGER_ADDRESS, POSITION_MANAGER_ABI_PATH)
-        # Подготовка транзакции для decreaseLiquidity
-        params = {
-            "tokenId": token_id,
-            "liquidity": liquidity,
-            "amount0Min": 0,
-            "amount1Min": 0,
-            "deadline": web3.eth.get_block('latest')['timestamp'] + 60
-        }
-        gas_estimate = int(position_manager.functions.decreaseLiquidity(params).estimate_gas({
-            "from": wallet_address
-        }) * GAS_PRICE_MULTIPLIER)
-        decrease_liquidity_txn = position_manager.functions.decreaseLiquidity(params).build_transaction({
-            "from": wallet_address,
-            "gasPrice": web3.eth.gas_price,
-            "gas": gas_estimate,
-            "nonce": web3.eth.get_transaction_count(wallet_address) + 1
-        })
-
-        # Подписание транзакции decreaseLiquidity
-        signed_decrease_liquidity_txn = web3.eth.account.sign_transaction(decrease_liquidity_txn, private_key)
-        # Отправка транзакции decreaseLiquidity
-        decrease_liquidity_txn_hash = web3.eth.send_raw_transaction(signed_decrease_liquidity_txn.raw_transaction).hex()
+        if prepared is None:
+            if liquidity is None:
+                liquidity = get_position_liquidity(get_position_manager_address(), POSITION_MANAGER_ABI_PATH,
+                                                   token_id, wallet_address)
+            prepared = build_decrease_call(web3, wallet_address, token_id, liquidity), None
+        decrease_liquidity_txn_hash = send_prepared(web3, wallet_address, private_key, *prepared)
         logger.info(
             f"Ликвидность успешно удалена для кошелька {wallet_address}. Хеш транзакции: {decrease_liquidity_txn_hash}")
 
-        return 1
+        return decrease_liquidity_txn_hash
     except Exception as e:
+        current_chain().fee_oracle.invalidate()
         logger.error(f"Ошибка при удалении ликвидности для кошелька {wallet_address}: {e}")
         raise
 
+
+def build_mint_params(wallet_address, new_range_lower, new_range_upper, amount0=None, current_price=None):
+    """
+    Подготавливает параметры mint для нового диапазона.
+    :param wallet_address: Адрес кошелька.
+    :param new_range_lower: Новая нижняя граница диапазона.
+    :param new_range_upper: Новая верхняя граница диапазона.
+    :param amount0: Количество первого токена для добавления.
+    :param current_price: Цена ETH, общая для всех кошельков цикла (иначе запрашивается у Chainlink).
+    :return: Кортеж (параметры mint, amount0 в минимальных единицах token0).
+    """
+    chain = current_chain()
+    token0 = chain.config['TOKEN0']  # WETH
+    token1 = chain.config['TOKEN1']  # USDC
+    decimals0, decimals1 = chain.decimals0, chain.decimals1
+    fee = get_pool_fee()
+
+    logger = setup_logger(wallet_address)
+
+    tick_lower, tick_upper = get_ticks_for_range(new_range_lower, new_range_upper, fee, decimals0, decimals1)
+    price_ticked_lower = tick_to_price(tick_lower, decimals0, decimals1)
+    price_ticked_upper = tick_to_price(tick_upper, decimals0, decimals1)
+
+    if current_price is None:
+        current_price = get_eth_price()
+
+    # Если amount0 не передано, вычисляем их динамически
+    if amount0 is None:
+        amount0 = chain.setting('AMOUNT0', AMOUNT0)
+        amount1 = eth_to_usdc(price_ticked_lower, price_ticked_upper, current_price, amount0)
+        logger.info(f"Вычислены значения для кошелька {wallet_address}: amount0 = {amount0}, amount1 = {amount1}")
+    else:
+        amount1 = eth_to_usdc(price_ticked_lower, price_ticked_upper, current_price, amount0)
+        logger.info(
+            f"Используются переданные значения для кошелька {wallet_address}: amount0 = {amount0}, amount1 = {amount1}")
+
+    amount0_units = to_token_units(amount0, decimals0)
+    params = (
+        Web3.to_checksum_address(token0),
+        Web3.to_checksum_address(token1),
+        fee,
+        tick_lower,
+        tick_upper,
+        amount0_units,
+        to_token_units(amount1, decimals1),
+        0,
+        0,
+        Web3.to_checksum_address(wallet_address),
+        int(time.time()) + 60
+    )
+    return params, amount0_units
+
+
+
+def build_mint_call(wallet_address, new_range_lower, new_range_upper, amount0=None, current_price=None):
+    """
+    Подготавливает неподписанную транзакцию mint новой позиции.
+    :param wallet_address: Адрес кошелька.
+    :param new_range_lower: Новая нижняя граница диапазона.
+    :param new_range_upper: Новая верхняя граница диапазона.
+    :param amount0: Количество первого токена для добавления.
+    :param current_price: Цена ETH, общая для всех кошельков цикла.
+    :return: Транзакция {"from", "to", "data", "value"}.
+    """
+    params, value = build_mint_params(wallet_address, new_range_lower, new_range_upper, amount0, current_price)
+    # token0 (WETH) передаётся как ETH в value
+    return _position_manager_call(wallet_address, encode_function_call(POSITION_MANAGER_ABI_PATH, "mint", [params]),
+                                  value)
+
+
+def build_rebalance_call(wallet_address, token_id, liquidity, new_range_lower, new_range_upper, amount0=None,
+                         current_price=None):
+    """
+    Подготавливает неподписанную транзакцию multicall: decreaseLiquidity, collect,
+    (опционально) burn, mint и refundETH.
+    :param wallet_address: Адрес кошелька.
+    :param token_id: ID текущей позиции NFT на Uniswap.
+    :param liquidity: Ликвидность текущей позиции.
+    :param new_range_lower: Новая нижняя граница диапазона.
+    :param new_range_upper: Новая верхняя граница диапазона.
+    :param amount0: Количество первого токена для добавления.
+    :param current_price: Цена ETH, общая для всех кошельков цикла.
+    :return: Транзакция {"from", "to", "data", "value"}.
+    """
+    mint_params, value = build_mint_params(wallet_address, new_range_lower, new_range_upper, amount0,
+                                             current_price)
+    deadline = mint_params[-1]
+    calls = [
+        encode_function_call(POSITION_MANAGER_ABI_PATH, "decreaseLiquidity",
+                             [(token_id, liquidity, 0, 0, deadline)]),
+        encode_function_call(POSITION_MANAGER_ABI_PATH, "collect",
+                             [(token_id, Web3.to_checksum_address(wallet_address), 2 ** 128 - 1, 2 ** 128 - 1)]),
+    ]
+    if current_chain().setting('REBALANCE_BURN', REBALANCE_BURN):
+        # Сжигание пустой позиции освобождает хранилище и возвращает часть газа
+        calls.append(encode_function_call(POSITION_MANAGER_ABI_PATH, "burn", [token_id]))
+    calls.append(encode_function_call(POSITION_MANAGER_ABI_PATH, "mint", [mint_params]))
+    # Возврат неиспользованного ETH, переданного в value
+    calls.append(encode_function_call(POSITION_MANAGER_ABI_PATH, "refundETH", []))
+    calls = [bytes.fromhex(call[2:]) for call in calls]
+    return _position_manager_call(wallet_address, encode_function_call(POSITION_MANAGER_ABI_PATH, "multicall",
+                                                                       [calls]),
+                                  value)
+
+
 @retry_on_exception()
-def add_liquidity(web3, wallet_address, private_key, new_range_lower, new_range_upper, amount0=None):
+@instrumented
+def add_liquidity(web3, wallet_address, private_key, new_range_lower, new_range_upper, amount0=None,
+                  current_price=None, prepared=None):
     """
     Добавляет ликвидность в новый диапазон.
     :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
@@ -153,57 +331,55 @@ def add_liquidity(web3, wallet_address, private_key, new_range_lower, new_range_
     :param new_range_lower: Новая нижняя граница диапазона.
     :param new_range_upper: Новая верхняя граница диапазона.
     :param amount0: Количество первого токена для добавления.
+    :param current_price: Цена ETH, общая для всех кошельков цикла.
+    :param prepared: Пара (транзакция, результат simulate) из пакетной симуляции.
     """
-    token0 = TOKEN0  # WETH
-    token1 = TOKEN1  # USDC
-
     logger = setup_logger(wallet_address)
     logger.info(f"Добавление ликвидности в диапазон {new_range_lower} - {new_range_upper} начато.")
 
-    tick_lower, tick_upper = get_ticks_for_range(new_range_lower, new_range_upper)
-    price_ticked_lower, price_ticked_upper = tick_to_price(tick_lower), tick_to_price(tick_upper)
-
     try:
-        # Если amount0 не передано, вычисляем их динамически
-        if amount0 is None:
-            amount0 = AMOUNT0
-            amount1 = eth_to_usdc(price_ticked_lower, price_ticked_upper, get_eth_price(), amount0)
-            logger.info(f"Вычислены значения для кошелька {wallet_address}: amount0 = {amount0}, amount1 = {amount1}")
-        else:
-            amount1 = eth_to_usdc(price_ticked_lower, price_ticked_upper, get_eth_price(), amount0)
-            logger.info(
-                f"Используются переданные значения для кошелька {wallet_address}: amount0 = {amount0}, amount1 = {amount1}")
-
-        # Получаем контракт
-        position_manager = get_contract(POSITION_MANAGER_ADDRESS, POSITION_MANAGER_ABI_PATH)
-
-        params = (
-            Web3.to_checksum_address(token0),
-            Web3.to_checksum_address(token1),
-            3000,
-            tick_lower,
-            tick_upper,
-            Web3.to_wei(amount0, 'ether'),
-            int(amount1 * (10 ** 6)),
-            0,
-            0,
-            Web3.to_checksum_address(wallet_address),
-            int(time.time()) + 60
-        )
-
-        add_liquidity_txn = position_manager.functions.mint(params).build_transaction({
-            "from": wallet_address,
-            "value": Web3.to_wei(amount0, 'ether'),
-            "gasPrice": int(web3.eth.gas_price * GAS_PRICE_MULTIPLIER),
-            "nonce": web3.eth.get_transaction_count(wallet_address),
-            "gas": 1000000
-        })
-
-        signed_tx = web3.eth.account.sign_transaction(add_liquidity_txn, private_key=private_key)
-
-        tx_hash = web3.eth.send_raw_transaction(signed_tx.raw_transaction).hex()
+        transaction, preflight = prepared or (
+            build_mint_call(wallet_address, new_range_lower, new_range_upper, amount0, current_price), None)
+        tx_hash = send_prepared(web3, wallet_address, private_key, transaction, preflight)
 
         logger.info(f"Ликвидность успешно добавлена для кошелька {wallet_address}. Хэш транзакции: {tx_hash}")
+        return tx_hash
     except Exception as e:
+        current_chain().fee_oracle.invalidate()
         logger.error(f"Ошибка при добавлении ликвидности для кошелька {wallet_address}: {e}")
-        raise
\ No newline at end of file
+        raise
+
+
+@retry_on_exception()
+@instrumented
+def rebalance_in_one_tx(web3, wallet_address, private_key, token_id, liquidity, new_range_lower, new_range_upper,
+                        amount0=None, current_price=None, prepared=None):
+    """
+    Выполняет ребалансировку одной транзакцией multicall на NonfungiblePositionManager:
+    decreaseLiquidity, collect, (опционально) burn, mint и refundETH.
+    :param web3: Экземпляр Web3 для взаимодействия с блокчейном.
+    :param wallet_address: Адрес кошелька.
+    :param private_key: Приватный ключ кошелька.
+    :param token_id: ID текущей позиции NFT на Uniswap.
+    :param liquidity: Ликвидность текущей позиции.
+    :param new_range_lower: Новая нижняя граница диапазона.
+    :param new_range_upper: Новая верхняя граница диапазона.
+    :param amount0: Количество первого токена для добавления.
+    :param current_price: Цена ETH, общая для всех кошельков цикла.
+    :param prepared: Пара (транзакция, результат simulate) из пакетной симуляции.
+    :return: Хэш транзакции.
+    """
+    logger = setup_logger(wallet_address)
+    logger.info(f"Ребалансировка позиции {token_id} одной транзакцией в диапазон {new_range_lower} - {new_range_upper} начата.")
+    try:
+        transaction, preflight = prepared or (
+            build_rebalance_call(wallet_address, token_id, liquidity, new_range_lower, new_range_upper, amount0,
+                                 current_price), None)
+        tx_hash = send_prepared(web3, wallet_address, private_key, transaction, preflight)
+
+        logger.info(f"Ребалансировка одной транзакцией выполнена для кошелька {wallet_address}. Хэш транзакции: {tx_hash}")
+        return tx_hash
+    except Exception as e:
+        current_chain().fee_oracle.invalidate()
+        logger.error(f"Ошибка при ребалансировке одной транзакцией для кошелька {wallet_address}: {e}")
+        raise
@@ -0,0 +1,263 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, wait as wait_futures
+from dotenv import load_dotenv
+from utils.fee_oracle import FeeOracle
+from utils.logger import setup_logger
+
+load_dotenv()
+
+RECEIPT_POLL_INTERVAL = float(os.getenv("RECEIPT_POLL_INTERVAL", 1))  # Интервал опроса квитанций (секунды)
+RECEIPT_BATCH_SIZE = int(os.getenv("RECEIPT_BATCH_SIZE", 100))  # Квитанций в одном пакетном JSON-RPC запросе
+RECEIPT_TIMEOUT = float(os.getenv("RECEIPT_TIMEOUT", 600))  # Через сколько секунд транзакция считается потерянной
+RECEIPT_SPEEDUP_AFTER = float(os.getenv("RECEIPT_SPEEDUP_AFTER", 60))  # Через сколько секунд ускорять (0 — никогда)
+RECEIPT_SPEEDUP_BUMP = float(os.getenv("RECEIPT_SPEEDUP_BUMP", 1.125))  # Минимальное повышение комиссии при замене
+RECEIPT_MAX_SPEEDUPS = int(os.getenv("RECEIPT_MAX_SPEEDUPS", 3))  # Максимум замен одной транзакции
+
+
+class TransactionFailedError(RuntimeError):
+    """Транзакция включена в блок, но завершилась с ошибкой (status 0)."""
+
+
+def normalize_hash(tx_hash):
+    """Приводит хэш транзакции к виду 0x..."""
+    tx_hash = tx_hash if isinstance(tx_hash, str) else tx_hash.hex()
+    return tx_hash if tx_hash.startswith("0x") else "0x" + tx_hash
+
+
+def parse_receipt(receipt):
+    """
+    Преобразует числовые поля квитанции из hex в int.
+
+    :param receipt: Квитанция из ответа eth_getTransactionReceipt.
+    :return: Словарь квитанции.
+    """
+    receipt = dict(receipt)
+    for field in ("status", "blockNumber", "gasUsed", "effectiveGasPrice", "cumulativeGasUsed"):
+        if isinstance(receipt.get(field), str):
+            receipt[field] = int(receipt[field], 16)
+    return receipt
+
+
+class _Pending:
+    """Отслеживаемая транзакция и все её замены с тем же nonce."""
+
+    def __init__(self, tx_hash, wallet_address, private_key, transaction):
+        self.hashes = [tx_hash]
+        self.wallet_address = wallet_address
+        self.private_key = private_key
+        self.transaction = transaction
+        self.sent_at = time.monotonic()
+        self.replaced_at = self.sent_at
+        self.speedups = 0
+        self.finished_at = None
+        self.future = Future()
+
+
+class ReceiptTracker:
+    """
+    Фоновое подтверждение транзакций.
+
+    Все ожидающие хэши опрашиваются одним пакетным JSON-RPC запросом eth_getTransactionReceipt
+    раз в RECEIPT_POLL_INTERVAL секунд. Для каждой транзакции возвращается Future с квитанцией
+    и записывается время включения в блок. Транзакция, не включённая за RECEIPT_SPEEDUP_AFTER
+    секунд, заменяется той же транзакцией с тем же nonce и повышенной комиссией.
+    """
+
+    def __init__(self, web3, poll_interval=RECEIPT_POLL_INTERVAL, batch_size=RECEIPT_BATCH_SIZE,
+                 timeout=RECEIPT_TIMEOUT, speedup_after=RECEIPT_SPEEDUP_AFTER, fee_oracle=None):
+        self.web3 = web3
+        # Оценка комиссии той же сети: по ней повышается комиссия при ускорении
+        self.fee_oracle = fee_oracle or FeeOracle()
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.speedup_after = speedup_after
+        self.latencies = []
+        self._pending = {}
+        self._by_hash = {}
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def track(self, tx_hash, wallet_address, private_key=None, transaction=None):
+        """
+        Добавляет транзакцию в отслеживание.
+
+        :param tx_hash: Хэш отправленной транзакции.
+        :param wallet_address: Адрес кошелька-отправителя.
+        :param private_key: Приватный ключ (нужен для ускорения заменой).
+        :param transaction: Подписанный словарь транзакции (нужен для ускорения заменой).
+        :return: Future, завершающийся квитанцией транзакции.
+        """
+        tx_hash = normalize_hash(tx_hash)
+        entry = _Pending(tx_hash, wallet_address, private_key, transaction)
+        with self._cond:
+            self._pending[id(entry)] = entry
+            self._by_hash[tx_hash] = entry
+            if self._thread is None:
+                # Поток наследует контекст первого вызова (профиль сети для логов)
+                self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,),
+                                                name="receipt-tracker", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return entry.future
+
+    def future(self, tx_hash):
+        """
+        Возвращает Future отслеживаемой транзакции.
+
+        :param tx_hash: Хэш транзакции или любой из её замен.
+        :return: Future или None, если хэш не отслеживается.
+        """
+        with self._cond:
+            entry = self._by_hash.get(normalize_hash(tx_hash))
+        return entry.future if entry else None
+
+    def wait(self, tx_hashes, timeout=None):
+        """
+        Ожидает подтверждения транзакций.
+
+        :param tx_hashes: Хэши транзакций.
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: Список квитанций в том же порядке.
+        :raises TransactionFailedError: Если хотя бы одна транзакция завершилась с ошибкой.
+        :raises TimeoutError: Если не все транзакции подтверждены вовремя.
+        """
+        futures = [self.future(tx_hash) for tx_hash in tx_hashes]
+        missing = [tx_hash for tx_hash, future in zip(tx_hashes, futures) if future is None]
+        if missing:
+            raise ValueError(f"Транзакции не отслеживаются: {missing}")
+        _, not_done = wait_futures(futures, timeout=timeout)
+        if not_done:
+            raise TimeoutError(f"Не дождались подтверждения {len(not_done)} транзакций")
+        receipts = [future.result() for future in futures]
+        for tx_hash, receipt in zip(tx_hashes, receipts):
+            if receipt.get("status") != 1:
+                raise TransactionFailedError(f"Транзакция {normalize_hash(tx_hash)} завершилась с ошибкой")
+        return receipts
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                entries = list(self._pending.values())
+            try:
+                self._poll(entries)
+            except Exception as e:
+                # Ошибка пакетного запроса не должна останавливать отслеживание: повторим в следующем цикле
+                setup_logger(entries[0].wallet_address).warning(f"Ошибка при опросе квитанций: {e}")
+            time.sleep(self.poll_interval)
+
+    def _fetch_receipts(self, hashes):
+        receipts = {}
+        for i in range(0, len(hashes), self.batch_size):
+            chunk = hashes[i:i + self.batch_size]
+            responses = self.web3.provider.make_batch_request(
+                [("eth_getTransactionReceipt", [tx_hash]) for tx_hash in chunk])
+            if not isinstance(responses, list):
+                raise ConnectionError(f"RPC вернул ошибку пакетного запроса: {responses}")
+            for tx_hash, response in zip(chunk, responses):
+                if response.get("result"):
+                    receipts[tx_hash] = parse_receipt(response["result"])
+        return receipts
+
+    def _poll(self, entries):
+        self._forget_finished()
+        receipts = self._fetch_receipts([tx_hash for entry in entries for tx_hash in entry.hashes])
+        now = time.monotonic()
+        for entry in entries:
+            receipt = next((receipts[h] for h in entry.hashes if h in receipts), None)
+            if receipt is not None:
+                latency = now - entry.sent_at
+                self.latencies.append(latency)
+                del self.latencies[:-1000]
+                setup_logger(entry.wallet_address).info(
+                    f"Транзакция {receipt['transactionHash']} включена в блок {receipt['blockNumber']} "
+                    f"через {latency:.1f} с (status {receipt.get('status')})")
+                self._finish(entry, result=receipt)
+            elif now - entry.sent_at >= self.timeout:
+                self._finish(entry, error=TimeoutError(f"Транзакция {entry.hashes[-1]} не включена в блок "
+                                                       f"за {self.timeout:.0f} с"))
+            elif self.speedup_after and now - entry.replaced_at >= self.speedup_after \
+                    and entry.transaction is not None and entry.speedups < RECEIPT_MAX_SPEEDUPS:
+                self._speed_up(entry)
+
+    def _forget_finished(self):
+        # Завершённые транзакции доступны для wait() ещё timeout секунд
+        expired = time.monotonic() - self.timeout
+        with self._cond:
+            for tx_hash in [h for h, e in self._by_hash.items() if e.finished_at and e.finished_at < expired]:
+                del self._by_hash[tx_hash]
+
+    def _finish(self, entry, result=None, error=None):
+        with self._cond:
+            self._pending.pop(id(entry), None)
+            entry.finished_at = time.monotonic()
+        if error is not None:
+            entry.future.set_exception(error)
+        else:
+            entry.future.set_result(result)
+
+    def _speed_up(self, entry):
+        """
+        Заменяет зависшую транзакцию той же транзакцией с тем же nonce и повышенной комиссией.
+        Комиссия не превышает ограничение оракула комиссий, чаевые не превышают maxFeePerGas.
+        """
+        logger = setup_logger(entry.wallet_address)
+        transaction = dict(entry.transaction)
+        fee_oracle = self.fee_oracle
+        fee_oracle.invalidate()
+        fees = fee_oracle.get_fee_params(self.web3)
+        fields = ("gasPrice",) if "gasPrice" in transaction else ("maxFeePerGas", "maxPriorityFeePerGas")
+        bumped = {field: max(int(transaction[field] * RECEIPT_SPEEDUP_BUMP) + 1, fees.get(field, 0)) for field in fields}
+        if "gasPrice" in bumped:
+            bumped["gasPrice"], _ = fee_oracle.cap(bumped["gasPrice"], 0)
+        else:
+            bumped["maxFeePerGas"], bumped["maxPriorityFeePerGas"] = fee_oracle.cap(
+                bumped["maxFeePerGas"], bumped["maxPriorityFeePerGas"])
+        if any(bumped[field] < int(transaction[field] * RECEIPT_SPEEDUP_BUMP) + 1 for field in fields):
+            # Узел не примет замену без повышения на RECEIPT_SPEEDUP_BUMP, а выше ограничения поднимать нельзя
+            entry.speedups = RECEIPT_MAX_SPEEDUPS
+            logger.warning(f"Транзакция {entry.hashes[-1]} не ускорена: комиссия достигла ограничения FEE_MAX_FEE_WEI")
+            return
+        transaction.update(bumped)
+        entry.replaced_at = time.monotonic()
+        entry.speedups += 1
+        try:
+            signed = self.web3.eth.account.sign_transaction(transaction, entry.private_key)
+            tx_hash = normalize_hash(self.web3.eth.send_raw_transaction(signed.raw_transaction))
+        except Exception as e:
+            # Например, nonce too low: исходная транзакция уже включена, квитанция придёт при следующем опросе
+            logger.warning(f"Не удалось ускорить транзакцию {entry.hashes[-1]}: {e}")
+            return
+        entry.transaction = transaction
+        with self._cond:
+            entry.hashes.append(tx_hash)
+            self._by_hash[tx_hash] = entry
+        logger.info(f"Транзакция {entry.hashes[0]} заменена транзакцией {tx_hash} с повышенной комиссией "
+                    f"(замена {entry.speedups} из {RECEIPT_MAX_SPEEDUPS})")
+
+    def stats(self):
+        """
+        Возвращает статистику подтверждений.
+
+        :return: Словарь {pending, confirmed, p50_latency, max_latency}.
+        """
+        with self._cond:
+            pending = len(self._pending)
+        latencies = sorted(self.latencies)
+        return {
+            "pending": pending,
+            "confirmed": len(latencies),
+            "p50_latency": latencies[len(latencies) // 2] if latencies else None,
+            "max_latency": latencies[-1] if latencies else None,
+        }
+
+
+def get_receipt_tracker():
+    """Возвращает ReceiptTracker текущей сети, создавая его при первом обращении."""
+    from utils.chain_context import current_chain
+    return current_chain().receipt_tracker()
@@ -1,18 +1,288 @@
 # utils/retry_decorator.py
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-import logging, os
+from tenacity import retry, retry_if_exception
+from tenacity.stop import stop_base
+from contextlib import contextmanager
+import contextvars, functools, logging, os, random, time
+import requests
+from urllib3.exceptions import ConnectTimeoutError
+from web3.exceptions import ContractLogicError, Web3RPCError
 from dotenv import load_dotenv
+from utils.errors import BroadcastUnknownError, PreflightError, RequestNotSentError, REVERT_MARKERS
 load_dotenv()
 
 RPC_RETRY_LIMIT = int(os.getenv("RPC_RETRY_LIMIT", 3))
+RETRY_BUDGET = float(os.getenv("RETRY_BUDGET", 30))  # Лимит времени на вызов со всеми повторами (секунды)
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 0.5))  # Базовая пауза после сетевой ошибки (секунды)
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 4))  # Максимальная пауза после сетевой ошибки
+RATE_LIMIT_BASE_DELAY = float(os.getenv("RATE_LIMIT_BASE_DELAY", 2))  # Базовая пауза после превышения лимита RPC
+RATE_LIMIT_MAX_DELAY = float(os.getenv("RATE_LIMIT_MAX_DELAY", 20))  # Максимальная пауза после превышения лимита
 
-def custom_before_sleep(retry_state):
+# Классы ошибок
+TRANSIENT = "transient"  # Сбой сети или узла: повтор, скорее всего, пройдёт
+RATE_LIMITED = "rate_limited"  # RPC ограничивает частоту запросов: повтор после более долгой паузы
+PERMANENT = "permanent"  # Ошибка не зависит от момента вызова (откат, неверные параметры): повтор бесполезен
+
+# Исход отправки подписанной транзакции (eth_sendRawTransaction)
+SEND_ACCEPTED = "accepted"  # Узел принял транзакцию (в том числе раньше, при потерянном ответе)
+SEND_NOT_SENT = "not_sent"  # Ни один узел её не принял: можно подписать заново
+SEND_UNKNOWN = "unknown"  # Запрос мог дойти до узла: транзакция, возможно, уже в mempool
+
+RATE_LIMIT_MARKERS = ("rate limit", "too many requests", "limit exceeded", "request limit", "exceeded the quota")
+RATE_LIMIT_CODES = (429, -32005)
+# Ответы узла на повторную отправку транзакции, которую он уже получил (или которая уже включена в блок)
+SEND_ACCEPTED_MARKERS = ("already known", "known transaction", "already imported", "nonce too low",
+                         "replacement transaction underpriced")
+
+# Абсолютный срок (time.monotonic), общий для всех вложенных вызовов, и признак того,
+# что повторы уже выполняет внешний декорированный вызов
+_deadline = contextvars.ContextVar("retry_deadline", default=None)
+_retrying = contextvars.ContextVar("retry_active", default=False)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Лимит времени вызова или цикла исчерпан: новые запросы и повторы не выполняются."""
+
+
+class RateLimitError(ConnectionError):
+    """RPC отклонил запрос из-за превышения лимита частоты."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@contextmanager
+def deadline(seconds):
+    """
+    Ограничивает время выполнения блока. Срок наследуется вложенными вызовами и задачами,
+    запущенными с копией контекста; вложенный блок не может продлить срок внешнего.
+
+    :param seconds: Лимит времени в секундах.
+    """
+    current = _deadline.get()
+    until = time.monotonic() + seconds
+    token = _deadline.set(until if current is None else min(current, until))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining(limit=None):
+    """
+    Возвращает время до срока текущего контекста.
+
+    :param limit: Собственный лимит операции в секундах; результат не превышает его.
+    :return: Секунды (не меньше 0) или limit, если срок не задан.
+    """
+    until = _deadline.get()
+    if until is None:
+        return limit
+    left = max(0.0, until - time.monotonic())
+    return left if limit is None else min(limit, left)
+
+
+def check_deadline():
+    """
+    :raises DeadlineExceeded: Если срок текущего контекста истёк.
+    """
+    until = _deadline.get()
+    if until is not None and time.monotonic() >= until:
+        raise DeadlineExceeded("Лимит времени исчерпан")
+
+
+def _error_code(exception):
+    if isinstance(exception, requests.HTTPError) and exception.response is not None:
+        return exception.response.status_code
+    if isinstance(exception, Web3RPCError) and isinstance(exception.rpc_response, dict):
+        error = exception.rpc_response.get("error")
+        if isinstance(error, dict):
+            return error.get("code")
+    return None
+
+
+def is_rate_limited_response(response):
+    """
+    Проверяет, отклонил ли RPC запрос из-за лимита частоты (ответ с ошибкой вместо HTTP 429).
+
+    :param response: Ответ JSON-RPC.
+    :return: True, если ответ — ошибка лимита частоты.
+    """
+    error = response.get("error") if isinstance(response, dict) else None
+    if not isinstance(error, dict):
+        return False
+    message = str(error.get("message", "")).lower()
+    return error.get("code") in RATE_LIMIT_CODES or any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def _classify_one(exception):
+    if isinstance(exception, (DeadlineExceeded, BroadcastUnknownError)):
+        return PERMANENT
+    message = str(exception).lower()
+    if isinstance(exception, RateLimitError) or _error_code(exception) in RATE_LIMIT_CODES \
+            or any(marker in message for marker in RATE_LIMIT_MARKERS):
+        return RATE_LIMITED
+    if isinstance(exception, (PreflightError, ContractLogicError)) or any(marker in message for marker in REVERT_MARKERS):
+        return PERMANENT
+    if exception.__cause__ is not None or type(exception) in (RuntimeError, Exception):
+        # Обёртка над другой ошибкой: класс определяет причина
+        return None
+    # Ошибки requests проверяются раньше ValueError: ошибка разбора ответа узла — тоже сбой сети
+    if isinstance(exception, (requests.RequestException, OSError)):
+        return TRANSIENT
+    if isinstance(exception, (ValueError, TypeError, LookupError, ArithmeticError)):
+        return PERMANENT
+    return TRANSIENT
+
+
+def classify_error(exception):
+    """
+    Определяет класс ошибки. Обёртки (raise ... from, RuntimeError вокруг исходной ошибки)
+    классифицируются по исходной ошибке.
+
+    :param exception: Исключение.
+    :return: TRANSIENT, RATE_LIMITED или PERMANENT.
+    """
+    seen = set()
+    while exception is not None and id(exception) not in seen:
+        seen.add(id(exception))
+        error_class = _classify_one(exception)
+        if error_class is not None:
+            return error_class
+        exception = exception.__cause__ or exception.__context__
+    return TRANSIENT
+
+
+def _never_connected(exception):
+    # requests оборачивает ошибку соединения urllib3: MaxRetryError(reason=NewConnectionError)
+    if isinstance(exception, requests.ConnectTimeout):
+        return True
+    if isinstance(exception, requests.ConnectionError) and exception.args:
+        reason = getattr(exception.args[0], "reason", exception.args[0])
+        return isinstance(reason, ConnectTimeoutError)
+    return False
+
+
+def _classify_send_one(exception):
+    if any(marker in str(exception).lower() for marker in SEND_ACCEPTED_MARKERS):
+        return SEND_ACCEPTED
+    if isinstance(exception, (RequestNotSentError, DeadlineExceeded)) or _never_connected(exception):
+        return SEND_NOT_SENT
+    if isinstance(exception, Web3RPCError) and isinstance(exception.rpc_response, dict) \
+            and classify_error(exception) != TRANSIENT:
+        # Узел ответил отказом (лимит частоты, нехватка средств, неверная транзакция): она не принята
+        return SEND_NOT_SENT
+    if isinstance(exception, RateLimitError) or _error_code(exception) in RATE_LIMIT_CODES:
+        return SEND_NOT_SENT
+    if exception.__cause__ is not None and type(exception) in (ConnectionError, RuntimeError, Exception):
+        return None
+    return SEND_UNKNOWN
+
+
+def classify_send_error(exception):
+    """
+    Определяет исход отправки подписанной транзакции по ошибке eth_sendRawTransaction.
+
+    Таймаут чтения, обрыв соединения после отправки запроса или ошибка разбора ответа не доказывают,
+    что узел не получил транзакцию: такая отправка считается неизвестной, и транзакция не подписывается
+    заново с новым nonce. Заново подписывать можно, только если запрос не дошёл ни до одного узла
+    или узел ответил отказом.
+
+    :param exception: Исключение.
+    :return: SEND_ACCEPTED, SEND_NOT_SENT или SEND_UNKNOWN.
+    """
+    seen = set()
+    while exception is not None and id(exception) not in seen:
+        seen.add(id(exception))
+        outcome = _classify_send_one(exception)
+        if outcome is not None:
+            return outcome
+        exception = exception.__cause__
+    return SEND_UNKNOWN
+
+
+def retry_after_hint(exception):
+    """
+    Возвращает паузу, которую запросил RPC (Retry-After или время открытия размыкателя).
+
+    :param exception: Исключение.
+    :return: Секунды или None.
+    """
+    seen = set()
+    while exception is not None and id(exception) not in seen:
+        seen.add(id(exception))
+        hint = getattr(exception, "retry_after", None)
+        if hint is None and isinstance(exception, requests.HTTPError) and exception.response is not None:
+            hint = exception.response.headers.get("Retry-After")
+        try:
+            if hint is not None:
+                return float(hint)
+        except ValueError:
+            pass
+        exception = exception.__cause__ or exception.__context__
+    return None
+
+
+def backoff(error_class, attempt, retry_after=None, min_wait=None, max_wait=None):
+    """
+    Возвращает паузу перед повтором: экспоненциальный рост со случайным разбросом, чтобы потоки
+    и процессы, получившие ошибку одновременно, не повторяли запросы одновременно.
+
+    :param error_class: Класс ошибки.
+    :param attempt: Номер завершившейся попытки (с 1).
+    :param retry_after: Пауза, запрошенная RPC.
+    :param min_wait: Базовая пауза (по умолчанию RETRY_BASE_DELAY или RATE_LIMIT_BASE_DELAY).
+    :param max_wait: Максимальная пауза (по умолчанию RETRY_MAX_DELAY или RATE_LIMIT_MAX_DELAY).
+    :return: Пауза в секундах.
+    """
+    if error_class == RATE_LIMITED:
+        base = RATE_LIMIT_BASE_DELAY if min_wait is None else min_wait
+        # Половина паузы фиксирована: лимит RPC не освободится раньше
+        delay = min(RATE_LIMIT_MAX_DELAY if max_wait is None else max_wait, base * 2 ** (attempt - 1))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+    else:
+        base = RETRY_BASE_DELAY if min_wait is None else min_wait
+        delay = random.uniform(0, min(RETRY_MAX_DELAY if max_wait is None else max_wait, base * 2 ** (attempt - 1)))
+    return max(delay, retry_after or 0)
+
+
+class wait_backoff:
+    """Пауза перед повтором по классу ошибки (см. backoff)."""
+
+    def __init__(self, min_wait=None, max_wait=None):
+        self.min_wait = min_wait
+        self.max_wait = max_wait
+
+    def __call__(self, retry_state):
+        exception = retry_state.outcome.exception()
+        return backoff(classify_error(exception), retry_state.attempt_number, retry_after_hint(exception),
+                       self.min_wait, self.max_wait)
+
+
+class stop_at_deadline(stop_base):
+    """Остановка после max попыток или если пауза перед повтором не укладывается в срок."""
+
+    def __init__(self, max_attempts):
+        self.max = max_attempts
+
+    def __call__(self, retry_state):
+        left = remaining()
+        return retry_state.attempt_number >= self.max or (left is not None and retry_state.upcoming_sleep >= left)
+
+
+def _is_retryable(exception):
+    return classify_error(exception) != PERMANENT
+
+
+def custom_before_sleep(retry_state, logger=None):
     """
     Пользовательская функция для обработки событий перед задержкой.
     Записывает кастомное сообщение в лог.
+
+    :param logger: Логгер для сообщения (по умолчанию — логгер модуля и имени функции).
     """
-    logger = retry_state.fn.__module__ + "." + retry_state.fn.__name__
-    logger = logging.getLogger(logger)
+    if logger is None:
+        logger = logging.getLogger(retry_state.fn.__module__ + "." + retry_state.fn.__name__)
     exception = retry_state.outcome.exception()
     attempt = retry_state.attempt_number
     max_attempts = getattr(retry_state.retry_object.stop, 'max', RPC_RETRY_LIMIT)
@@ -20,22 +290,46 @@ def custom_before_sleep(retry_state):
 
     # Формируем кастомное сообщение
     message = (f"Пытаемся снова выполнить {retry_state.fn.__name__} (попытка {attempt} из {max_attempts}) "
-               f"через {wait:.1f} секунд после ошибки: {exception}")
+               f"через {wait:.1f} секунд после ошибки ({classify_error(exception)}): {exception}")
     logger.warning(message)
 
-def retry_on_exception(max_attempts=RPC_RETRY_LIMIT, min_wait=4, max_wait=11, logger=None):
+def retry_on_exception(max_attempts=RPC_RETRY_LIMIT, min_wait=None, max_wait=None, logger=None, budget=RETRY_BUDGET):
     """
-    Декоратор для повторных попыток выполнения функции при возникновении исключений.
+    Декоратор для повторных попыток выполнения функции при сетевых ошибках и превышении лимита RPC.
+
+    Постоянные ошибки (откат транзакции, неверные параметры) не повторяются. Повторы выполняет
+    только внешний декорированный вызов: вложенные декорированные функции выполняются один раз,
+    и число попыток не умножается. Все попытки укладываются в budget и в срок внешнего контекста
+    (например, лимит цикла ребалансировки).
 
     :param max_attempts: Максимальное количество попыток.
-    :param min_wait: Минимальная задержка перед следующей попыткой (секунды).
-    :param max_wait: Максимальная задержка перед следующей попыткой (секунды).
-    :param logger: Логгер для записи предупреждений перед каждой попыткой.
+    :param min_wait: Базовая пауза перед повтором (по умолчанию зависит от класса ошибки, см. backoff).
+    :param max_wait: Максимальная пауза перед повтором.
+    :param logger: Логгер для сообщений о повторах.
+    :param budget: Лимит времени на вызов со всеми повторами (секунды).
     """
 
-    return retry(
-        stop=stop_after_attempt(max_attempts),
-        wait=wait_exponential(multiplier=1, min=min_wait, max=max_wait),
-        retry=retry_if_exception_type(Exception),
-        before_sleep=custom_before_sleep
-    )
+    def decorator(fn):
+        retrying = retry(
+            stop=stop_at_deadline(max_attempts),
+            wait=wait_backoff(min_wait, max_wait),
+            retry=retry_if_exception(_is_retryable),
+            before_sleep=functools.partial(custom_before_sleep, logger=logger),
+            reraise=True
+        )(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            check_deadline()
+            if _retrying.get():
+                return fn(*args, **kwargs)
+            token = _retrying.set(True)
+            try:
+                with deadline(budget):
+                    return retrying(*args, **kwargs)
+            finally:
+                _retrying.reset(token)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,146 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dotenv import load_dotenv
+from utils.retry_decorator import DeadlineExceeded, remaining
+
+load_dotenv()
+
+RPC_BATCH_MAX_SIZE = int(os.getenv("RPC_BATCH_MAX_SIZE", 50))  # Максимум запросов в одном пакетном HTTP-запросе
+RPC_BATCH_INTERVAL = float(os.getenv("RPC_BATCH_INTERVAL", 0.005))  # Сколько секунд копить запросы (0 — выкл.)
+
+# Чтения, которые можно объединять в пакетный запрос
+BATCH_METHODS = {
+    "eth_call", "eth_estimateGas", "eth_getTransactionCount", "eth_getBalance", "eth_getBlockByNumber",
+    "eth_getTransactionReceipt", "eth_getCode", "eth_createAccessList",
+}
+
+
+class RpcBatcher:
+    """
+    Объединяет одновременные JSON-RPC запросы из разных потоков в пакетные HTTP-запросы.
+
+    Запрос, пока других запросов в работе нет, отправляется сразу, без задержки. Запросы,
+    пришедшие во время выполнения других, копятся не дольше flush_interval секунд;
+    заполненный до max_size пакет отправляется сразу потоком, который его заполнил.
+    Если RPC не принимает пакетные запросы, запросы отправляются по одному.
+    Вместе с запросом запоминается контекст вызывающего потока (срок вызова, функция бота для метрик):
+    одиночные запросы выполняются в нём, а контексты запросов пакета передаются в send_batch.
+    """
+
+    def __init__(self, send_batch, send_one, max_size=RPC_BATCH_MAX_SIZE, flush_interval=RPC_BATCH_INTERVAL):
+        """
+        :param send_batch: Функция send_batch([(method, params), ...], [context, ...]), возвращающая список ответов.
+        :param send_one: Функция send_one(method, params) для одиночного запроса.
+        :param max_size: Максимальный размер пакета.
+        :param flush_interval: Время накопления пакета в секундах.
+        """
+        self.send_batch = send_batch
+        self.send_one = send_one
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.batches = 0
+        self.requests = 0
+        self._queue = []
+        self._active = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def request(self, method, params):
+        """
+        Ставит запрос в очередь пакета и ожидает ответ.
+
+        :param method: JSON-RPC метод.
+        :param params: Параметры.
+        :return: Ответ JSON-RPC.
+        """
+        with self._cond:
+            self._active += 1
+            alone = self._active == 1
+            if alone:
+                self.batches += 1
+                self.requests += 1
+        if alone:
+            # Параллельных запросов нет: ждать пакета бессмысленно
+            try:
+                return self.send_one(method, params)
+            finally:
+                self._done()
+
+        future = Future()
+        with self._cond:
+            self._queue.append((method, params, future, contextvars.copy_context()))
+            if len(self._queue) >= self.max_size:
+                batch, self._queue = self._queue[:self.max_size], self._queue[self.max_size:]
+            else:
+                batch = None
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="rpc-batcher", daemon=True)
+                    self._thread.start()
+                self._cond.notify()
+        if batch is not None:
+            self._dispatch(batch)
+        try:
+            # Пакет отправляется фоновым потоком: ожидание ограничено сроком вызывающего
+            return future.result(timeout=remaining())
+        except FutureTimeoutError:
+            raise DeadlineExceeded(f"Лимит времени исчерпан в ожидании ответа на {method}")
+        finally:
+            self._done()
+
+    def _done(self):
+        with self._cond:
+            self._active -= 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+            # Даём другим потокам время добавить свои запросы в пакет
+            time.sleep(self.flush_interval)
+            with self._cond:
+                batch, self._queue = self._queue[:self.max_size], self._queue[self.max_size:]
+            if batch:
+                self._dispatch(batch)
+
+    def _dispatch(self, batch):
+        with self._cond:
+            self.batches += 1
+            self.requests += len(batch)
+        if len(batch) == 1:
+            method, params, future, context = batch[0]
+            context.run(self._resolve, future, self.send_one, method, params)
+            return
+        try:
+            responses = self.send_batch([(method, params) for method, params, _, _ in batch],
+                                        [context for _, _, _, context in batch])
+        except Exception as e:
+            for _, _, future, _ in batch:
+                future.set_exception(e)
+            return
+        if not isinstance(responses, list) or len(responses) != len(batch):
+            # RPC не поддерживает пакетные запросы: отправляем по одному
+            for method, params, future, context in batch:
+                context.run(self._resolve, future, self.send_one, method, params)
+            return
+        for (_, _, future, _), response in zip(batch, responses):
+            future.set_result(response)
+
+    @staticmethod
+    def _resolve(future, send, method, params):
+        try:
+            future.set_result(send(method, params))
+        except Exception as e:
+            future.set_exception(e)
+
+    def stats(self):
+        """
+        Возвращает статистику пакетирования.
+
+        :return: Словарь {batches, requests, avg_batch_size}.
+        """
+        return {"batches": self.batches, "requests": self.requests,
+                "avg_batch_size": self.requests / self.batches if self.batches else None}
@@ -0,0 +1,374 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import HTTPProvider
+from web3.providers import JSONBaseProvider
+from dotenv import load_dotenv
+from utils.errors import RequestNotSentError
+from utils.metrics import current_operation, metrics, record_http_bytes, take_http_bytes
+from utils.read_cache import BlockReadCache, READ_CACHE_ENABLED
+from utils.retry_decorator import (RateLimitError, check_deadline, classify_error, is_rate_limited_response,
+                                   retry_after_hint, RATE_LIMITED)
+from utils.rpc_batcher import RpcBatcher, BATCH_METHODS, RPC_BATCH_INTERVAL
+
+load_dotenv()
+
+RPC_TIMEOUT = float(os.getenv("RPC_TIMEOUT", 10))  # Таймаут HTTP-запроса к RPC (секунды)
+RPC_POOL_MAXSIZE = int(os.getenv("RPC_POOL_MAXSIZE", 32))  # Keep-alive соединений на один RPC
+RPC_HEDGE_AFTER = float(os.getenv("RPC_HEDGE_AFTER", 0))  # Через сколько секунд дублировать чтение на второй RPC (0 — выкл.)
+RPC_EXPLORE_RATE = float(os.getenv("RPC_EXPLORE_RATE", 0.05))  # Доля запросов на случайный RPC для обновления статистики
+RPC_COOLDOWN = float(os.getenv("RPC_COOLDOWN", 30))  # Пауза для RPC после серии ошибок (секунды)
+RPC_MAX_COOLDOWN = float(os.getenv("RPC_MAX_COOLDOWN", 300))  # Максимальная пауза при повторяющихся сбоях
+RPC_MAX_CONSECUTIVE_ERRORS = int(os.getenv("RPC_MAX_CONSECUTIVE_ERRORS", 3))
+
+EWMA_ALPHA = 0.2  # Вес нового замера в скользящей средней
+
+# Методы только для чтения: их безопасно отправлять на несколько RPC одновременно
+READ_METHODS = {
+    "eth_call", "eth_getBalance", "eth_blockNumber", "eth_getBlockByNumber", "eth_getBlockByHash",
+    "eth_chainId", "eth_gasPrice", "eth_maxPriorityFeePerGas", "eth_feeHistory", "eth_getTransactionCount",
+    "eth_getTransactionReceipt", "eth_getTransactionByHash", "eth_getLogs", "eth_estimateGas",
+    "eth_createAccessList", "eth_getCode", "web3_clientVersion",
+}
+
+# Фильтры хранятся в памяти создавшего их узла: запросы к фильтру отправляются только на этот RPC
+FILTER_CREATE_METHODS = {"eth_newFilter", "eth_newBlockFilter", "eth_newPendingTransactionFilter"}
+FILTER_METHODS = FILTER_CREATE_METHODS | {"eth_getFilterChanges", "eth_getFilterLogs", "eth_uninstallFilter"}
+# Методы, которые при ошибке не повторяются на другом RPC. Подписанная транзакция повторно отправляется
+# только вызывающим кодом (blockchain.broadcast), который различает потерянный ответ и отказ узла
+NO_FAILOVER_METHODS = FILTER_METHODS | {"eth_sendRawTransaction"}
+
+
+def create_endpoint_provider(url):
+    """
+    Создаёт HTTP-провайдер с постоянной сессией (keep-alive) для одного RPC.
+
+    :param url: Адрес RPC.
+    :return: Экземпляр HTTPProvider.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RPC_POOL_MAXSIZE)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Размеры запросов и ответов для метрик
+    session.hooks["response"].append(record_http_bytes)
+    # Повторы выполняет пул, переключаясь на другой RPC, а не сам провайдер
+    return HTTPProvider(url, request_kwargs={"timeout": RPC_TIMEOUT}, session=session,
+                        exception_retry_configuration=None)
+
+
+# Фабрика провайдеров для отдельных RPC; может быть заменена до создания пула
+# (например, на локальный стенд в benchmarks)
+PROVIDER_FACTORY = create_endpoint_provider
+
+
+class CircuitOpenError(RequestNotSentError):
+    """Размыкатели всех RPC открыты: запрос не отправляется."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Размыкатель цепи для одного RPC.
+
+    После RPC_MAX_CONSECUTIVE_ERRORS ошибок подряд или отказа по лимиту частоты RPC исключается
+    из работы на время паузы (open). По её истечении пропускается один пробный запрос (half-open):
+    успех возвращает RPC в работу, ошибка снова исключает его с удвоенной паузой.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold=RPC_MAX_CONSECUTIVE_ERRORS, cooldown=RPC_COOLDOWN, max_cooldown=RPC_MAX_COOLDOWN):
+        """
+        :param threshold: Количество ошибок подряд, после которого RPC исключается.
+        :param cooldown: Начальная пауза в секундах.
+        :param max_cooldown: Максимальная пауза в секундах.
+        """
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.state = self.CLOSED
+        self.consecutive_errors = 0
+        self.cooldown = cooldown
+        self.open_until = 0.0
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    def ready(self, now):
+        """Можно ли сейчас отправить запрос (без занятия пробного запроса)."""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return now >= self.open_until
+        # Пробный запрос, не завершившийся за таймаут, больше не блокирует RPC
+        return self._probe_started is None or now - self._probe_started > RPC_TIMEOUT
+
+    def allow(self, now):
+        """
+        Разрешает запрос. В состоянии half-open разрешается только один пробный запрос.
+
+        :return: True, если запрос можно отправить.
+        """
+        with self._lock:
+            if not self.ready(now):
+                return False
+            if self.state != self.CLOSED:
+                self.state = self.HALF_OPEN
+                self._probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_errors = 0
+            self.cooldown = self.base_cooldown
+            self._probe_started = None
+
+    def record_failure(self, now, rate_limited=False, retry_after=None):
+        """
+        :param now: Текущее время (time.monotonic).
+        :param rate_limited: RPC отклонил запрос по лимиту частоты: исключается сразу.
+        :param retry_after: Пауза, запрошенная RPC.
+        """
+        with self._lock:
+            self.consecutive_errors += 1
+            self._probe_started = None
+            if self.state == self.HALF_OPEN:
+                # Пробный запрос не прошёл: пауза растёт
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            elif not rate_limited and self.consecutive_errors < self.threshold:
+                return
+            self.state = self.OPEN
+            self.open_until = now + max(self.cooldown, retry_after or 0)
+
+    def retry_after(self, now):
+        """Секунды до следующего пробного запроса."""
+        return max(0.0, self.open_until - now) if self.state == self.OPEN else 0.0
+
+
+class Endpoint:
+    """Статистика одного RPC: скользящие задержка и доля ошибок, размыкатель цепи."""
+
+    def __init__(self, url, provider):
+        self.url = url
+        # Для метрик используется только хост: путь может содержать API-ключ
+        self.label = urlparse(url).netloc or url
+        self.provider = provider
+        self.latency = None
+        self.error_rate = 0.0
+        self.breaker = CircuitBreaker()
+        self._lock = threading.Lock()
+
+    def record_success(self, latency):
+        with self._lock:
+            self.latency = latency if self.latency is None else (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * latency
+            self.error_rate *= (1 - EWMA_ALPHA)
+        self.breaker.record_success()
+
+    def record_error(self, exception=None):
+        with self._lock:
+            self.error_rate = (1 - EWMA_ALPHA) * self.error_rate + EWMA_ALPHA
+        rate_limited = exception is not None and classify_error(exception) == RATE_LIMITED
+        self.breaker.record_failure(time.monotonic(), rate_limited,
+                                    retry_after_hint(exception) if rate_limited else None)
+
+    def is_available(self, now):
+        return self.breaker.ready(now)
+
+    def score(self):
+        # Неопробованный RPC получает лучший балл, чтобы быстрее набрать статистику,
+        # а RPC, ни разу не ответивший успешно, считается медленным как таймаут
+        if self.latency is not None:
+            latency = self.latency
+        else:
+            latency = 0.0 if self.error_rate == 0 else RPC_TIMEOUT
+        return latency * (1 + 10 * self.error_rate)
+
+
+class RpcPool(JSONBaseProvider):
+    """
+    Провайдер web3, распределяющий запросы по нескольким RPC.
+
+    Каждый запрос направляется на RPC с лучшим баллом (скользящая задержка с учётом ошибок),
+    при ошибке сразу повторяется на следующем. RPC с серией ошибок или превысивший лимит частоты
+    исключается размыкателем цепи до успешного пробного запроса. Чтения при включённом RPC_HEDGE_AFTER
+    дублируются на второй RPC, если первый не ответил вовремя. Повторные чтения в пределах
+    одного блока отдаются из BlockReadCache, а одновременные чтения из разных потоков
+    объединяются RpcBatcher в пакетные HTTP-запросы. Запросы к фильтру отправляются на RPC,
+    создавший фильтр.
+    """
+
+    def __init__(self, urls, provider_factory=None, hedge_after=RPC_HEDGE_AFTER, read_cache=READ_CACHE_ENABLED,
+                 batch_interval=RPC_BATCH_INTERVAL, **kwargs):
+        """
+        :param urls: Список адресов RPC.
+        :param provider_factory: Функция, создающая провайдер для одного адреса (по умолчанию PROVIDER_FACTORY).
+        :param hedge_after: Задержка в секундах перед дублированием чтения (0 — без дублирования).
+        :param read_cache: Кэшировать ли чтения в пределах блока.
+        :param batch_interval: Время накопления пакетного запроса в секундах (0 — без пакетирования).
+        """
+        super().__init__(**kwargs)
+        provider_factory = provider_factory or PROVIDER_FACTORY
+        self.endpoints = [Endpoint(url, provider_factory(url)) for url in urls]
+        self.hedge_after = hedge_after
+        self._hedge_executor = ThreadPoolExecutor(max_workers=RPC_POOL_MAXSIZE, thread_name_prefix="rpc-hedge") \
+            if hedge_after > 0 and len(self.endpoints) > 1 else None
+        self.read_cache = BlockReadCache(
+            lambda: int(self._send("eth_blockNumber", [])["result"], 16)) if read_cache else None
+        self.batcher = RpcBatcher(self._send_batch, self._send, flush_interval=batch_interval) \
+            if batch_interval > 0 else None
+        self._filter_endpoints = {}
+        self._filters_lock = threading.Lock()
+
+    def ranked_endpoints(self):
+        """
+        Возвращает RPC, размыкатель которых пропускает запросы, по возрастанию балла.
+
+        :return: Список Endpoint.
+        :raises CircuitOpenError: Если размыкатели всех RPC открыты.
+        """
+        now = time.monotonic()
+        available = sorted((e for e in self.endpoints if e.is_available(now)), key=Endpoint.score)
+        if not available:
+            retry_after = min(e.breaker.retry_after(now) for e in self.endpoints)
+            raise CircuitOpenError(f"Все RPC временно исключены, ближайший пробный запрос через {retry_after:.1f} с",
+                                   retry_after)
+        if len(available) > 1 and random.random() < RPC_EXPLORE_RATE:
+            # Изредка отправляем запрос не на лучший RPC, чтобы его статистика не устаревала
+            available.insert(0, available.pop(random.randrange(1, len(available))))
+        return available
+
+    @staticmethod
+    def _call(endpoint, method, send):
+        # Пробный запрос после паузы может быть уже занят другим потоком
+        if not endpoint.breaker.allow(time.monotonic()):
+            raise CircuitOpenError(f"RPC {endpoint.label} временно исключён",
+                                   endpoint.breaker.retry_after(time.monotonic()))
+        start = time.perf_counter()
+        try:
+            response = send(endpoint.provider)
+            if is_rate_limited_response(response):
+                raise RateLimitError(f"RPC {endpoint.label} ограничил частоту запросов: {response['error']}")
+        except Exception as e:
+            latency = time.perf_counter() - start
+            endpoint.record_error(e)
+            RpcPool._observe(method, endpoint, latency, True)
+            raise
+        latency = time.perf_counter() - start
+        endpoint.record_success(latency)
+        RpcPool._observe(method, endpoint, latency, False)
+        return response
+
+    @staticmethod
+    def _observe(method, endpoint, latency, error):
+        if isinstance(method, str):
+            metrics.observe(method, endpoint.label, latency, error, *take_http_bytes())
+        else:
+            # Пакет RpcBatcher: каждый запрос учитывается под своим методом и функцией бота
+            metrics.observe_batch(method, endpoint.label, latency, error, *take_http_bytes())
+
+    def _without_failover(self, method, send, endpoint=None):
+        """Выполняет запрос на одном RPC (по умолчанию — лучшем) без повтора на других."""
+        endpoint = endpoint or self.ranked_endpoints()[0]
+        check_deadline()
+        return self._call(endpoint, method, send)
+
+    def _send_filter(self, method, params, send):
+        if method in FILTER_CREATE_METHODS:
+            endpoint = self.ranked_endpoints()[0]
+            response = self._without_failover(method, send, endpoint)
+            if "result" in response:
+                with self._filters_lock:
+                    self._filter_endpoints[response["result"]] = endpoint
+            return response
+        filter_id = params[0] if params else None
+        with self._filters_lock:
+            endpoint = self._filter_endpoints.get(filter_id)
+        if endpoint is None:
+            # Фильтр создан не через этот пул: ни один RPC пула о нём не знает
+            raise ValueError(f"Фильтр {filter_id} не найден")
+        response = self._without_failover(method, send, endpoint)
+        if method == "eth_uninstallFilter" or "error" in response:
+            # Удалённый или истёкший на узле фильтр больше не опрашивается
+            with self._filters_lock:
+                self._filter_endpoints.pop(filter_id, None)
+        return response
+
+    def _with_failover(self, method, send):
+        last_error = None
+        for endpoint in self.ranked_endpoints():
+            # Запрос, начатый после истечения срока цикла, уже никому не нужен
+            check_deadline()
+            try:
+                return self._call(endpoint, method, send)
+            except Exception as e:
+                last_error = e
+        raise ConnectionError(f"Не удалось выполнить запрос ни на одном из RPC узлов: {last_error}") from last_error
+
+    def _submit(self, endpoint, method, send):
+        # Контекст копируется, чтобы вызов в фоновом потоке учитывался под той же функцией бота
+        return self._hedge_executor.submit(contextvars.copy_context().run, self._call, endpoint, method, send)
+
+    def _hedged(self, method, send):
+        endpoints = self.ranked_endpoints()
+        if len(endpoints) < 2:
+            return self._with_failover(method, send)
+        check_deadline()
+        primary = self._submit(endpoints[0], method, send)
+        done, _ = wait([primary], timeout=self.hedge_after)
+        if done and primary.exception() is None:
+            return primary.result()
+        futures = [primary] if not done else []
+        futures.append(self._submit(endpoints[1], method, send))
+        while futures:
+            done, pending = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+            futures = list(pending)
+        # Оба RPC не ответили: пробуем остальные по очереди
+        return self._with_failover(method, send)
+
+    def _send(self, method, params):
+        send = lambda provider: provider.make_request(method, params)
+        if method in FILTER_METHODS:
+            return self._send_filter(method, params, send)
+        if method in NO_FAILOVER_METHODS:
+            return self._without_failover(method, send)
+        if self._hedge_executor is not None and method in READ_METHODS:
+            return self._hedged(method, send)
+        return self._with_failover(method, send)
+
+    def make_request(self, method, params):
+        send = self._send
+        if self.batcher is not None and method in BATCH_METHODS:
+            send = self.batcher.request
+        if self.read_cache is not None:
+            return self.read_cache.request(method, params, send)
+        return send(method, params)
+
+    def make_batch_request(self, batch_requests):
+        return self._with_failover("batch", lambda provider: provider.make_batch_request(batch_requests))
+
+    def _send_batch(self, batch_requests, contexts):
+        labels = [(method, context.run(current_operation)) for (method, _), context in zip(batch_requests, contexts)]
+        return self._with_failover(labels, lambda provider: provider.make_batch_request(batch_requests))
+
+    def stats(self):
+        """
+        Возвращает текущую статистику по RPC.
+
+        :return: Список словарей {url, latency, error_rate, available, circuit}.
+        """
+        now = time.monotonic()
+        return [{"url": e.url, "latency": e.latency, "error_rate": e.error_rate, "available": e.is_available(now),
+                 "circuit": e.breaker.state} for e in self.endpoints]
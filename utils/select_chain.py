@@ -1,51 +1,108 @@
 import json, os
 
 
-def select_chain(config_file_path="config.json"):
+# Профили поддерживаемых сетей
+CHAIN_PROFILES = {
+    "Base": {
+        "RPC_URL_1": "https://mainnet.base.org",
+        "RPC_URL_2": "https://base.blockpi.network/v1/rpc/public",
+        "RPC_URL_3": "https://rpc.ankr.com/base",
+        "CHAINLINK_PRICE_FEED": "0x71041dddad3595F9CEd3DcCFBe3D1F4b0a16Bb70",
+        "TOKEN0": "0x4200000000000000000000000000000000000006",
+        "TOKEN1": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
+        "POSITION_MANAGER_ADDRESS": "0x03a520b32C04BF3bEEf7BEb72E919cf822Ed34f1",
+        "DECIMALS0": 18,
+        "DECIMALS1": 6,
+        "PRICE_CHECK_INTERVAL": "60"
+    },
+    "Ethereum": {
+        "RPC_URL_1": "https://mainnet.infura.io/v3/d7337f5ecb9d44a58b6aa799a3d6d71d",
+        "RPC_URL_2": "https://eth-mainnet.g.alchemy.com/v2/9kHZK9FFpvNoc8WWNPTHzqSUwVsJkamH",
+        "RPC_URL_3": "https://rpc.ankr.com/eth",
+        "CHAINLINK_PRICE_FEED": "0x5f4ec3df9cbd43714fe2740f5e3616155c5b8419",
+        "TOKEN0": "0xC02aaa39b223FE8D0A0e5C4F27eAD9083C756Cc2",
+        "TOKEN1": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
+        "POSITION_MANAGER_ADDRESS": "0xC36442b4a4522E871399CD717aBDD847Ab11FE88",
+        "DECIMALS0": 18,
+        "DECIMALS1": 6,
+        "PRICE_CHECK_INTERVAL": "60"
+    },
+}
+
+def resolve_chain_name(chain_input):
+    """
+    Определяет название сети по вводу пользователя, флагу или переменной окружения.
+
+    :param chain_input: Строка выбора сети.
+    :return: "Base", "Ethereum" или None, если выбор не распознан.
+    """
+    chain_input = str(chain_input).strip().lower()
+    if chain_input in ["1", "base", "b"]:
+        return "Base"
+    if chain_input in ["2", "ethereum", "eth", "e"]:
+        return "Ethereum"
+    return None
+
+
+def chain_config(chain_name=None, overrides=None):
+    """
+    Возвращает параметры сети без записи в файл. Если сеть не передана параметром
+    и не задана переменной окружения CHAIN, она запрашивается у пользователя.
+
+    :param chain_name: Название сети для неинтерактивного запуска.
+    :param overrides: Параметры, заменяющие значения профиля сети (например, пул или RPC).
+    :return: Кортеж (название сети, словарь с параметрами сети).
+    """
+    chain_name = chain_name or os.getenv("CHAIN")
+    if chain_name:
+        choice = resolve_chain_name(chain_name)
+        if choice is None:
+            raise ValueError(f"Неизвестная сеть: {chain_name}")
+    else:
+        choice = None
+        while choice is None:
+            chain_input = str(input("Выберите сеть, с которой будете работать. (Base/Ethereum): "))
+            choice = resolve_chain_name(chain_input)
+            if choice is None:
+                print("Неизвестный выбор сети. Пожалуйста, попробуйте снова.")
+    config = dict(CHAIN_PROFILES[choice])
+    config.update(overrides or {})
+    return choice, config
+
+
+def select_chain(config_file_path="config.json", chain_name=None, overrides=None):
     """
     Позволяет пользователю выбрать сеть и сохраняет соответствующую конфигурацию в .conf файл.
+    Если сеть передана параметром или задана переменной окружения CHAIN, запрос не выводится.
+    Выбранная сеть становится сетью по умолчанию для модулей бота (см. utils.chain_context).
 
     :param config_file_path: Путь к конфигурационному файлу.
+    :param chain_name: Название сети для неинтерактивного запуска.
+    :param overrides: Параметры, заменяющие значения профиля сети (например, пул или RPC).
     :return: Словарь с параметрами выбранной сети.
     """
-    chain_input = str(input("Выберите сеть, с которой будете работать. (Base/Ethereum): "))
-    config = {}
-    choice = ''
-    if chain_input.lower() in ["1", "base", "b"]:
-        choice = "Base"
-        config = {
-            "RPC_URL_1": "https://mainnet.base.org",
-            "RPC_URL_2": "https://base.blockpi.network/v1/rpc/public",
-            "RPC_URL_3": "https://rpc.ankr.com/base",
-            "CHAINLINK_PRICE_FEED": "0x71041dddad3595F9CEd3DcCFBe3D1F4b0a16Bb70",
-            "TOKEN0": "0x4200000000000000000000000000000000000006",
-            "TOKEN1": "0x833589fCD6eDb6E08f4c7C32D4f71b54bdA02913",
-            "POSITION_MANAGER_ADDRESS": "0x03a520b32C04BF3bEEf7BEb72E919cf822Ed34f1",
-            "PRICE_CHECK_INTERVAL": "60"
-        }
-    elif chain_input.lower() in ["2", "ethereum", "eth", "e"]:
-        choice = "Ethereum"
-        config = {
-            "RPC_URL_1": "https://mainnet.infura.io/v3/d7337f5ecb9d44a58b6aa799a3d6d71d",
-            "RPC_URL_2": "https://eth-mainnet.g.alchemy.com/v2/9kHZK9FFpvNoc8WWNPTHzqSUwVsJkamH",
-            "RPC_URL_3": "https://rpc.ankr.com/eth",
-            "CHAINLINK_PRICE_FEED": "0x5f4ec3df9cbd43714fe2740f5e3616155c5b8419",
-            "TOKEN0": "0xC02aaa39b223FE8D0A0e5C4F27eAD9083C756Cc2",
-            "TOKEN1": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
-            "POSITION_MANAGER_ADDRESS": "0xC36442b4a4522E871399CD717aBDD847Ab11FE88",
-            "PRICE_CHECK_INTERVAL": "60"
-        }
-    else:
-        print("Неизвестный выбор сети. Пожалуйста, попробуйте снова.")
-        return select_chain()  # Рекурсивный вызов для повторного выбора
+    from utils.chain_context import ChainContext, set_default_chain
+    choice, config = chain_config(chain_name, overrides)
 
     # Запись конфигурации в .conf файл
     write_config_to_file(config, config_file_path)
     print(f"Конфигурация для сети {choice} записана в {config_file_path}")
+    set_default_chain(ChainContext(config, choice))
 
     return config
 
 
+def get_config():
+    """
+    Возвращает конфигурацию текущей сети: профиля оркестратора или выбранной при запуске
+    (файл настроек загружается только при первом обращении).
+
+    :return: Словарь с параметрами конфигурации.
+    """
+    from utils.chain_context import current_chain
+    return current_chain().config
+
+
 def write_config_to_file(config, file_path):
     """
     Записывает конфигурацию в JSON файл.
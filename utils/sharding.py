@@ -0,0 +1,374 @@
+import argparse
+import contextlib
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SHARD_DIR = os.getenv("SHARD_DIR", "shards")  # Общая папка шардов: аренды, сигнал цены, состояние
+SHARD_LEASE_TTL = float(os.getenv("SHARD_LEASE_TTL", 30))  # Срок аренды шарда без продления (секунды)
+PRICE_SIGNAL_MAX_AGE = float(os.getenv("PRICE_SIGNAL_MAX_AGE", 300))  # Старше — цена запрашивается самим шардом
+PRICE_SIGNAL_POLL = float(os.getenv("PRICE_SIGNAL_POLL", 0.2))  # Интервал проверки файла сигнала (секунды)
+LOCK_STALE_AFTER = 10  # Через сколько секунд блокировка упавшего процесса считается брошенной
+
+
+def shard_of(address, shard_count):
+    """
+    Возвращает номер шарда кошелька по хэшу адреса.
+
+    :param address: Адрес кошелька.
+    :param shard_count: Количество шардов.
+    :return: Номер шарда от 0 до shard_count - 1.
+    """
+    digest = hashlib.sha256(address.lower().encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def shard_wallets(wallets, shard_index, shard_count):
+    """
+    Оставляет кошельки одного шарда.
+
+    :param wallets: Список пар (адрес, приватный ключ).
+    :param shard_index: Номер шарда.
+    :param shard_count: Количество шардов.
+    :return: Список пар (адрес, приватный ключ) этого шарда.
+    """
+    return [(address, key) for address, key in wallets if shard_of(address, shard_count) == shard_index]
+
+
+def _write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as tmp_file:
+        json.dump(data, tmp_file)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, "r") as json_file:
+            return json.load(json_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+class LeaseManager:
+    """
+    Аренда шардов через файлы в общей папке (локальной или сетевой).
+
+    Шард принадлежит процессу, пока тот продлевает аренду; аренда, не продлённая
+    SHARD_LEASE_TTL секунд, достаётся другому процессу. Чтение и запись аренды
+    выполняются под файловой блокировкой (O_CREAT | O_EXCL), поэтому два процесса
+    не могут захватить один шард. Сроки сравниваются по системным часам, на разных
+    хостах они должны быть синхронизированы.
+    """
+
+    def __init__(self, shard_dir=SHARD_DIR, owner=None, ttl=SHARD_LEASE_TTL):
+        """
+        :param shard_dir: Общая папка шардов.
+        :param owner: Идентификатор процесса (по умолчанию хост и pid).
+        :param ttl: Срок аренды в секундах.
+        """
+        self.shard_dir = shard_dir
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}"
+        self.ttl = ttl
+        os.makedirs(shard_dir, exist_ok=True)
+
+    def _lease_path(self, shard):
+        return os.path.join(self.shard_dir, f"lease-{shard}.json")
+
+    @contextlib.contextmanager
+    def _locked(self, shard):
+        lock_path = os.path.join(self.shard_dir, f"lease-{shard}.lock")
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_AFTER:
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(lock_path)
+
+    def acquire(self, shard):
+        """
+        Захватывает шард, если он свободен, его аренда истекла или уже принадлежит этому процессу.
+
+        :param shard: Номер шарда.
+        :return: True, если шард захвачен.
+        """
+        with self._locked(shard):
+            lease = _read_json(self._lease_path(shard))
+            if lease and lease["owner"] != self.owner and lease["expires"] > time.time():
+                return False
+            _write_json(self._lease_path(shard), {"owner": self.owner, "expires": time.time() + self.ttl})
+            return True
+
+    def acquire_any(self, shard_count, preferred=0):
+        """
+        Захватывает первый доступный шард, начиная с предпочтительного.
+
+        :param shard_count: Количество шардов.
+        :param preferred: Номер шарда, с которого начинается поиск.
+        :return: Номер захваченного шарда или None.
+        """
+        for offset in range(shard_count):
+            shard = (preferred + offset) % shard_count
+            if self.acquire(shard):
+                return shard
+        return None
+
+    def renew(self, shard):
+        """
+        Продлевает аренду шарда.
+
+        :param shard: Номер шарда.
+        :return: False, если шард уже захвачен другим процессом.
+        """
+        with self._locked(shard):
+            lease = _read_json(self._lease_path(shard))
+            if lease and lease["owner"] != self.owner:
+                return False
+            _write_json(self._lease_path(shard), {"owner": self.owner, "expires": time.time() + self.ttl})
+            return True
+
+    def release(self, shard):
+        """
+        Освобождает шард, если он принадлежит этому процессу.
+
+        :param shard: Номер шарда.
+        """
+        with self._locked(shard):
+            lease = _read_json(self._lease_path(shard))
+            if lease and lease["owner"] == self.owner:
+                os.remove(self._lease_path(shard))
+
+
+class PriceSignal:
+    """
+    Общий для всех шардов сигнал цены в файле.
+
+    Координатор записывает цену с порядковым номером, шарды ждут новый номер.
+    Все шарды получают одну и ту же цену и одновременно проверяют свои позиции.
+    Интерфейс чтения совпадает с PriceWatcher.wait_for_update.
+    """
+
+    def __init__(self, path, max_age=PRICE_SIGNAL_MAX_AGE, poll_interval=PRICE_SIGNAL_POLL):
+        """
+        :param path: Путь к файлу сигнала.
+        :param max_age: Возраст сигнала в секундах, после которого он считается устаревшим.
+        :param poll_interval: Интервал проверки файла в секундах.
+        """
+        self.path = path
+        self.max_age = max_age
+        self.poll_interval = poll_interval
+        self.seq = None
+
+    def publish(self, price):
+        """
+        Записывает новую цену.
+
+        :param price: Цена ETH.
+        """
+        signal = _read_json(self.path) or {"seq": 0}
+        _write_json(self.path, {"seq": signal["seq"] + 1, "price": price, "time": time.time()})
+
+    def read(self):
+        """
+        Возвращает последнюю цену сигнала.
+
+        :return: Цена или None, если сигнала нет или он устарел.
+        """
+        signal = _read_json(self.path)
+        if signal is None or time.time() - signal["time"] > self.max_age:
+            return None
+        self.seq = signal["seq"]
+        return signal["price"]
+
+    def wait_for_update(self, timeout):
+        """
+        Ожидает новый сигнал не дольше timeout секунд.
+
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: Цена нового сигнала; по истечении времени — последняя цена или None, если сигнал устарел.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            signal = _read_json(self.path)
+            if signal is not None and signal["seq"] != self.seq:
+                self.seq = signal["seq"]
+                return signal["price"]
+            time.sleep(min(self.poll_interval, max(deadline - time.monotonic(), 0)))
+        return self.read()
+
+
+def shard_env(shard, shard_count, shard_dir=SHARD_DIR):
+    """
+    Возвращает переменные окружения бота для шарда: свои файлы настроек сети, состояния и логов,
+    общий сигнал цены.
+
+    :param shard: Номер шарда.
+    :param shard_count: Количество шардов.
+    :param shard_dir: Общая папка шардов.
+    :return: Словарь переменных окружения.
+    """
+    folder = os.path.join(shard_dir, f"shard-{shard}")
+    return {
+        "SHARD_INDEX": str(shard),
+        "SHARD_COUNT": str(shard_count),
+        "PRICE_SIGNAL_PATH": os.path.join(shard_dir, "price.json"),
+        # Каждый шард записывает настройки сети в свой файл: шарды запускаются одновременно
+        "CONFIG_PATH": os.path.join(folder, "config.json"),
+        "STATE_DB_PATH": os.path.join(folder, "state.db"),
+        "POSITION_INDEX_PATH": os.path.join(folder, "positions.db"),
+        "WALLET_CACHE_PATH": os.path.join(folder, ".wallets_cache"),
+        "LOG_FOLDER": os.path.join(folder, "logs"),
+        # В процессе шарда некому ответить на вопрос о пустых кошельках
+        "ADD_IF_EMPTY": os.getenv("ADD_IF_EMPTY", "0"),
+    }
+
+
+def run_worker(shard_count, shard_dir=SHARD_DIR, preferred=0, argv=None, password=None, ttl=SHARD_LEASE_TTL):
+    """
+    Процесс шарда: дожидается свободного шарда, продлевает его аренду в фоне
+    и запускает основной цикл бота для кошельков этого шарда.
+
+    :param shard_count: Количество шардов.
+    :param shard_dir: Общая папка шардов.
+    :param preferred: Номер шарда, который процесс пытается захватить первым.
+    :param argv: Аргументы main (сеть; файл настроек заменяется файлом шарда).
+    :param password: Пароль от ключей.
+    :param ttl: Срок аренды шарда в секундах.
+    """
+    leases = LeaseManager(shard_dir, ttl=ttl)
+    shard = leases.acquire_any(shard_count, preferred)
+    while shard is None:
+        # Все шарды заняты: процесс ждёт как резервный, пока чья-нибудь аренда не истечёт
+        time.sleep(leases.ttl / 3)
+        shard = leases.acquire_any(shard_count, preferred)
+
+    def renew():
+        while True:
+            time.sleep(leases.ttl / 3)
+            if not leases.renew(shard):
+                # Шард уже обслуживает другой процесс: продолжать нельзя, иначе транзакции задвоятся
+                print(f"Аренда шарда {shard} потеряна, процесс {leases.owner} завершается.", flush=True)
+                os._exit(1)
+
+    threading.Thread(target=renew, name="shard-lease", daemon=True).start()
+    env = shard_env(shard, shard_count, shard_dir)
+    os.makedirs(os.path.dirname(env["STATE_DB_PATH"]), exist_ok=True)
+    # Настройки модулей читаются из окружения при импорте, поэтому оно задаётся до импорта бота
+    os.environ.update(env)
+    import main
+    try:
+        # Последний --config переопределяет переданный в argv
+        main.main(list(argv or []) + ["--config", env["CONFIG_PATH"]], password=password)
+        # Пустой шард: аренда удерживается, чтобы его не захватывали резервные процессы
+        while True:
+            time.sleep(3600)
+    finally:
+        # При падении шард сразу доступен другим процессам, не дожидаясь истечения аренды
+        leases.release(shard)
+
+
+def run_coordinator(shard_count, workers, shard_dir=SHARD_DIR, argv=None, password=None, restart_delay=10):
+    """
+    Координатор: запускает локальные процессы шардов, перезапускает упавшие
+    и публикует общий сигнал цены.
+
+    :param shard_count: Количество шардов.
+    :param workers: Количество локальных процессов (больше shard_count — резервные).
+    :param shard_dir: Общая папка шардов.
+    :param argv: Аргументы main (сеть и файл настроек).
+    :param password: Пароль от ключей.
+    :param restart_delay: Пауза перед перезапуском упавшего процесса в секундах.
+    """
+    import main
+    from utils.select_chain import select_chain
+    from utils.pricing import get_eth_price
+    from utils.logger import setup_logger
+
+    logger = setup_logger("coordinator")
+    args = main.parse_args(argv)
+    chain = select_chain(args.config, chain_name=args.chain)
+    interval = int(chain["PRICE_CHECK_INTERVAL"])
+    os.makedirs(shard_dir, exist_ok=True)
+    signal = PriceSignal(os.path.join(shard_dir, "price.json"))
+
+    # spawn: процесс шарда не наследует состояние модулей и потоки координатора
+    context = multiprocessing.get_context("spawn")
+    processes = {}
+    restart_at = {}
+
+    def start(i):
+        processes[i] = context.Process(target=run_worker, name=f"shard-worker-{i}",
+                                       args=(shard_count, shard_dir, i % shard_count, argv, password))
+        processes[i].start()
+        logger.info(f"Процесс шарда {i} запущен (pid {processes[i].pid}).")
+
+    for i in range(workers):
+        start(i)
+    try:
+        next_check = 0.0
+        while True:
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + interval
+                try:
+                    price = get_eth_price()
+                    if price is not None:
+                        signal.publish(price)
+                        logger.info(f"Сигнал цены для шардов: ${price}")
+                except Exception as e:
+                    logger.error(f"Ошибка при получении цены ETH: {e}")
+            for i, process in processes.items():
+                if process.is_alive():
+                    continue
+                if i not in restart_at:
+                    restart_at[i] = time.monotonic() + restart_delay
+                    logger.error(f"Процесс шарда {i} завершился с кодом {process.exitcode}, "
+                                 f"перезапуск через {restart_delay} с.")
+                elif time.monotonic() >= restart_at[i]:
+                    del restart_at[i]
+                    start(i)
+            time.sleep(1)
+    finally:
+        for process in processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in processes.values():
+            process.join(10)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Распределение кошельков по процессам и хостам.")
+    parser.add_argument("role", choices=["coordinator", "worker"],
+                        help="coordinator — процессы шардов и сигнал цены, worker — процесс шарда для другого хоста")
+    parser.add_argument("--shards", type=int, required=True, help="Количество шардов")
+    parser.add_argument("--workers", type=int, default=None, help="Количество локальных процессов (по умолчанию --shards)")
+    parser.add_argument("--shard-dir", default=SHARD_DIR, help="Общая папка шардов")
+    parser.add_argument("--chain", default=os.getenv("CHAIN"), required=not os.getenv("CHAIN"),
+                        help="Сеть: base или ethereum (процессы шардов не могут спросить её интерактивно)")
+    parser.add_argument("--config", default=os.getenv("CONFIG_PATH", "config.json"), help="Путь к файлу настроек сети")
+    args = parser.parse_args()
+
+    from utils.orchestrator import ask_password
+    main_argv = ["--config", args.config, "--chain", args.chain]
+    password = ask_password([{"wallets": os.getenv("WALLETS_PATH", "wallets.txt")}])
+    if args.role == "coordinator":
+        run_coordinator(args.shards, args.workers or args.shards, args.shard_dir, main_argv, password)
+    else:
+        run_worker(args.shards, args.shard_dir, argv=main_argv, password=password)
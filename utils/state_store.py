@@ -0,0 +1,281 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from web3 import Web3
+from utils.position_book import position_ticks
+from utils.position_index import TRANSFER_TOPIC
+
+load_dotenv()
+
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "state.db")  # Файл SQLite с состоянием стратегии
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS strategy (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS wallets (
+    address TEXT PRIMARY KEY,
+    token_id INTEGER,
+    tick_lower INTEGER,
+    tick_upper INTEGER,
+    liquidity TEXT,
+    approved INTEGER,
+    state_block INTEGER,
+    last_rebalance_block INTEGER,
+    updated_at REAL
+);
+CREATE TABLE IF NOT EXISTS pending_txs (
+    tx_hash TEXT PRIMARY KEY,
+    address TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    sent_at REAL NOT NULL
+);
+"""
+
+ZERO_TOPIC = "0x" + "00" * 32
+# Событие пула при добавлении ликвидности: тики и ликвидность новой позиции
+POOL_MINT_TOPIC = Web3.keccak(text="Mint(address,address,int24,int24,uint128,uint256,uint256)").to_0x_hex()
+
+
+def _hex(value):
+    value = value if isinstance(value, str) else bytes(value).hex()
+    return (value if value.startswith("0x") else "0x" + value).lower()
+
+
+def minted_token_id(receipt, wallet_address):
+    """
+    Находит ID позиции, созданной транзакцией (Transfer с нулевого адреса на кошелёк).
+
+    :param receipt: Квитанция транзакции.
+    :param wallet_address: Адрес кошелька.
+    :return: ID позиции или None, если транзакция позицию не создавала.
+    """
+    owner = "0x" + "00" * 12 + wallet_address.lower()[2:]
+    for log in receipt.get("logs") or []:
+        topics = [_hex(topic) for topic in log.get("topics") or []]
+        if len(topics) == 4 and topics[0] == TRANSFER_TOPIC and topics[1] == ZERO_TOPIC and topics[2] == owner:
+            return int(topics[3], 16)
+    return None
+
+
+def minted_position(receipt, wallet_address):
+    """
+    Находит позицию, созданную транзакцией: ID из события Transfer, тики и ликвидность из события Mint пула.
+
+    :param receipt: Квитанция транзакции.
+    :param wallet_address: Адрес кошелька.
+    :return: Словарь {"token_id", "tick_lower", "tick_upper", "liquidity"} или None, если транзакция позицию
+             не создавала. Если события Mint в квитанции нет, тики и ликвидность равны None.
+    """
+    token_id = minted_token_id(receipt, wallet_address)
+    if token_id is None:
+        return None
+    position = {"token_id": token_id, "tick_lower": None, "tick_upper": None, "liquidity": None}
+    for log in receipt.get("logs") or []:
+        topics = [_hex(topic) for topic in log.get("topics") or []]
+        if len(topics) == 4 and topics[0] == POOL_MINT_TOPIC:
+            data = bytes.fromhex(_hex(log["data"])[2:])
+            position["tick_lower"] = int.from_bytes(bytes.fromhex(topics[2][2:]), "big", signed=True)
+            position["tick_upper"] = int.from_bytes(bytes.fromhex(topics[3][2:]), "big", signed=True)
+            # Данные события: sender, amount (ликвидность), amount0, amount1
+            position["liquidity"] = int.from_bytes(data[32:64], "big")
+            break
+    return position
+
+
+class StateStore:
+    """
+    Состояние стратегии в SQLite, переживающее перезапуск бота.
+
+    Хранит общие настройки стратегии (ответ о добавлении ликвидности, итоги последнего цикла),
+    а для каждого кошелька — снимок его состояния в сети (ID позиции, тики, ликвидность, approve
+    и блок, на котором снимок прочитан), блок последней подтверждённой транзакции и
+    неподтверждённые транзакции. Каждое изменение выполняется одной транзакцией SQLite,
+    поэтому после падения база остаётся согласованной.
+    """
+
+    def __init__(self, db_path=STATE_DB_PATH):
+        """
+        :param db_path: Путь к файлу SQLite.
+        """
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        # WAL: запись не блокирует чтение и не переписывает всю базу
+        self._db.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(wallets)")]
+        if columns and "state_block" not in columns:
+            # Таблица прежнего формата (диапазоны в ценах): снимки кошельков будут перечитаны из сети
+            self._db.execute("DROP TABLE wallets")
+        self._db.executescript(SCHEMA)
+
+    # -- настройки стратегии --
+
+    def get(self, key, default=None):
+        """
+        Возвращает сохранённое значение настройки стратегии.
+
+        :param key: Имя настройки.
+        :param default: Значение, если настройка не сохранена.
+        :return: Значение настройки.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT value FROM strategy WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        """
+        Сохраняет значение настройки стратегии.
+
+        :param key: Имя настройки.
+        :param value: Значение (сериализуемое в JSON).
+        """
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO strategy (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    # -- кошельки --
+
+    def get_wallets(self):
+        """
+        Возвращает сохранённое состояние всех кошельков.
+
+        :return: Словарь {адрес: {"token_id", "tick_lower", "tick_upper", "liquidity", "approved", "state_block",
+                 "last_rebalance_block", "pending"}}.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT address, token_id, tick_lower, tick_upper, liquidity, approved, "
+                                    "state_block, last_rebalance_block FROM wallets").fetchall()
+            pending = self._db.execute("SELECT address, tx_hash FROM pending_txs ORDER BY sent_at").fetchall()
+        wallets = {}
+        for address, token_id, tick_lower, tick_upper, liquidity, approved, state_block, block in rows:
+            wallets[address] = {"token_id": token_id, "tick_lower": tick_lower, "tick_upper": tick_upper,
+                                "liquidity": None if liquidity is None else int(liquidity), "approved": approved,
+                                "state_block": state_block, "last_rebalance_block": block, "pending": []}
+        empty = dict.fromkeys(["token_id", "tick_lower", "tick_upper", "liquidity", "approved", "state_block",
+                               "last_rebalance_block"])
+        for address, tx_hash in pending:
+            wallets.setdefault(address, dict(empty, pending=[]))["pending"].append(tx_hash)
+        return wallets
+
+    def known_states(self, wallet_addresses):
+        """
+        Возвращает состояние кошельков, которое можно взять из хранилища без чтения из сети.
+
+        Состояние известно, если у кошелька нет неподтверждённых транзакций, approve выполнен,
+        а снимок прочитан не раньше последней подтверждённой транзакции кошелька. Позиции,
+        изменённые вне бота, здесь не видны: перед ребалансировкой кандидаты всё равно
+        перечитываются из сети.
+
+        :param wallet_addresses: Адреса кошельков.
+        :return: Словарь {адрес: состояние} в формате multicall.get_wallets_state только для кошельков
+                 с известным состоянием.
+        """
+        stored = self.get_wallets()
+        states = {}
+        for address in wallet_addresses:
+            saved = stored.get(address.lower())
+            if (saved is None or saved["pending"] or not saved["approved"] or saved["liquidity"] is None
+                    or saved["state_block"] is None
+                    or saved["state_block"] < (saved["last_rebalance_block"] or 0)):
+                continue
+            position = None
+            if saved["token_id"] is not None:
+                position = {"token_id": saved["token_id"], "tick_lower": saved["tick_lower"],
+                            "tick_upper": saved["tick_upper"], "liquidity": saved["liquidity"]}
+            states[address] = {"allowance": True, "token_id": saved["token_id"], "position": position,
+                               "liquidity": saved["liquidity"]}
+        return states
+
+    def add_pending(self, wallet_address, tx_hash, kind):
+        """
+        Записывает отправленную, но ещё не подтверждённую транзакцию.
+
+        :param wallet_address: Адрес кошелька.
+        :param tx_hash: Хэш транзакции.
+        :param kind: Тип транзакции (collect, remove, add, rebalance, approve).
+        """
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO pending_txs (tx_hash, address, kind, sent_at) VALUES (?, ?, ?, ?)",
+                             (tx_hash, wallet_address.lower(), kind, time.time()))
+
+    def get_pending(self):
+        """
+        Возвращает неподтверждённые транзакции.
+
+        :return: Список кортежей (хэш, адрес кошелька, тип).
+        """
+        with self._lock:
+            return self._db.execute("SELECT tx_hash, address, kind FROM pending_txs ORDER BY sent_at").fetchall()
+
+    def confirm_tx(self, tx_hash, receipt=None):
+        """
+        Завершает неподтверждённую транзакцию. Для включённой в блок транзакции кошелька
+        обновляется блок последней транзакции, после чего снимок кошелька считается устаревшим.
+        Если транзакция создала позицию, снимок сразу заменяется позицией из квитанции.
+
+        :param tx_hash: Хэш транзакции.
+        :param receipt: Квитанция транзакции или None, если транзакция потеряна или отменена.
+        """
+        with self._lock, self._db:
+            row = self._db.execute("SELECT address, kind FROM pending_txs WHERE tx_hash = ?", (tx_hash,)).fetchone()
+            self._db.execute("DELETE FROM pending_txs WHERE tx_hash = ?", (tx_hash,))
+            if row is None or receipt is None or receipt.get("status") != 1:
+                return
+            address, kind = row
+            block = receipt["blockNumber"]
+            self._db.execute("INSERT OR IGNORE INTO wallets (address, updated_at) VALUES (?, ?)",
+                             (address, time.time()))
+            if kind == "approve":
+                # Approve не меняет позицию: снимок остаётся актуальным
+                self._db.execute("UPDATE wallets SET approved = 1, updated_at = ? WHERE address = ?",
+                                 (time.time(), address))
+                return
+            self._db.execute("UPDATE wallets SET last_rebalance_block = MAX(COALESCE(last_rebalance_block, 0), ?), "
+                             "updated_at = ? WHERE address = ?", (block, time.time(), address))
+            position = minted_position(receipt, address)
+            if position is None:
+                return
+            if position["liquidity"] is None:
+                # Тики неизвестны: снимок устарел, кошелёк будет перечитан из сети
+                self._db.execute("UPDATE wallets SET token_id = ? WHERE address = ?", (position["token_id"], address))
+                return
+            self._db.execute(
+                "UPDATE wallets SET token_id = ?, tick_lower = ?, tick_upper = ?, liquidity = ?, "
+                "state_block = MAX(COALESCE(state_block, 0), ?) WHERE address = ?",
+                (position["token_id"], position["tick_lower"], position["tick_upper"], str(position["liquidity"]),
+                 block, address))
+
+    def reconcile(self, states, block):
+        """
+        Сохраняет состояние кошельков, прочитанное из сети, как их новые снимки.
+
+        :param states: Состояние кошельков из get_wallets_state или PositionIndex.get_wallets_state
+                       (кошельки с непрочитанной позицией передавать нельзя).
+        :param block: Блок, не позже которого прочитано состояние.
+        :return: Список адресов, сохранённый ID позиции которых разошёлся с сетью.
+        """
+        stored = self.get_wallets()
+        changed = []
+        with self._lock, self._db:
+            for address, state in states.items():
+                saved = stored.get(address.lower())
+                if saved is None or saved["token_id"] != state["token_id"]:
+                    changed.append(address)
+                tick_lower, tick_upper, _ = position_ticks(state) if state["token_id"] is not None else (None, None, 0)
+                allowance = state["allowance"]
+                self._db.execute(
+                    "INSERT INTO wallets (address, token_id, tick_lower, tick_upper, liquidity, approved, state_block, "
+                    "updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (address) DO UPDATE SET "
+                    "token_id = excluded.token_id, tick_lower = excluded.tick_lower, tick_upper = excluded.tick_upper, "
+                    "liquidity = excluded.liquidity, approved = COALESCE(excluded.approved, approved), "
+                    "state_block = excluded.state_block, updated_at = excluded.updated_at",
+                    (address.lower(), state["token_id"], tick_lower, tick_upper, str(state["liquidity"]),
+                     None if allowance is None else int(bool(allowance)), block, time.time()))
+        return changed
+
+    def close(self):
+        with self._lock:
+            self._db.close()
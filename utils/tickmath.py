@@ -0,0 +1,315 @@
+from fractions import Fraction
+from math import isqrt
+import numpy as np
+
+# Константы TickMath.sol (Uniswap V3)
+MIN_TICK = -887272
+MAX_TICK = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+Q96 = 2 ** 96
+Q192 = 2 ** 192
+MAX_UINT256 = 2 ** 256 - 1
+
+# Шаг тиков для каждого уровня комиссии пула
+TICK_SPACINGS = {100: 1, 500: 10, 3000: 60, 10000: 200}
+
+_TICK_MULTIPLIERS = (
+    (0x2, 0xfff97272373d413259a46990580e213a),
+    (0x4, 0xfff2e50f5f656932ef12357cf3c7fdcc),
+    (0x8, 0xffe5caca7e10e4e61c3624eaa0941cd0),
+    (0x10, 0xffcb9843d60f6159c9db58835c926644),
+    (0x20, 0xff973b41fa98c081472e6896dfb254c0),
+    (0x40, 0xff2ea16466c96a3843ec78b326b52861),
+    (0x80, 0xfe5dee046a99a2a811c461f1969c3053),
+    (0x100, 0xfcbe86c7900a88aedcffc83b479aa3a4),
+    (0x200, 0xf987a7253ac413176f2b074cf7815e54),
+    (0x400, 0xf3392b0822b70005940c7a398e4b70f3),
+    (0x800, 0xe7159475a2c29b7443b29c7fa6e889d9),
+    (0x1000, 0xd097f3bdfd2022b8845ad8f792aa5825),
+    (0x2000, 0xa9f746462d870fdf8a65dc1f90e061e5),
+    (0x4000, 0x70d869a156d2a1b890bb3df62baf32f7),
+    (0x8000, 0x31be135f97d08fd981231505542fcfa6),
+    (0x10000, 0x9aa508b5b7a84e1c677de54f3e99bc9),
+    (0x20000, 0x5d6af8dedb81196699c329225ee604),
+    (0x40000, 0x2216e584f5fa1ea926041bedfe98),
+    (0x80000, 0x48a170391f7dc42444e8fa2),
+)
+
+
+def get_sqrt_ratio_at_tick(tick):
+    """
+    Точный аналог TickMath.getSqrtRatioAtTick: sqrt(1.0001^tick) в формате Q64.96.
+
+    :param tick: Тик.
+    :return: sqrtPriceX96 (int).
+    """
+    if tick < MIN_TICK or tick > MAX_TICK:
+        raise ValueError(f"Тик {tick} вне допустимого диапазона")
+    abs_tick = abs(tick)
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 0x1 else 0x100000000000000000000000000000000
+    for mask, multiplier in _TICK_MULTIPLIERS:
+        if abs_tick & mask:
+            ratio = (ratio * multiplier) >> 128
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+    # Q128.128 -> Q64.96 с округлением вверх
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96):
+    """
+    Точный аналог TickMath.getTickAtSqrtRatio: наибольший тик, для которого
+    get_sqrt_ratio_at_tick(tick) <= sqrt_price_x96.
+
+    :param sqrt_price_x96: sqrtPriceX96 (int).
+    :return: Тик.
+    """
+    if sqrt_price_x96 < MIN_SQRT_RATIO or sqrt_price_x96 >= MAX_SQRT_RATIO:
+        raise ValueError(f"sqrtPriceX96 {sqrt_price_x96} вне допустимого диапазона")
+    # Бинарный поиск по монотонной функции даёт тот же результат, что и log2-аппроксимация контракта
+    low, high = MIN_TICK, MAX_TICK
+    while low < high:
+        mid = (low + high + 1) // 2
+        if get_sqrt_ratio_at_tick(mid) <= sqrt_price_x96:
+            low = mid
+        else:
+            high = mid - 1
+    return low
+
+
+def price_to_sqrt_price_x96(price, decimals0, decimals1):
+    """
+    Преобразует цену token0 в единицах token1 (например, USDC за ETH) в sqrtPriceX96.
+
+    :param price: Цена (float, int, str или Fraction).
+    :param decimals0: Количество знаков token0.
+    :param decimals1: Количество знаков token1.
+    :return: sqrtPriceX96 (int).
+    """
+    ratio = Fraction(price) * 10 ** decimals1 / 10 ** decimals0
+    return isqrt(ratio.numerator * Q192 // ratio.denominator)
+
+
+def sqrt_price_x96_to_price(sqrt_price_x96, decimals0, decimals1):
+    """
+    Преобразует sqrtPriceX96 в цену token0 в единицах token1.
+
+    :param sqrt_price_x96: sqrtPriceX96 (int).
+    :param decimals0: Количество знаков token0.
+    :param decimals1: Количество знаков token1.
+    :return: Цена (float).
+    """
+    return float(Fraction(sqrt_price_x96 * sqrt_price_x96, Q192) * 10 ** decimals0 / 10 ** decimals1)
+
+
+def price_to_tick(price, decimals0, decimals1):
+    """
+    Возвращает тик для цены с округлением вниз, как это делает контракт.
+
+    :param price: Цена token0 в единицах token1.
+    :param decimals0: Количество знаков token0.
+    :param decimals1: Количество знаков token1.
+    :return: Тик.
+    """
+    return get_tick_at_sqrt_ratio(price_to_sqrt_price_x96(price, decimals0, decimals1))
+
+
+def tick_to_price(tick, decimals0, decimals1):
+    """
+    Возвращает цену token0 в единицах token1 для тика.
+
+    :param tick: Тик.
+    :param decimals0: Количество знаков token0.
+    :param decimals1: Количество знаков token1.
+    :return: Цена (float).
+    """
+    return sqrt_price_x96_to_price(get_sqrt_ratio_at_tick(tick), decimals0, decimals1)
+
+
+def get_tick_spacing(fee):
+    """
+    Возвращает шаг тиков для уровня комиссии пула.
+
+    :param fee: Комиссия пула в сотых долях базисного пункта (500, 3000, 10000...).
+    :return: Шаг тиков.
+    """
+    if fee not in TICK_SPACINGS:
+        raise ValueError(f"Неизвестный уровень комиссии: {fee}")
+    return TICK_SPACINGS[fee]
+
+
+def _mul_div(a, b, denominator):
+    return a * b // denominator
+
+
+def _mul_div_rounding_up(a, b, denominator):
+    return -(-a * b // denominator)
+
+
+def get_liquidity_for_amount0(sqrt_a, sqrt_b, amount0):
+    """Аналог LiquidityAmounts.getLiquidityForAmount0."""
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    intermediate = _mul_div(sqrt_a, sqrt_b, Q96)
+    return _mul_div(amount0, intermediate, sqrt_b - sqrt_a)
+
+
+def get_liquidity_for_amount1(sqrt_a, sqrt_b, amount1):
+    """Аналог LiquidityAmounts.getLiquidityForAmount1."""
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    return _mul_div(amount1, Q96, sqrt_b - sqrt_a)
+
+
+def get_liquidity_for_amounts(sqrt_p, sqrt_a, sqrt_b, amount0, amount1):
+    """
+    Аналог LiquidityAmounts.getLiquidityForAmounts: максимальная ликвидность для заданных количеств токенов.
+
+    :param sqrt_p: Текущая sqrtPriceX96.
+    :param sqrt_a: sqrtPriceX96 нижней границы.
+    :param sqrt_b: sqrtPriceX96 верхней границы.
+    :param amount0: Количество token0 (в минимальных единицах).
+    :param amount1: Количество token1 (в минимальных единицах).
+    :return: Ликвидность (int).
+    """
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    if sqrt_p <= sqrt_a:
+        return get_liquidity_for_amount0(sqrt_a, sqrt_b, amount0)
+    if sqrt_p < sqrt_b:
+        return min(get_liquidity_for_amount0(sqrt_p, sqrt_b, amount0),
+                   get_liquidity_for_amount1(sqrt_a, sqrt_p, amount1))
+    return get_liquidity_for_amount1(sqrt_a, sqrt_b, amount1)
+
+
+def get_amount0_for_liquidity(sqrt_a, sqrt_b, liquidity):
+    """Аналог LiquidityAmounts.getAmount0ForLiquidity."""
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    return _mul_div(liquidity << 96, sqrt_b - sqrt_a, sqrt_b) // sqrt_a
+
+
+def get_amount1_for_liquidity(sqrt_a, sqrt_b, liquidity):
+    """Аналог LiquidityAmounts.getAmount1ForLiquidity."""
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    return _mul_div(liquidity, sqrt_b - sqrt_a, Q96)
+
+
+def get_amounts_for_liquidity(sqrt_p, sqrt_a, sqrt_b, liquidity):
+    """
+    Аналог LiquidityAmounts.getAmountsForLiquidity: количества токенов в позиции при текущей цене.
+
+    :param sqrt_p: Текущая sqrtPriceX96.
+    :param sqrt_a: sqrtPriceX96 нижней границы.
+    :param sqrt_b: sqrtPriceX96 верхней границы.
+    :param liquidity: Ликвидность позиции.
+    :return: Кортеж (amount0, amount1) в минимальных единицах.
+    """
+    if sqrt_a > sqrt_b:
+        sqrt_a, sqrt_b = sqrt_b, sqrt_a
+    if sqrt_p <= sqrt_a:
+        return get_amount0_for_liquidity(sqrt_a, sqrt_b, liquidity), 0
+    if sqrt_p < sqrt_b:
+        return (get_amount0_for_liquidity(sqrt_p, sqrt_b, liquidity),
+                get_amount1_for_liquidity(sqrt_a, sqrt_p, liquidity))
+    return 0, get_amount1_for_liquidity(sqrt_a, sqrt_b, liquidity)
+
+
+# Векторные версии на NumPy (float64) для планирования и симуляции по массивам диапазонов.
+# Точность — float64, для построения транзакций используйте целочисленные функции выше.
+
+_LOG_TICK_BASE = np.log(1.0001)
+
+
+def prices_to_ticks(prices, decimals0, decimals1):
+    """
+    Преобразует массив цен в массив тиков (округление вниз).
+
+    :param prices: Массив цен token0 в единицах token1.
+    :param decimals0: Количество знаков token0.
+    :param decimals1: Количество знаков token1.
+    :return: Массив тиков (int64).
+    """
+    raw = np.asarray(prices, dtype=np.float64) * 10.0 ** (decimals1 - decimals0)
+    ticks = np.floor(np.log(raw) / _LOG_TICK_BASE + 1e-9).astype(np.int64)
+    return np.clip(ticks, MIN_TICK, MAX_TICK)
+
+
+def ticks_to_prices(ticks, decimals0, decimals1):
+    """
+    Преобразует массив тиков в массив цен.
+
+    :param ticks: Массив тиков.
+    :param decimals0: Количество знаков token0.
+    :param decimals1: Количество знаков token1.
+    :return: Массив цен (float64).
+    """
+    return np.exp(np.asarray(ticks, dtype=np.float64) * _LOG_TICK_BASE) * 10.0 ** (decimals0 - decimals1)
+
+
+def ticks_to_sqrt_prices(ticks):
+    """
+    Возвращает массив sqrt(1.0001^tick) (без масштабирования Q96).
+
+    :param ticks: Массив тиков.
+    :return: Массив sqrt-цен (float64).
+    """
+    return np.exp(np.asarray(ticks, dtype=np.float64) * (_LOG_TICK_BASE / 2))
+
+
+def round_ticks(tick_lower, tick_upper, fee=3000):
+    """
+    Округляет массивы границ к шагу тиков пула: нижнюю вниз, верхнюю вверх.
+
+    :param tick_lower: Массив нижних тиков.
+    :param tick_upper: Массив верхних тиков.
+    :param fee: Комиссия пула.
+    :return: Кортеж массивов (tick_lower, tick_upper).
+    """
+    spacing = get_tick_spacing(fee)
+    tick_lower = np.floor_divide(np.asarray(tick_lower), spacing) * spacing
+    tick_upper = -np.floor_divide(-np.asarray(tick_upper), spacing) * spacing
+    return tick_lower, tick_upper
+
+
+def liquidity_for_amounts(sqrt_p, sqrt_a, sqrt_b, amount0, amount1):
+    """
+    Векторная версия get_liquidity_for_amounts для sqrt-цен без масштабирования Q96.
+
+    :param sqrt_p: Массив (или скаляр) текущих sqrt-цен.
+    :param sqrt_a: Массив sqrt-цен нижних границ.
+    :param sqrt_b: Массив sqrt-цен верхних границ.
+    :param amount0: Массив количеств token0 (в минимальных единицах).
+    :param amount1: Массив количеств token1 (в минимальных единицах).
+    :return: Массив ликвидностей (float64).
+    """
+    sqrt_p, sqrt_a, sqrt_b, amount0, amount1 = np.broadcast_arrays(
+        *(np.asarray(x, dtype=np.float64) for x in (sqrt_p, sqrt_a, sqrt_b, amount0, amount1)))
+    sqrt_a, sqrt_b = np.minimum(sqrt_a, sqrt_b), np.maximum(sqrt_a, sqrt_b)
+    inner = np.clip(sqrt_p, sqrt_a, sqrt_b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        liquidity0 = amount0 * inner * sqrt_b / (sqrt_b - inner)
+        liquidity1 = amount1 / (inner - sqrt_a)
+    return np.where(sqrt_p <= sqrt_a, liquidity0,
+                    np.where(sqrt_p >= sqrt_b, liquidity1, np.minimum(liquidity0, liquidity1)))
+
+
+def amounts_for_liquidity(sqrt_p, sqrt_a, sqrt_b, liquidity):
+    """
+    Векторная версия get_amounts_for_liquidity для sqrt-цен без масштабирования Q96.
+
+    :param sqrt_p: Массив (или скаляр) текущих sqrt-цен.
+    :param sqrt_a: Массив sqrt-цен нижних границ.
+    :param sqrt_b: Массив sqrt-цен верхних границ.
+    :param liquidity: Массив ликвидностей.
+    :return: Кортеж массивов (amount0, amount1) в минимальных единицах.
+    """
+    sqrt_p, sqrt_a, sqrt_b, liquidity = np.broadcast_arrays(
+        *(np.asarray(x, dtype=np.float64) for x in (sqrt_p, sqrt_a, sqrt_b, liquidity)))
+    sqrt_a, sqrt_b = np.minimum(sqrt_a, sqrt_b), np.maximum(sqrt_a, sqrt_b)
+    inner = np.clip(sqrt_p, sqrt_a, sqrt_b)
+    amount0 = liquidity * (sqrt_b - inner) / (inner * sqrt_b)
+    amount1 = liquidity * (inner - sqrt_a)
+    return amount0, amount1
@@ -1,46 +1,50 @@
-import math
-TICK_SPACING = 60
+from utils import tickmath
+FEE = 3000
 
 
-def price_to_tick(price):
+def price_to_tick(price, decimals0, decimals1):
     """
-    Преобразует цену в тик.
+    Преобразует цену в тик (точная целочисленная арифметика TickMath).
 
     :param price: Цена
+    :param decimals0: Количество знаков token0
+    :param decimals1: Количество знаков token1
     :return: Тик
     """
+    return tickmath.price_to_tick(price, decimals0, decimals1)
 
-    price = price * 10 **(-12)
-    tick = math.floor(math.log(price, 1.0001))
-    return tick
 
-
-def tick_to_price(tick):
+def tick_to_price(tick, decimals0, decimals1):
     """
     Преобразует тик в цену.
 
     :param tick: Тик
+    :param decimals0: Количество знаков token0
+    :param decimals1: Количество знаков token1
     :return: Цена
     """
-    price = 1.0001 ** tick
-    return price * 10 **12
+    return tickmath.tick_to_price(tick, decimals0, decimals1)
 
 
-def get_ticks_for_range(lower_price, upper_price):
+def get_ticks_for_range(lower_price, upper_price, fee, decimals0, decimals1):
     """
     Возвращает тики для заданного диапазона цен, округленные с учетом шага тиков и масштабирования.
 
     :param lower_price: Нижняя цена диапазона.
     :param upper_price: Верхняя цена диапазона.
+    :param fee: Комиссия пула, определяющая шаг тиков.
+    :param decimals0: Количество знаков token0.
+    :param decimals1: Количество знаков token1.
     :return: tuple из (tick_lower, tick_upper)
     """
+    tick_spacing = tickmath.get_tick_spacing(fee)
     # Преобразуем цену в тики с учетом масштабирования
-    tick_lower = price_to_tick(lower_price)
-    tick_upper = price_to_tick(upper_price)
+    tick_lower = price_to_tick(lower_price, decimals0, decimals1)
+    tick_upper = price_to_tick(upper_price, decimals0, decimals1)
 
-    # Округляем тики до ближайших кратных TICK_SPACING
-    tick_lower = (tick_lower // TICK_SPACING) * TICK_SPACING
-    tick_upper = ((tick_upper + (TICK_SPACING - 1)) // TICK_SPACING) * TICK_SPACING
+    # Округляем тики до ближайших кратных шагу тиков
+    tick_lower = (tick_lower // tick_spacing) * tick_spacing
+    tick_upper = ((tick_upper + (tick_spacing - 1)) // tick_spacing) * tick_spacing
 
     return tick_lower, tick_upper
 
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from Crypto.Cipher import AES
+from dotenv import load_dotenv
+from eth_account import Account
+from utils.decryption import decrypt_with_key
+
+load_dotenv()
+
+WALLET_CACHE_PATH = os.getenv("WALLET_CACHE_PATH", ".wallets_cache")  # Кэш адресов кошельков ("" — выключен)
+WALLET_LOAD_WORKERS = int(os.getenv("WALLET_LOAD_WORKERS", 0))  # Процессы для вычисления адресов (0 — по числу ядер)
+WALLET_PARALLEL_THRESHOLD = int(os.getenv("WALLET_PARALLEL_THRESHOLD", 256))  # Меньше ключей — без пула процессов
+
+
+def read_key_lines(file_path="wallets.txt"):
+    """
+    Считывает непустые строки файла с ключами.
+
+    :param file_path: Путь к файлу с ключами.
+    :return: Список строк.
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Файл '{file_path}' не найден.")
+    with open(file_path, "r") as file:
+        lines = [line.strip() for line in file if line.strip()]
+    if not lines:
+        raise ValueError(f"Файл '{file_path}' пуст. Добавьте кошельки в файл.")
+    return lines
+
+
+def line_digest(line):
+    """Идентификатор строки файла в кэше: сам ключ в кэш не попадает."""
+    return hashlib.sha256(line.encode()).hexdigest()
+
+
+def _derive_chunk(private_keys):
+    results = []
+    for private_key in private_keys:
+        try:
+            results.append(Account.from_key(private_key).address)
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def derive_addresses(private_keys, workers=WALLET_LOAD_WORKERS):
+    """
+    Вычисляет адреса по приватным ключам, при большом количестве — в пуле процессов.
+
+    :param private_keys: Список приватных ключей.
+    :param workers: Количество процессов (0 — по числу ядер).
+    :return: Список адресов (или исключений для некорректных ключей) в том же порядке.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(private_keys) < WALLET_PARALLEL_THRESHOLD:
+        return _derive_chunk(private_keys)
+    chunk_size = -(-len(private_keys) // (workers * 4))
+    chunks = [private_keys[i:i + chunk_size] for i in range(0, len(private_keys), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return [address for chunk in executor.map(_derive_chunk, chunks) for address in chunk]
+
+
+def load_address_cache(cache_path, key=None):
+    """
+    Загружает кэш адресов. Если задан ключ шифрования, кэш хранится зашифрованным (AES-GCM).
+
+    :param cache_path: Путь к файлу кэша.
+    :param key: Ключ из derive_key или None для незашифрованных кошельков.
+    :return: Словарь {хэш строки: адрес}; пустой, если кэша нет или он не подходит.
+    """
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "rb") as cache_file:
+            data = cache_file.read()
+        if key is not None:
+            nonce, tag, ciphertext = data[:16], data[16:32], data[32:]
+            data = AES.new(key, AES.MODE_GCM, nonce=nonce).decrypt_and_verify(ciphertext, tag)
+        return json.loads(data)
+    except (ValueError, OSError):
+        # Кэш от другого пароля или повреждён — адреса будут вычислены заново
+        return {}
+
+
+def save_address_cache(cache_path, cache, key=None):
+    """
+    Атомарно сохраняет кэш адресов.
+
+    :param cache_path: Путь к файлу кэша.
+    :param cache: Словарь {хэш строки: адрес}.
+    :param key: Ключ из derive_key или None для незашифрованных кошельков.
+    """
+    if not cache_path:
+        return
+    data = json.dumps(cache).encode()
+    if key is not None:
+        cipher = AES.new(key, AES.MODE_GCM)
+        ciphertext, tag = cipher.encrypt_and_digest(data)
+        data = cipher.nonce + tag + ciphertext
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, "wb") as cache_file:
+        cache_file.write(data)
+    os.replace(tmp_path, cache_path)
+
+
+def load_wallets(lines, key=None, cache_path=WALLET_CACHE_PATH, workers=WALLET_LOAD_WORKERS):
+    """
+    Расшифровывает ключи и получает адреса кошельков.
+
+    Ключи расшифровываются уже вычисленным ключом шифрования; адреса берутся из кэша,
+    а отсутствующие в нём вычисляются параллельно и дописываются в кэш.
+
+    :param lines: Строки файла с ключами.
+    :param key: Ключ из derive_key, если ключи зашифрованы, иначе None.
+    :param cache_path: Путь к кэшу адресов ("" или None — без кэша).
+    :param workers: Количество процессов для вычисления адресов.
+    :return: Список пар (адрес, приватный ключ).
+    """
+    private_keys = {}
+    for line_num, line in enumerate(lines, start=1):
+        try:
+            private_keys[line_num] = decrypt_with_key(line, key) if key is not None else line
+        except Exception as e:
+            print(f"Ошибка обработки строки {line_num} ('{line}'): {e}")
+
+    digests = [line_digest(line) for line in lines]
+    cache = load_address_cache(cache_path, key)
+    missing = [line_num for line_num in private_keys if digests[line_num - 1] not in cache]
+    if missing:
+        addresses = derive_addresses([private_keys[line_num] for line_num in missing], workers)
+        for line_num, address in zip(missing, addresses):
+            if isinstance(address, Exception):
+                print(f"Ошибка обработки строки {line_num} ('{lines[line_num - 1]}'): {address}")
+                del private_keys[line_num]
+            else:
+                cache[digests[line_num - 1]] = address
+        try:
+            # В кэше остаются только кошельки из текущего файла
+            save_address_cache(cache_path, {digest: cache[digest] for digest in digests if digest in cache}, key)
+        except OSError as e:
+            print(f"Не удалось сохранить кэш адресов: {e}")
+
+    return [(cache[digests[line_num - 1]], private_key) for line_num, private_key in private_keys.items()]